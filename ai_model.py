@@ -3,36 +3,82 @@
 # Greetings from Seattle! 
 
 from abc import ABC, abstractmethod
-from openai import OpenAI
-from groq import Groq
-from ollama import Client
-from openai import AzureOpenAI 
-from anthropic import Anthropic
+import asyncio
+import json
 import os
+import threading
+
+# Provider SDKs are imported lazily in the constructors so only the selected one is loaded
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Provider used when config.yaml leaves "api" empty
+DEFAULT_API = "openrouter"
+
+# Config fields holding the API key of each provider; the others read it from the environment
+API_KEY_FIELDS = {
+    "openai": "openai_api_key",
+    "azure": "azure_openai_api_key",
+    "anthropic": "anthropic_api_key",
+}
 
 class AIModel(ABC):
     @abstractmethod
-    def chat(self, model, messages):
+    def chat(self, messages, model, temperature, max_tokens):
         pass
 
     @abstractmethod
     def moderate(self, message):
         pass
 
+    async def achat(self, messages, model, temperature, max_tokens):
+        return await asyncio.to_thread(self.chat, messages, model, temperature, max_tokens)
+
+    def stream_chat(self, messages, model, temperature, max_tokens):
+        # Providers without streaming support return the whole answer as a single chunk.
+        # Streams yield text deltas and return the finish reason ("stop", "length" or None if unknown)
+        yield self.chat(messages, model, temperature, max_tokens)
+        return None
+
+    def chat_candidates(self, messages, model, temperature, max_tokens, n):
+        # Providers without the "n" parameter get n concurrent requests instead
+        from concurrent.futures import ThreadPoolExecutor
+        if n <= 1:
+            return [self.chat(messages, model, temperature, max_tokens)]
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            futures = [pool.submit(self.chat, messages, model, temperature, max_tokens) for _ in range(n)]
+            return [future.result() for future in futures]
+
     @staticmethod
     def get_model_client(config):
-        api_provider=config["api"]
+        # OpenRouter goes through http_client's pooled session; its thin client carries per-call
+        # settings (retries, timeouts, pool size), so it is created for every call
+        api = config.get("api") or DEFAULT_API
+        if api == "openrouter":
+            return OpenRouterModel(config)
+        # SDK clients hold their own connections: one per process, provider, endpoint, key and model
+        endpoint = config.get("api_base") or config.get("azure_endpoint")
+        key = (os.getpid(), api, endpoint, config.get(API_KEY_FIELDS.get(api, "")), config.get("model"))
+        with _clients_lock:
+            if key not in _clients:
+                _clients[key] = AIModel.create_model_client(config)
+            return _clients[key]
 
-        if api_provider == "" or api_provider==None:
-            api_provider = "groq"
+    @staticmethod
+    def create_model_client(config):
+        api_provider = config.get("api") or DEFAULT_API
         
+        if api_provider == "openrouter":
+            return OpenRouterModel(config)
+
         if api_provider == "groq":
             return GroqModel(api_key=os.environ.get("GROQ_API_KEY"))
         
         elif api_provider == "openai":
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:  
-                api_key=config["openai_api_key"]       
+                api_key=config.get("openai_api_key")
             if not api_key:  #If statement to avoid "invalid filepath" error
                 home_path = os.path.expanduser("~")   
                 api_key=open(os.path.join(home_path,".openai.apikey"), "r").readline().strip()
@@ -43,7 +89,7 @@ class AIModel(ABC):
         elif api_provider == "azure":
             api_key = os.getenv("AZURE_OPENAI_API_KEY")
             if not api_key:  
-                api_key=config["azure_openai_api_key"]
+                api_key=config.get("azure_openai_api_key")
             if not api_key: 
                 home_path = os.path.expanduser("~")   
                 api_key=open(os.path.join(home_path,".azureopenai.apikey"), "r").readline().strip()
@@ -61,13 +107,96 @@ class AIModel(ABC):
         if api_provider == "anthropic":
             api_key = os.getenv("ANTHROPIC_API_KEY")
             if not api_key: 
-                api_key=config["anthropic_api_key"]
+                api_key=config.get("anthropic_api_key")
             return AnthropicModel(api_key=api_key) 
         else:
             raise ValueError(f"Invalid AI model provider: {api_provider}")
 
+def iter_openai_stream(stream):
+    finish_reason = None
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if chunk.choices and chunk.choices[0].finish_reason:
+            finish_reason = chunk.choices[0].finish_reason
+    return finish_reason
+
+class OpenRouterModel(AIModel):
+    def __init__(self, config):
+        self.config = config
+
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.config.get('openrouter_api_key')}",
+            "X-Title": self.config.get("your_app_name", "IOP CLI"),
+        }
+
+    def request_data(self, messages, model, temperature, max_tokens):
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+
+    def chat(self, messages, model, temperature, max_tokens):
+        import http_client
+        response = http_client.post(self.config, "/chat/completions", headers=self.headers(),
+                                    json=self.request_data(messages, model, temperature, max_tokens))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def chat_candidates(self, messages, model, temperature, max_tokens, n):
+        import http_client
+        data = self.request_data(messages, model, temperature, max_tokens)
+        data["n"] = n
+        response = http_client.post(self.config, "/chat/completions", headers=self.headers(), json=data)
+        response.raise_for_status()
+        candidates = [choice["message"]["content"] for choice in response.json()["choices"]]
+        # Not every model routed by OpenRouter honours "n"; top up with concurrent requests
+        if len(candidates) < n:
+            candidates += AIModel.chat_candidates(self, messages, model, temperature, max_tokens, n - len(candidates))
+        return candidates
+
+    def stream_chat(self, messages, model, temperature, max_tokens):
+        import http_client
+        data = self.request_data(messages, model, temperature, max_tokens)
+        data["stream"] = True
+        response = http_client.post(self.config, "/chat/completions", headers=self.headers(), json=data, stream=True)
+        try:
+            response.raise_for_status()
+            return (yield from iter_sse_content(response))
+        finally:
+            response.close()
+
+    def moderate(self, message):
+        pass
+
+def iter_sse_content(response):
+    import requests
+    # OpenRouter Server-Sent Events: "data: {...}" lines until "data: [DONE]"; returns the finish reason
+    finish_reason = None
+    for raw_line in response.iter_lines():
+        line = raw_line.decode("utf-8") if isinstance(raw_line, bytes) else raw_line
+        if not line.startswith("data:"):
+            continue  # blank lines and comments such as ": OPENROUTER PROCESSING"
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return finish_reason
+        chunk = json.loads(payload)
+        if "error" in chunk:
+            raise requests.exceptions.RequestException(chunk["error"].get("message", chunk["error"]))
+        choices = chunk.get("choices") or []
+        if choices:
+            finish_reason = choices[0].get("finish_reason") or finish_reason
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+    return finish_reason
+
 class GroqModel(AIModel):
     def __init__(self, api_key):
+        from groq import Groq
         self.client = Groq(api_key=api_key)
 
     def chat(self, messages, model, temperature, max_tokens):
@@ -76,12 +205,20 @@ class GroqModel(AIModel):
                                                    temperature=temperature, 
                                                    max_tokens=max_tokens)
         return resp.choices[0].message.content
+
+    def stream_chat(self, messages, model, temperature, max_tokens):
+        return (yield from iter_openai_stream(self.client.chat.completions.create(model=model,
+                                                                                  messages=messages,
+                                                                                  temperature=temperature,
+                                                                                  max_tokens=max_tokens,
+                                                                                  stream=True)))
     
     def moderate(self, message):
         pass
 
 class OpenAIModel(AIModel):
     def __init__(self, api_key):
+        from openai import OpenAI
         self.client = OpenAI(api_key=api_key)
 
     def chat(self, messages, model, temperature, max_tokens):
@@ -91,18 +228,49 @@ class OpenAIModel(AIModel):
                                                    max_tokens=max_tokens)
         
         return resp.choices[0].message.content
+
+    def chat_candidates(self, messages, model, temperature, max_tokens, n):
+        resp = self.client.chat.completions.create(model=model,
+                                                   messages=messages,
+                                                   temperature=temperature,
+                                                   max_tokens=max_tokens,
+                                                   n=n)
+        return [choice.message.content for choice in resp.choices]
+
+    def stream_chat(self, messages, model, temperature, max_tokens):
+        return (yield from iter_openai_stream(self.client.chat.completions.create(model=model,
+                                                                                  messages=messages,
+                                                                                  temperature=temperature,
+                                                                                  max_tokens=max_tokens,
+                                                                                  stream=True)))
     
     def moderate(self, message):
         return self.client.moderations.create(input=message)
 
 class OllamaModel(AIModel):
     def __init__(self, host):
+        from ollama import Client
+        self.host = host
         self.client = Client(host=host)
     
     def chat(self, messages, model, temperature, max_tokens):
         resp = self.client.chat(model=model, 
                                 messages=messages)
         return resp["message"]["content"]
+
+    async def achat(self, messages, model, temperature, max_tokens):
+        from ollama import AsyncClient
+        resp = await AsyncClient(host=self.host).chat(model=model, messages=messages)
+        return resp["message"]["content"]
+
+    def stream_chat(self, messages, model, temperature, max_tokens):
+        finish_reason = None
+        for part in self.client.chat(model=model, messages=messages, stream=True):
+            if part["message"]["content"]:
+                yield part["message"]["content"]
+            if part.get("done"):
+                finish_reason = part.get("done_reason")
+        return finish_reason
     
     def moderate(self, message):
         pass
@@ -110,6 +278,7 @@ class OllamaModel(AIModel):
 
 class AzureOpenAIModel(AIModel):
     def __init__(self, azure_endpoint, api_key, api_version):
+        from openai import AzureOpenAI
         self.client = AzureOpenAI(azure_endpoint=azure_endpoint, api_key=api_key, api_version=api_version)
 
     def chat(self, messages, model, temperature, max_tokens):
@@ -120,12 +289,28 @@ class AzureOpenAIModel(AIModel):
                         max_tokens=max_tokens)
         
         return resp.choices[0].message.content
+
+    def chat_candidates(self, messages, model, temperature, max_tokens, n):
+        resp = self.client.chat.completions.create(model=model,
+                                                   messages=messages,
+                                                   temperature=temperature,
+                                                   max_tokens=max_tokens,
+                                                   n=n)
+        return [choice.message.content for choice in resp.choices]
+
+    def stream_chat(self, messages, model, temperature, max_tokens):
+        return (yield from iter_openai_stream(self.client.chat.completions.create(model=model,
+                                                                                  messages=messages,
+                                                                                  temperature=temperature,
+                                                                                  max_tokens=max_tokens,
+                                                                                  stream=True)))
     
     def moderate(self, message):
         return self.client.moderations.create(input=message)
 
 class AnthropicModel(AIModel):
     def __init__(self, api_key):
+        from anthropic import Anthropic
         self.client = Anthropic(api_key=api_key)
 
     def chat(self, messages, model, temperature, max_tokens):
@@ -144,6 +329,18 @@ class AnthropicModel(AIModel):
                                     max_tokens=max_tokens)
         
         return resp.content[0].text
+
+    def stream_chat(self, messages, model, temperature, max_tokens):
+        system_prompt = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        user_messages = [m for m in messages if m.get("role") != "system"]
+        with self.client.messages.stream(model=model,
+                                         system=system_prompt,
+                                         messages=user_messages,
+                                         temperature=temperature,
+                                         max_tokens=max_tokens) as stream:
+            yield from stream.text_stream
+            stop_reason = stream.get_final_message().stop_reason
+        return "length" if stop_reason == "max_tokens" else stop_reason
     
     def moderate(self, message):
         pass
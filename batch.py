@@ -0,0 +1,162 @@
+# Пакетный режим: перевод множества запросов в команды без их выполнения.
+# Запросы выполняются пулом потоков с ограничением параллелизма; частоту ограничивает общий
+# для процессов ограничитель (rate_limit.py), в котором пакет уступает интерактивным вызовам.
+# Результаты выводятся в JSONL в порядке ввода или по мере готовности.
+
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def read_queries(source):
+    # Строки файла — запросы как есть, либо JSON-объекты с полем "query" (JSONL).
+    # Возвращает пары (запрос, ошибка): битая строка JSONL становится ошибкой своего элемента
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        queries = []
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            error = None
+            if line.startswith("{"):
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    error = f"некорректный JSON: {e}"
+                else:
+                    query = item.get("query") or item.get("prompt") or ""
+                    if isinstance(query, str):
+                        line = query
+                    else:
+                        error = "поле query должно быть строкой"
+            queries.append((line, error))
+        return queries
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def translate(config, query, shell):
+    import iop
+
+    result = {"query": query, "command": None, "ok": False, "error": None, "cached": False}
+    start = time.monotonic()
+    try:
+        question = iop.ensure_prompt_is_question(query)
+        system_prompt = iop.get_system_prompt(shell, max_prompt_tokens=config.get("max_prompt_tokens"))
+        command = iop.fetch_completion(config, iop.build_messages(system_prompt, question, config))
+        result["command"] = command
+        result["ok"] = iop.is_valid_command(command)
+        if not result["ok"]:
+            result["error"] = "markdown" if iop.has_markdown(command) else "issue"
+    except Exception as e:
+        result["error"] = str(e)
+    result["latency"] = time.monotonic() - start
+    return result
+
+
+def cache_lookup(config, query, shell):
+    import iop
+    from response_cache import get_response_cache, make_cache_key
+
+    cache = get_response_cache(config)
+    if cache is None:
+        return None, None
+    try:
+        question = iop.ensure_prompt_is_question(query)
+    except ValueError:
+        return cache, None
+    system_prompt = iop.get_system_prompt(shell, max_prompt_tokens=config.get("max_prompt_tokens"))
+    key = make_cache_key(question, config["model"], config["temperature"], system_prompt)
+    return cache, key
+
+
+def run_batch(config, source, shell, ordered=True, out=None):
+    import rate_limit
+
+    out = out or sys.stdout
+    queries = read_queries(source)
+    concurrency = max(1, config.get("batch_concurrency", 4))
+    # Пул соединений должен вмещать все параллельные запросы
+    config = dict(config, pool_maxsize=max(config.get("pool_maxsize", 10), concurrency))
+    results = {}
+    next_index = 0
+    start = time.monotonic()
+
+    def emit(index, result):
+        nonlocal next_index
+        results[index] = dict(result, index=index)
+        if not ordered:
+            out.write(json.dumps(results[index], ensure_ascii=False) + "\n")
+            out.flush()
+            return
+        while next_index in results:
+            out.write(json.dumps(results[next_index], ensure_ascii=False) + "\n")
+            next_index += 1
+        out.flush()
+
+    # Кэш SQLite используется только из главного потока: попадания отдаются сразу, без сети
+    pending = {}
+    with rate_limit.priority(rate_limit.BATCH), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index, (query, error) in enumerate(queries):
+            if error is not None:
+                emit(index, {"query": query, "command": None, "ok": False, "error": error,
+                             "cached": False, "latency": 0.0})
+                continue
+            cache, key = cache_lookup(config, query, shell)
+            cached = cache.get(key) if key is not None else None
+            if cached is not None:
+                emit(index, {"query": query, "command": cached, "ok": True, "error": None,
+                             "cached": True, "latency": 0.0})
+                continue
+            pending[pool.submit(translate, config, query, shell)] = (index, cache, key)
+        for future in as_completed(pending):
+            index, cache, key = pending[future]
+            result = future.result()
+            if cache is not None and key is not None and result["ok"]:
+                cache.put(key, result["command"])
+            emit(index, result)
+
+    elapsed = time.monotonic() - start
+    summary = summarize(list(results.values()), elapsed)
+    print_summary(summary)
+    return summary
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(results, elapsed):
+    latencies = [r["latency"] for r in results if not r["cached"]]
+    return {
+        "total": len(results),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "cached": sum(1 for r in results if r["cached"]),
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+    }
+
+
+def print_summary(summary):
+    # Сводка выводится в stderr, чтобы не смешиваться с JSONL в stdout
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title="Пакетный режим")
+    table.add_column("Параметр", style="cyan")
+    table.add_column("Значение", style="magenta")
+    table.add_row("Запросов", str(summary["total"]))
+    table.add_row("Ошибок", str(summary["failed"]))
+    table.add_row("Из кэша", str(summary["cached"]))
+    table.add_row("Общее время", f"{summary['elapsed']:.2f} с")
+    table.add_row("Пропускная способность", f"{summary['throughput']:.2f} запр/с")
+    table.add_row("Задержка p50 / p95", f"{summary['p50']:.2f} / {summary['p95']:.2f} с")
+    Console(stderr=True).print(table)
@@ -0,0 +1,167 @@
+# Локальная имитация OpenRouter API для бенчмарков: /api/v1/chat/completions и /api/v1/auth/key.
+# Задержка, джиттер, потоковая выдача (SSE) и доля ошибок настраиваются; случайность детерминирована seed.
+#
+#   python -m benchmarks.mock_openrouter --port 8399 --latency-ms 200 --jitter-ms 50 --error-rate 0.05
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = "ls -la"
+
+
+class MockOptions:
+    def __init__(self, latency_ms=0, jitter_ms=0, token_delay_ms=0, error_rate=0.0, error_status=500,
+                 response=DEFAULT_RESPONSE, seed=0):
+        self.latency_ms = latency_ms  # задержка до первого байта ответа
+        self.jitter_ms = jitter_ms  # равномерный разброс задержки ±jitter_ms
+        self.token_delay_ms = token_delay_ms  # пауза между SSE-чанками
+        self.error_rate = error_rate  # доля запросов, на которые отвечаем error_status
+        self.error_status = error_status
+        self.response = response
+        self.seed = seed
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # иначе мелкие SSE-чанки задерживаются алгоритмом Нейгла
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_api()
+
+    def do_POST(self):
+        self.handle_api()
+
+    def handle_api(self):
+        server = self.server
+        options = server.options
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null") or {}
+        with server.lock:
+            server.request_count += 1
+            delay = max(0.0, options.latency_ms + server.random.uniform(-options.jitter_ms, options.jitter_ms)) / 1000
+            failed = server.random.random() < options.error_rate
+        time.sleep(delay)
+
+        if self.path.endswith("/auth/key"):
+            return self.send_json(200, {"data": {"label": "mock", "usage": 0, "limit": None}})
+        if not self.path.endswith("/chat/completions"):
+            return self.send_json(404, {"error": {"message": "not found", "code": 404}})
+        if failed:
+            with server.lock:
+                server.error_count += 1
+            headers = {"Retry-After": "0"} if options.error_status == 429 else {}
+            return self.send_json(options.error_status, {"error": {"message": "injected error", "code": options.error_status}}, headers)
+        if body.get("stream"):
+            return self.send_stream(body.get("model", "mock"))
+        return self.send_json(200, {
+            "id": "mock", "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": options.response}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(options.response.split())},
+        })
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, model):
+        # Ответ разбивается по словам, как токены модели; передача chunked, чтобы соединение переиспользовалось
+        options = self.server.options
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = options.response.split(" ")
+        self.write_chunk(b": OPENROUTER PROCESSING\n\n")
+        for i, word in enumerate(words):
+            delta = word if i == 0 else " " + word
+            chunk = {"id": "mock", "model": model, "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if options.token_delay_ms and i < len(words) - 1:
+                time.sleep(options.token_delay_ms / 1000)
+        done = {"id": "mock", "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.write_chunk(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class MockOpenRouter:
+    # Контекстный менеджер: сервер работает в фоновом потоке, url подставляется в api_base
+    def __init__(self, options=None, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.options = options or MockOptions()
+        self.httpd.random = random.Random(self.httpd.options.seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self.httpd.error_count = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    @property
+    def error_count(self):
+        return self.httpd.error_count
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_options_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=0, help="Задержка до первого байта ответа, мс")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Разброс задержки, мс")
+    parser.add_argument("--token-delay-ms", type=float, default=0, help="Пауза между чанками потокового ответа, мс")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля запросов, завершающихся ошибкой")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP-статус внедряемых ошибок")
+    parser.add_argument("--response", default=DEFAULT_RESPONSE, help="Текст ответа модели")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def options_from_args(args):
+    return MockOptions(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, token_delay_ms=args.token_delay_ms,
+                       error_rate=args.error_rate, error_status=args.error_status, response=args.response, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная имитация OpenRouter API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8399)
+    add_options_arguments(parser)
+    args = parser.parse_args()
+    with MockOpenRouter(options_from_args(args), args.host, args.port) as server:
+        print(f"api_base: {server.url}", flush=True)
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+# Набор бенчмарков iop против локальной имитации OpenRouter (benchmarks/mock_openrouter.py).
+# Замеры: холодный старт, задержка одного запроса (с потоком и без), пропускная способность
+# пакетного режима при параллельных запросах, память. Результат — JSON для сравнения между коммитами:
+#
+#   python -m benchmarks.run --output before.json
+#   python -m benchmarks.run --compare before.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.mock_openrouter import MockOpenRouter, add_options_arguments, options_from_args  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+SHELL = "bash"
+
+# Запросы, похожие на реальные; повторяются по кругу до нужного числа
+WORKLOAD = (
+    "Покажи свободное место на дисках?",
+    "Найди 10 самых больших файлов в домашнем каталоге?",
+    "Какие процессы занимают больше всего памяти?",
+    "Покажи открытые сетевые порты?",
+    "Сколько строк во всех файлах .py в текущем каталоге?",
+    "Выведи последние ошибки из системного журнала?",
+    "Заархивируй каталог logs в tar.gz?",
+    "Покажи загрузку процессора по ядрам?",
+)
+
+# Метрики, участвующие в сравнении (средние и минимумы слишком шумные); для _rps больше — лучше
+COMPARED_SUFFIXES = ("p50_ms", "p95_ms", "peak_kb", "maxrss_kb", "_rps")
+HIGHER_IS_BETTER = ("_rps",)
+
+
+def bench_config(api_base, **overrides):
+    config = {
+        "api": "openrouter", "openrouter_api_key": "mock", "your_app_name": "IOP CLI benchmark",
+        "api_base": api_base, "model": "openai/gpt-4o", "temperature": 0.7, "max_tokens": 200,
+        "retries": 3, "retry_backoff": 0.01, "stream": True, "cache": False, "semantic_cache": False,
+        "hedge": False, "safety": True, "modify": True, "batch_concurrency": 4,
+    }
+    config.update(overrides)
+    return config
+
+
+def queries(count):
+    return [WORKLOAD[i % len(WORKLOAD)] for i in range(count)]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def distribution(values_ms):
+    return {
+        "p50_ms": round(percentile(values_ms, 0.5), 3),
+        "p95_ms": round(percentile(values_ms, 0.95), 3),
+        "mean_ms": round(statistics.fmean(values_ms), 3),
+        "min_ms": round(min(values_ms), 3),
+    }
+
+
+def quiet_console():
+    import iop
+    from rich.console import Console
+    iop.console._console = Console(file=io.StringIO())
+
+
+def cold_call(api_base):
+    # Выполняется в отдельном процессе: первый запрос со всеми импортами, рендерингом промпта и соединением
+    import iop
+    quiet_console()
+    command = iop.chat_completion(bench_config(api_base), WORKLOAD[0], SHELL)
+    print(json.dumps({"command": command, "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+
+def bench_cold_start(api_base, runs):
+    env = dict(os.environ, IOP_NO_DAEMON="1", XDG_CACHE_HOME=tempfile.mkdtemp(prefix="iop-bench-"))
+    version_ms, call_ms, maxrss = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT_DIR, "iop.py"), "--version"], cwd=ROOT_DIR, env=env,
+                       capture_output=True, check=True, timeout=60)
+        version_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-m", "benchmarks.run", "--cold-call", api_base], cwd=ROOT_DIR, env=env,
+                                capture_output=True, text=True, check=True, timeout=60)
+        call_ms.append((time.perf_counter() - start) * 1000)
+        maxrss.append(json.loads(result.stdout.strip().splitlines()[-1])["maxrss_kb"])
+    return {
+        "version": distribution(version_ms),
+        "first_request": distribution(call_ms),
+        "first_request_maxrss_kb": max(maxrss),
+    }
+
+
+def bench_latency(api_base, count, stream):
+    import iop
+    import timings
+    quiet_console()
+    config = bench_config(api_base, stream=stream)
+    total_ms, ttft_ms = [], []
+    # Первый запрос прогревает импорты и соединение; его стоимость учитывает замер холодного старта
+    for index, query in enumerate(queries(count + 1)):
+        timings.reset()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # индикатор Progress пишет в stdout
+            iop.chat_completion(config, query, SHELL)
+        if index:
+            total_ms.append((time.perf_counter() - start) * 1000)
+            ttft_ms.append(iop.last_request_metrics["ttft"] * 1000)
+    return dict(distribution(total_ms), ttft=distribution(ttft_ms))
+
+
+def bench_throughput(api_base, count, concurrency):
+    import batch
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as source:
+        source.write("\n".join(queries(count)) + "\n")
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            summary = batch.run_batch(bench_config(api_base, stream=False, batch_concurrency=concurrency),
+                                      source.name, SHELL, out=out)
+    finally:
+        os.remove(source.name)
+    return {
+        "concurrency": concurrency,
+        "requests": summary["total"],
+        "failed": summary["failed"],
+        "throughput_rps": round(summary["throughput"], 3),
+        "p50_ms": round(summary["p50"] * 1000, 3),
+        "p95_ms": round(summary["p95"] * 1000, 3),
+    }
+
+
+def bench_memory(api_base, count):
+    # Пиковый объём выделений Python за серию запросов в одном процессе (как у демона iopd)
+    tracemalloc.start()
+    try:
+        bench_latency(api_base, count, stream=True)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"traced_peak_kb": round(peak / 1024, 1), "traced_retained_kb": round(current / 1024, 1)}
+
+
+def git_revision():
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd=ROOT_DIR, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else ""
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def flatten(results, prefix=""):
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def compare(baseline, current, threshold):
+    # Возвращает строки (метрика, было, стало, изменение, регрессия)
+    rows = []
+    before, after = flatten(baseline["results"]), flatten(current["results"])
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        if not name.endswith(COMPARED_SUFFIXES):
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        rows.append((name, old, new, change, worse > threshold))
+    return rows
+
+
+def print_comparison(rows, baseline, current):
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(title=f"{baseline['meta']['commit']} → {current['meta']['commit']}")
+    table.add_column("Метрика", style="cyan")
+    table.add_column("Было", justify="right")
+    table.add_column("Стало", justify="right")
+    table.add_column("Изменение", justify="right")
+    for name, old, new, change, regressed in rows:
+        style = "red" if regressed else ""
+        table.add_row(name, f"{old:g}", f"{new:g}", f"[{style}]{change:+.1%}[/{style}]" if style else f"{change:+.1%}")
+    Console().print(table)
+
+
+def run(args):
+    options = options_from_args(args)
+    results = {}
+    with MockOpenRouter(options) as server:
+        results["cold_start"] = bench_cold_start(server.url, args.cold_runs)
+        results["latency"] = {
+            "stream": bench_latency(server.url, args.requests, stream=True),
+            "request": bench_latency(server.url, args.requests, stream=False),
+        }
+        results["throughput"] = bench_throughput(server.url, args.requests * args.concurrency, args.concurrency)
+        results["memory"] = bench_memory(server.url, args.requests)
+        errors = server.error_count
+    return {
+        "meta": dict(git_revision(), timestamp=time.time(), python=platform.python_version(),
+                     platform=platform.platform(), options=vars(options), injected_errors=errors,
+                     requests=args.requests, concurrency=args.concurrency, cold_runs=args.cold_runs),
+        "results": results,
+    }
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки iop с локальной имитацией OpenRouter")
+    parser.add_argument("--requests", type=int, default=20, help="Запросов в замере задержки")
+    parser.add_argument("--concurrency", type=int, default=4, help="Параллельных запросов в замере пропускной способности")
+    parser.add_argument("--cold-runs", type=int, default=5, help="Запусков процесса в замере холодного старта")
+    parser.add_argument("--output", help="Файл результатов (по умолчанию benchmarks/results/<коммит>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Сравнить с сохранённым результатом")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Допустимое ухудшение метрики при сравнении")
+    parser.add_argument("--cold-call", metavar="API_BASE", help=argparse.SUPPRESS)
+    add_options_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.cold_call:
+        cold_call(args.cold_call)
+        return 0
+
+    current = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"{current['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(current, file, indent=2, ensure_ascii=False)
+    print(f"Результаты сохранены: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        rows = compare(baseline, current, args.threshold)
+        print_comparison(rows, baseline, current)
+        return 1 if any(regressed for *_, regressed in rows) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# Несколько вариантов ответа за один запрос: модель возвращает n кандидатов (параметр n
+# или параллельные запросы), они проверяются локально и параллельно, выбирается лучший.
+# Проверки: отказ и разметка (как check_for_issue/check_for_markdown), синтаксис bash -n,
+# shellcheck, если установлен, и эвристика опасных команд. Так отклонённый ответ не требует
+# повторного запроса к модели.
+
+import json
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+CHECK_TIMEOUT = 5
+
+# Опасные команды: выполняются только после явного подтверждения
+DANGEROUS_PATTERNS = tuple(re.compile(pattern) for pattern in (
+    r"\brm\s+(-\S+\s+)*(/\*?|~/?|\$HOME/?)(\s|;|$)",
+    r"\bmkfs(\.\w+)?\b",
+    r"\bdd\b.*\bof=/dev/",
+    r">\s*/dev/(sd|nvme|hd|disk)",
+    r":\(\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;\s*:",
+    r"\bchmod\s+(-\w+\s+)*[0-7]*777\s+/(\s|$)",
+    r"\bchown\s+-\w*R\w*\s+\S+\s+/(\s|$)",
+    r"\b(curl|wget)\b[^|]*\|\s*(sudo\s+)?(ba|z)?sh\b",
+    r"\b(shutdown|reboot|halt|poweroff)\b",
+    r"\bRemove-Item\b.*-Recurse\b.*\s[A-Za-z]:\\?(\s|$)",
+    r"\bFormat-Volume\b",
+))
+
+
+class Candidate:
+    def __init__(self, index, command):
+        self.index = index
+        self.command = command
+        self.valid = True
+        self.dangerous = False
+        self.syntax_error = None
+        self.lint = []  # (уровень, сообщение) из shellcheck
+        self.reasons = []
+
+    def rank(self):
+        # Меньше — лучше: годные, затем безопасные, без ошибок shellcheck, с меньшим числом замечаний,
+        # при равенстве — в порядке ответа модели
+        errors = sum(1 for level, _ in self.lint if level == "error")
+        return (not self.valid, self.dangerous, errors, len(self.lint), self.index)
+
+    def report(self):
+        return {"index": self.index, "command": self.command, "valid": self.valid, "dangerous": self.dangerous,
+                "reasons": self.reasons}
+
+
+def is_dangerous(command):
+    return any(pattern.search(command) for pattern in DANGEROUS_PATTERNS)
+
+
+def bash_syntax_error(command):
+    # bash -n разбирает текст, ничего не выполняя
+    if not shutil.which("bash"):
+        return None
+    try:
+        result = subprocess.run(["bash", "-n"], input=command, capture_output=True, text=True, timeout=CHECK_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return None
+    if result.returncode == 0:
+        return None
+    return result.stderr.strip() or "syntax error"
+
+
+def shellcheck(command):
+    if not shutil.which("shellcheck"):
+        return []
+    try:
+        result = subprocess.run(["shellcheck", "--shell=bash", "--format=json", "-"], input=command,
+                                capture_output=True, text=True, timeout=CHECK_TIMEOUT)
+        findings = json.loads(result.stdout or "[]")
+    except (subprocess.TimeoutExpired, ValueError):
+        return []
+    return [(item.get("level"), f"SC{item.get('code')}: {item.get('message')}") for item in findings]
+
+
+def check(candidate, shell):
+    import iop
+
+    command = candidate.command
+    if iop.is_issue_response(command):
+        candidate.valid = False
+        candidate.reasons.append("отказ или непонятый вопрос")
+    if iop.has_markdown(command):
+        candidate.valid = False
+        candidate.reasons.append("разметка markdown")
+    if not candidate.valid:
+        return candidate
+    if shell == "bash":
+        candidate.syntax_error = bash_syntax_error(command)
+        if candidate.syntax_error:
+            candidate.valid = False
+            candidate.reasons.append(f"синтаксис: {candidate.syntax_error}")
+            return candidate
+        candidate.lint = shellcheck(command)
+        candidate.reasons.extend(message for _, message in candidate.lint)
+    if is_dangerous(command):
+        candidate.dangerous = True
+        candidate.reasons.append("потенциально опасная команда")
+    return candidate
+
+
+def rank_candidates(commands, shell):
+    # Проверки запускают подпроцессы, поэтому выполняются параллельно; возвращает кандидатов от лучшего
+    unique = list(dict.fromkeys(command.strip() for command in commands))
+    with ThreadPoolExecutor(max_workers=max(1, len(unique))) as pool:
+        checked = list(pool.map(lambda item: check(Candidate(*item), shell), enumerate(unique)))
+    return sorted(checked, key=Candidate.rank)
+
+
+def best_candidate(config, messages, shell):
+    import iop
+    import timings
+
+    client = iop.get_model_client(config)
+    commands = client.chat_candidates(messages, config["model"], config["temperature"], config["max_tokens"],
+                                      max(1, config.get("candidates", 1)))
+    with timings.span("candidates_check", candidates=len(commands)):
+        ranked = rank_candidates(commands, shell)
+    return ranked[0], ranked
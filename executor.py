@@ -0,0 +1,165 @@
+# Потоковое выполнение команд: stdout/stderr читаются построчно через каналы с ограниченной очередью
+# и выводятся по мере поступления. Вывод сверх лимита не показывается, а целиком сохраняется
+# во временный файл; поддерживаются таймаут и пересылка Ctrl-C дочернему процессу.
+
+import platform
+import queue
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+
+MAX_LINE = 64 * 1024
+QUEUE_SIZE = 1000
+TAIL_LINES = 20
+INTERRUPT_GRACE = 5
+
+
+class ExecutionResult:
+    def __init__(self):
+        self.returncode = None
+        self.duration = 0.0
+        self.timed_out = False
+        self.interrupted = False
+        self.output_bytes = 0
+        self.spill_path = None
+        self.tail = deque(maxlen=TAIL_LINES)
+
+
+def shell_argv(command):
+    if platform.system() == "Windows":
+        return ["powershell", "-Command", command]
+    return ["bash", "-c", command]
+
+
+def read_pipe(pipe, name, lines):
+    # Поток-читатель: строки ограничены MAX_LINE, очередь — QUEUE_SIZE (обратное давление на процесс)
+    try:
+        for line in iter(lambda: pipe.readline(MAX_LINE), b""):
+            lines.put((name, line))
+    finally:
+        pipe.close()
+        lines.put((name, None))
+
+
+def interrupt(process):
+    if platform.system() == "Windows":
+        process.terminate()
+    else:
+        process.send_signal(signal.SIGINT)
+
+
+def run_streaming(argv, on_line=None, timeout=None, output_cap=None, stdin=None):
+    # on_line(stream, text) вызывается для каждой строки, пока вывод не превысил output_cap байт
+    result = ExecutionResult()
+    start = time.monotonic()
+    process = subprocess.Popen(argv, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    lines = queue.Queue(maxsize=QUEUE_SIZE)
+    readers = [threading.Thread(target=read_pipe, args=(pipe, name, lines), daemon=True)
+               for pipe, name in ((process.stdout, "stdout"), (process.stderr, "stderr"))]
+    for reader in readers:
+        reader.start()
+
+    buffered = []
+    spill = None
+    open_streams = len(readers)
+    deadline = start + timeout if timeout else None
+    kill_at = None
+    try:
+        while open_streams:
+            try:
+                wait = 0.1
+                if deadline is not None:
+                    wait = min(wait, max(0.0, deadline - time.monotonic()))
+                name, line = lines.get(timeout=wait)
+            except queue.Empty:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline and process.poll() is None:
+                    result.timed_out = True
+                    process.kill()
+                    deadline = None
+                if kill_at is not None and now >= kill_at and process.poll() is None:
+                    process.kill()
+                # Внуки процесса могут держать каналы открытыми после его завершения
+                if process.poll() is not None and (result.timed_out or kill_at is not None):
+                    break
+                continue
+            except KeyboardInterrupt:
+                result.interrupted = True
+                interrupt(process)
+                kill_at = time.monotonic() + INTERRUPT_GRACE
+                continue
+            if line is None:
+                open_streams -= 1
+                continue
+            text = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            result.output_bytes += len(line)
+            result.tail.append((name, text))
+            if spill is not None:
+                spill.write(line)
+            elif output_cap and result.output_bytes > output_cap:
+                spill = tempfile.NamedTemporaryFile(prefix="iop-output-", suffix=".log", delete=False)
+                result.spill_path = spill.name
+                spill.writelines(buffered)
+                spill.write(line)
+                buffered = None
+            else:
+                if output_cap:
+                    buffered.append(line)
+                if on_line is not None:
+                    on_line(name, text)
+        while True:
+            try:
+                result.returncode = process.wait(timeout=0.1)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+            except KeyboardInterrupt:
+                result.interrupted = True
+                interrupt(process)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        result.returncode = process.returncode
+        if spill is not None:
+            spill.close()
+        result.duration = time.monotonic() - start
+    return result
+
+
+def execute(command, console, config):
+    from rich.text import Text
+
+    def print_line(stream, text):
+        console.print(Text(text, style="yellow" if stream == "stderr" else ""), soft_wrap=True)
+
+    result = run_streaming(
+        shell_argv(command),
+        on_line=print_line,
+        timeout=config.get("exec_timeout") or None,
+        output_cap=config.get("exec_output_cap") or None,
+    )
+    if result.spill_path:
+        # Показанное обрезано по лимиту: выводим последние строки, чтобы был виден итог команды
+        console.print(f"[bold yellow]... последние {len(result.tail)} строк вывода:[/bold yellow]")
+        for stream, text in result.tail:
+            print_line(stream, text)
+    print_summary(console, result)
+    return result
+
+
+def print_summary(console, result):
+    from rich.panel import Panel
+
+    lines = [f"[bold]Код завершения:[/bold] {result.returncode}", f"[bold]Время выполнения:[/bold] {result.duration:.2f} с"]
+    if result.timed_out:
+        lines.append("[bold red]Команда остановлена по таймауту[/bold red]")
+    if result.interrupted:
+        lines.append("[bold yellow]Команда прервана пользователем[/bold yellow]")
+    if result.spill_path:
+        lines.append(f"[bold yellow]Вывод превысил лимит, полностью сохранён в файл:[/bold yellow] {result.spill_path}")
+    ok = result.returncode == 0 and not result.timed_out
+    console.print(Panel("\n".join(lines), title="Результат выполнения", border_style="green" if ok else "red"))
@@ -0,0 +1,249 @@
+# Хеджирование запросов: если основной провайдер не прислал первый токен за порог,
+# параллельно запускается резервный запрос (другая модель или провайдер, например локальный Ollama).
+# Побеждает ответ, первым прошедший проверки is_valid_command; у проигравшего закрывается соединение.
+# Порог подстраивается по истории времени до первого токена (TTFT) каждого провайдера. Попытка,
+# отменённая или прерванная по таймауту до первого токена, тоже даёт замер — прошедшее время
+# (нижняя оценка TTFT), иначе медленный провайдер выглядел бы быстрым.
+
+import contextlib
+import json
+import os
+import queue
+import threading
+import time
+
+from paths import user_cache_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки нет, замеры параллельных процессов могут теряться
+    fcntl = None
+
+DEFAULT_DELAY_MS = 1500
+MIN_SAMPLES = 20
+MAX_SAMPLES = 200
+
+
+class LatencyHistory:
+    # Последние MAX_SAMPLES значений TTFT (мс) по каждому провайдеру/модели, хранятся в кэше пользователя
+    def __init__(self, path):
+        self.path = path
+        self.samples = self.load()
+        self.added = {}  # замеры этого процесса, ещё не записанные в файл
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def add(self, key, ttft_ms):
+        for samples in (self.samples.setdefault(key, []), self.added.setdefault(key, [])):
+            samples.append(round(ttft_ms, 1))
+            del samples[:-MAX_SAMPLES]
+
+    def percentile(self, key, fraction):
+        samples = sorted(self.samples.get(key, []))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    @contextlib.contextmanager
+    def locked(self):
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def save(self):
+        # Файл перечитывается под блокировкой и дополняется своими замерами: параллельные
+        # процессы iop не затирают замеры друг друга
+        if not self.added:
+            return
+        with self.locked():
+            samples = self.load()
+            for key, added in self.added.items():
+                merged = samples.setdefault(key, [])
+                merged.extend(added)
+                del merged[:-MAX_SAMPLES]
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(samples, file)
+            os.replace(tmp_path, self.path)
+        self.samples, self.added = samples, {}
+
+
+def provider_key(config):
+    return f"{config.get('api') or 'openrouter'}:{config['model']}"
+
+
+def backup_config(config):
+    return dict(config, api=config.get("hedge_api") or config.get("api"), model=config.get("hedge_model") or config["model"])
+
+
+def attempt_messages(messages, config):
+    # Системное сообщение оформляется для провайдера попытки: разметку cache_control понимают не все
+    import prompts
+    if not messages or messages[0]["role"] != "system":
+        return messages
+    content = messages[0]["content"]
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") for part in content)
+    return [prompts.system_message(content, config), *messages[1:]]
+
+
+def hedge_delay(config, history):
+    # Адаптивный порог: перцентиль TTFT основного провайдера, пока истории мало — значение из конфигурации
+    delay_ms = config.get("hedge_delay_ms", DEFAULT_DELAY_MS)
+    if config.get("hedge_adaptive", True):
+        observed = history.percentile(provider_key(config), config.get("hedge_percentile", 0.95))
+        if observed is not None:
+            delay_ms = max(config.get("hedge_min_delay_ms", 100), observed)
+    return delay_ms / 1000
+
+
+def is_timeout(error):
+    # requests.Timeout, TimeoutError и таймауты SDK провайдеров (APITimeoutError и т. п.)
+    return isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower()
+
+
+def run_attempt(attempt, messages, events):
+    import http_client
+    from ai_model import AIModel
+
+    config = attempt.config
+    content = ""
+    try:
+        client = AIModel.get_model_client(config)
+        stream = client.stream_chat(messages, config["model"], config["temperature"], config["max_tokens"])
+        with contextlib.closing(stream), http_client.on_response(attempt.track):
+            for delta in stream:
+                if attempt.cancel.is_set():
+                    return
+                content += delta
+                events.put(("delta", attempt.name, content))
+        events.put(("done", attempt.name, content))
+    except Exception as e:
+        events.put(("error", attempt.name, e))
+
+
+class Attempt:
+    def __init__(self, name, config, messages, events):
+        self.name = name
+        self.config = config
+        self.cancel = threading.Event()
+        self.lock = threading.Lock()
+        self.responses = []
+        self.started = time.monotonic()
+        self.first_token = None
+        self.ended = None
+        self.failed = False
+        self.finished = False
+        self.thread = threading.Thread(target=run_attempt, args=(self, messages, events), daemon=True)
+        self.thread.start()
+
+    def track(self, response):
+        # Ответ, пришедший уже после отмены, закрывается сразу
+        import http_client
+        with self.lock:
+            self.responses.append(response)
+            cancelled = self.cancel.is_set()
+        if cancelled:
+            http_client.abort(response)
+
+    def finish(self):
+        self.finished = True
+        if self.ended is None:
+            self.ended = time.monotonic()
+
+    def stop(self):
+        # Отмена закрывает соединение: поток попытки, ждущий данных, сразу завершается с ошибкой
+        import http_client
+        with self.lock:
+            self.cancel.set()
+            responses, self.responses = self.responses, []
+        if self.ended is None:
+            self.ended = time.monotonic()
+        for response in responses:
+            http_client.abort(response)
+
+
+def hedged_completion(config, messages, on_delta=None):
+    # Возвращает (content, stats); on_delta получает текущий текст лидирующей попытки
+    import iop
+
+    history = LatencyHistory(os.path.join(user_cache_dir(), "hedge_latency.json"))
+    delay = hedge_delay(config, history)
+    events = queue.Queue()
+    attempts = {"primary": Attempt("primary", config, messages, events)}
+    leader = None
+    last_error = None
+    fallback = None
+    stats = {"hedged": False, "winner": None, "ttft": None, "delay": delay}
+
+    def start_backup():
+        if "backup" not in attempts:
+            stats["hedged"] = True
+            backup = backup_config(config)
+            attempts["backup"] = Attempt("backup", backup, attempt_messages(messages, backup), events)
+
+    try:
+        while True:
+            running = [a for a in attempts.values() if not a.finished]
+            if not running:
+                if fallback is not None:
+                    # Ни один ответ не прошёл проверки: возвращаем последний, его отклонит вызывающий код
+                    return fallback, stats
+                raise last_error
+            timeout = None
+            if "backup" not in attempts:
+                timeout = max(0.0, attempts["primary"].started + delay - time.monotonic())
+            try:
+                kind, name, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                start_backup()
+                continue
+
+            attempt = attempts[name]
+            if attempt.finished:
+                continue  # событие отменённой попытки, пришедшее до проверки cancel
+            if kind == "delta":
+                if attempt.first_token is None:
+                    attempt.first_token = time.monotonic()
+                    history.add(provider_key(attempt.config), (attempt.first_token - attempt.started) * 1000)
+                    if stats["ttft"] is None:
+                        stats["ttft"] = attempt.first_token - attempts["primary"].started
+                leader = leader or name
+                if not iop.is_valid_command(payload):
+                    # Ответ уже забракован по первым токенам: отменяем его и сразу запускаем резерв
+                    attempt.stop()
+                    attempt.finish()
+                    fallback = payload
+                    if leader == name:
+                        leader = None
+                    start_backup()
+                elif leader == name and on_delta is not None:
+                    on_delta(payload)
+            elif kind == "done":
+                attempt.finish()
+                if iop.is_valid_command(payload):
+                    stats["winner"] = name
+                    return payload, stats
+                fallback = payload
+                start_backup()
+            elif kind == "error":
+                attempt.finish()
+                attempt.failed = not is_timeout(payload)
+                last_error = payload
+                start_backup()
+    finally:
+        for attempt in attempts.values():
+            attempt.stop()
+            if attempt.first_token is None and not attempt.failed:
+                # Цензурированный замер: первого токена не было за всё время попытки
+                history.add(provider_key(attempt.config), (attempt.ended - attempt.started) * 1000)
+        try:
+            history.save()
+        except OSError:
+            pass
@@ -0,0 +1,247 @@
+# История запросов: запрос, команда, модель, источник ответа, задержка, токены, решение
+# пользователя, код завершения, shell и целевая ОС. Записи только добавляются в SQLite в каталоге кэша; поиск идёт
+# по полнотекстовому индексу FTS5, а если SQLite собран без FTS5 — через LIKE.
+# Запись не задерживает интерактивный путь: записи ставятся в очередь и пачками сбрасываются
+# фоновым потоком; остаток дописывается при выходе (atexit, а в демоне iopd — после ответа клиенту).
+
+import atexit
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from paths import user_cache_dir
+
+DEFAULT_LIMIT = 20
+FLUSH_BATCH = 256
+EXIT_FLUSH_TIMEOUT = 2
+
+# Ответ пользователя в prompt_user_for_action
+ACTIONS = {"": "accept", "Д": "accept", "И": "modify", "К": "copy", "С": "script"}
+COLUMNS = ("ts", "query", "command", "model", "source", "latency", "tokens", "action", "exit_code", "shell", "os")
+SEARCH_RE = re.compile(r"\w+")
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def action_name(user_input):
+    return ACTIONS.get(user_input.strip().upper(), "reject")
+
+
+def history_path():
+    return os.path.join(user_cache_dir(), "history.sqlite3")
+
+
+class HistoryStore:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY, ts REAL NOT NULL, query TEXT NOT NULL, "
+            "command TEXT NOT NULL, model TEXT, source TEXT, latency REAL, tokens INTEGER, action TEXT, "
+            "exit_code INTEGER, shell TEXT, os TEXT)"
+        )
+        if "os" not in {row[1] for row in self.conn.execute("PRAGMA table_info(history)")}:
+            # База прежней версии: старые записи остаются без ОС и подходят любой
+            try:
+                self.conn.execute("ALTER TABLE history ADD COLUMN os TEXT")
+            except sqlite3.OperationalError:
+                pass  # колонку уже добавил параллельный процесс
+        try:
+            # Внешнее содержимое: текст хранится один раз, в индексе — только термы
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5("
+                "query, command, content='history', content_rowid='id')"
+            )
+            self.conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN "
+                "INSERT INTO history_fts(rowid, query, command) VALUES (new.id, new.query, new.command); END"
+            )
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+        self.conn.commit()
+
+    def insert(self, entries):
+        self.conn.executemany(
+            f"INSERT INTO history ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            [tuple(entry.get(column) for column in COLUMNS) for entry in entries],
+        )
+        self.conn.commit()
+
+    def search(self, text="", limit=DEFAULT_LIMIT):
+        # Новые записи первыми; все слова поиска должны встретиться в запросе или команде
+        words = SEARCH_RE.findall(text)
+        select = f"SELECT {', '.join(COLUMNS)} FROM history"
+        if not words:
+            rows = self.conn.execute(f"{select} ORDER BY id DESC LIMIT ?", (limit,))
+        elif self.fts:
+            match = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+            rows = self.conn.execute(
+                f"{select} WHERE id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ? "
+                "ORDER BY rowid DESC LIMIT ?) ORDER BY id DESC",
+                (match, limit),
+            )
+        else:
+            condition = " AND ".join("(query LIKE ? ESCAPE '\\' OR command LIKE ? ESCAPE '\\')" for _ in words)
+            patterns = []
+            for word in words:
+                pattern = "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                patterns += [pattern, pattern]
+            rows = self.conn.execute(f"{select} WHERE {condition} ORDER BY id DESC LIMIT ?", (*patterns, limit))
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def accepted(self, limit, shell, os_name):
+        # Последняя успешно выполненная команда для каждого запроса в этих shell и ОС; записи без
+        # shell или ОС подходят любым. Офлайн-ответы уже в индексе
+        rows = self.conn.execute(
+            "SELECT query, command, model, MAX(id) FROM history "
+            "WHERE action = 'accept' AND exit_code = 0 AND source != 'offline' "
+            "AND (shell IS NULL OR shell = ?) AND (os IS NULL OR os = ?) "
+            "GROUP BY query ORDER BY MAX(id) DESC LIMIT ?",
+            (shell, os_name, limit),
+        )
+        return [{"query": query, "command": command, "model": model} for query, command, model, _ in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+class HistoryWriter:
+    # Фоновая запись: поток забирает из очереди всё накопившееся и вставляет одной транзакцией
+    _STOP = object()
+
+    def __init__(self, path, tokenizer="auto"):
+        self.path = path
+        self.tokenizer = tokenizer
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def add(self, entry):
+        self.queue.put(entry)
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="iop-history", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        import logging
+        import prompts
+
+        count = prompts.get_tokenizer(self.tokenizer)
+        store = None
+        try:
+            store = HistoryStore(self.path)
+            while True:
+                batch = [self.queue.get()]
+                while len(batch) < FLUSH_BATCH and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                stop = self._STOP in batch
+                entries = [entry for entry in batch if entry is not self._STOP]
+                for entry in entries:
+                    if entry.get("tokens") is None:
+                        entry["tokens"] = count(entry["command"])
+                if entries:
+                    store.insert(entries)
+                if stop and self.queue.empty():
+                    return
+        except (OSError, sqlite3.Error) as e:
+            logging.debug("Не удалось записать историю: %s", e)
+        finally:
+            if store is not None:
+                store.close()
+
+    def flush(self, timeout=EXIT_FLUSH_TIMEOUT):
+        with self.lock:
+            thread = self.thread
+        if thread is not None and thread.is_alive():
+            self.queue.put(self._STOP)
+            thread.join(timeout)
+
+
+def get_writer(config):
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = HistoryWriter(history_path(), config.get("tokenizer", "auto"))
+            atexit.register(flush)
+        return _writer
+
+
+def record(config, query, command, user_input, exit_code=None, shell=None, metrics=None, os_name=None):
+    if not config.get("history", True):
+        return
+    metrics = metrics or {}
+    source = "model"
+    for key, name in (("offline_hit", "offline"), ("cache_hit", "cache"), ("semantic_hit", "semantic")):
+        if key in metrics:
+            source = name
+    get_writer(config).add({
+        "ts": time.time(), "query": query, "command": command, "model": config.get("model"), "source": source,
+        "latency": metrics.get("total"), "tokens": None, "action": action_name(user_input),
+        "exit_code": exit_code, "shell": shell, "os": os_name,
+    })
+
+
+def flush():
+    if _writer is not None:
+        _writer.flush()
+
+
+def search(config, text="", limit=None):
+    flush()  # записи этого процесса тоже должны находиться
+    store = HistoryStore(history_path())
+    try:
+        return store.search(text, limit or config.get("history_limit", DEFAULT_LIMIT))
+    finally:
+        store.close()
+
+
+def export(config, shell, os_name, limit=10000):
+    # Успешные команды из истории пополняют офлайн-индекс, кэш похожих запросов и кэш ответов
+    import iop
+    import offline_index
+    import semantic_cache
+    from response_cache import get_response_cache, make_cache_key
+
+    flush()
+    store = HistoryStore(history_path())
+    try:
+        entries = store.accepted(limit, shell, os_name)
+    finally:
+        store.close()
+    cache = get_response_cache(config)
+    system_prompt = iop.get_system_prompt(shell, max_prompt_tokens=config.get("max_prompt_tokens"), os_name=os_name) if cache is not None else None
+    entries.reverse()  # от старых к новым: более новая команда для запроса записывается последней
+    offline_index.remember_many(config, shell, os_name, [(entry["query"], entry["command"]) for entry in entries])
+    for entry in entries:
+        if entry["model"] == config.get("model"):
+            semantic_cache.remember(config, shell, os_name, entry["query"], entry["command"])
+            if cache is not None:
+                cache.put(make_cache_key(entry["query"], config["model"], config["temperature"], system_prompt), entry["command"])
+    return len(entries)
+
+
+def print_entries(console, entries):
+    from rich.table import Table
+
+    table = Table(title="История запросов")
+    table.add_column("Время", style="dim", no_wrap=True)
+    table.add_column("Запрос", style="cyan")
+    table.add_column("Команда", style="green")
+    table.add_column("Источник")
+    table.add_column("Решение")
+    table.add_column("Код", justify="right")
+    table.add_column("мс", justify="right")
+    for entry in entries:
+        table.add_row(
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["ts"])), entry["query"], entry["command"],
+            entry["source"] or "", entry["action"] or "",
+            "" if entry["exit_code"] is None else str(entry["exit_code"]),
+            "" if entry["latency"] is None else str(round(entry["latency"] * 1000)),
+        )
+    console.print(table)
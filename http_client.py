@@ -0,0 +1,176 @@
+import contextlib
+import email.utils
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import rate_limit
+import timings
+
+DEFAULT_API_BASE = "https://openrouter.ai/api/v1"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_pid = None
+_local = threading.local()
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        # DNS + TCP: create_connection разрешает имя и подключается одним вызовом
+        with timings.span("connect", host=self.host):
+            return super()._new_conn()
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        with timings.span("connect", host=self.host):
+            sock = super()._new_conn()
+        self._tcp_connected_at = time.perf_counter()
+        return sock
+
+    def connect(self):
+        super().connect()
+        timings.record("tls", self._tcp_connected_at, time.perf_counter(), host=self.host)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+
+def get_session(config=None):
+    # Общая сессия на процесс: пул соединений и keep-alive избавляют от повторных TCP+TLS рукопожатий
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        config = config or {}
+        pool_maxsize = config.get("pool_maxsize", 10)
+        adapter = TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def reset_session():
+    global _session, _session_pid
+    if _session is not None and _session_pid == os.getpid():
+        _session.close()
+    _session, _session_pid = None, None
+
+
+def get_timeout(config):
+    return (config.get("timeout_connect", 5), config.get("timeout_read", 30))
+
+
+def api_url(config, path):
+    return (config.get("api_base") or DEFAULT_API_BASE).rstrip("/") + path
+
+
+def retry_delay(config, attempt, response=None):
+    backoff_max = config.get("retry_backoff_max", 30)
+    if response is not None:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            return min(retry_after, backoff_max)
+    # Экспоненциальная задержка с полным джиттером
+    return random.uniform(0, min(backoff_max, config.get("retry_backoff", 0.5) * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def on_response(callback):
+    # Каждый ответ, полученный в этом потоке, передаётся callback (hedge.py прерывает ответы отменённой попытки)
+    previous = getattr(_local, "on_response", None)
+    _local.on_response = callback
+    try:
+        yield
+    finally:
+        _local.on_response = previous
+
+
+def abort(response):
+    # close() не будит поток, ждущий данных из сокета; shutdown прерывает чтение сразу
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+def request(config, method, path, **kwargs):
+    retries = config.get("retries", 3)
+    kwargs.setdefault("timeout", get_timeout(config))
+    session = get_session(config)
+    url = api_url(config, path)
+    limiter = rate_limit.get_limiter(config)
+    for attempt in range(retries + 1):
+        try:
+            if limiter is not None:
+                # Очередь общего для процессов ограничителя; каждая попытка берёт свой токен
+                start = time.perf_counter()
+                limiter.acquire()
+                timings.record("queue_wait", start, time.perf_counter(), priority=rate_limit.get_priority())
+            start = time.perf_counter()
+            response = session.request(method, url, **kwargs)
+            callback = getattr(_local, "on_response", None)
+            if callback is not None:
+                callback(response)
+            # elapsed — время до разбора заголовков ответа, то есть time-to-first-byte
+            timings.record("ttfb", start, start + response.elapsed.total_seconds(), path=path, status=response.status_code)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as e:
+            if attempt == retries:
+                raise
+            delay = retry_delay(config, attempt)
+            logging.debug("%s %s: %s, повтор через %.2fs", method, url, e, delay)
+        else:
+            if limiter is not None:
+                limiter.update(response.status_code, response.headers)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            # После 429 паузу Retry-After выдерживает очередь ограничителя, общая для всех процессов
+            delay = 0.0 if limiter is not None and response.status_code == 429 else retry_delay(config, attempt, response)
+            logging.debug("%s %s: HTTP %s, повтор через %.2fs", method, url, response.status_code, delay)
+            response.close()
+        time.sleep(delay)
+
+
+def get(config, path, **kwargs):
+    return request(config, "GET", path, **kwargs)
+
+
+def post(config, path, **kwargs):
+    return request(config, "POST", path, **kwargs)
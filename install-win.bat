@@ -46,6 +46,7 @@ if not exist "%~dp0iop.py" ( echo iop.py отсутствует в %~dp0, уст
 if not exist "%~dp0prompt.txt" ( echo prompt.txt отсутствует в %~dp0, установка невозможна & goto :end )
 if not exist "%~dp0config.yaml" ( echo config.yaml отсутствует в %~dp0, установка невозможна & goto :end )
 if not exist "%~dp0ai_model.py" ( echo ai_model.py отсутствует в %~dp0, установка невозможна & goto :end )
+if not exist "%~dp0offline_commands.json" ( echo offline_commands.json отсутствует в %~dp0, установка невозможна & goto :end )
 
 :: Установка значений по умолчанию
 set "INSTALL_DIR=%USERPROFILE%\iop-cli"
@@ -73,10 +74,11 @@ if "!INSTALL_DIR!"=="" set "INSTALL_DIR=%USERPROFILE%\iop-cli"
 if not exist "!INSTALL_DIR!" mkdir "!INSTALL_DIR!"
 
 echo Копирование файлов...
-copy "%~dp0iop.py" "!INSTALL_DIR!"
+:: Все модули iop (*.py) и файлы данных
+copy "%~dp0*.py" "!INSTALL_DIR!"
 copy "%~dp0prompt.txt" "!INSTALL_DIR!"
 copy "%~dp0config.yaml" "!INSTALL_DIR!"
-copy "%~dp0ai_model.py" "!INSTALL_DIR!"
+copy "%~dp0offline_commands.json" "!INSTALL_DIR!"
 
 echo Создание виртуального окружения...
 python -m venv "!INSTALL_DIR!\iop-env"
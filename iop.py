@@ -3,24 +3,45 @@
 import os
 import platform
 import sys
-import subprocess
-import requests
-import yaml
+import time
 import logging
 import argparse
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich.progress import Progress
-from rich.syntax import Syntax
-
-VERSION = "1.01"
+import functools
 
-# Инициализация Rich Console
-console = Console()
+VERSION = "1.01"
 
-# Определение типа терминала
-IS_CMD = os.environ.get('TERM') == 'xterm' or 'cmd' in os.environ.get('COMSPEC', '').lower()
+# Префиксы ответа модели, означающие отказ или непонятый вопрос
+ISSUE_PREFIXES = ("извините", "я извиняюсь", "вопрос не ясен", "я")
+
+# Метрики последнего запроса к API: время до первого токена (ttft) и общее время (total), в секундах
+last_request_metrics = {}
+
+# Разобранный config.yaml, переиспользуемый демоном iopd
+_config_cache = {}
+
+class LazyConsole:
+    # rich импортируется при первом выводе, поэтому --version и --help его не загружают
+    def __init__(self):
+        self._console = None
+
+    def get(self):
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+def setup_console():
+    # Вызывается при импорте и заново в процессе демона, обслуживающем терминал клиента
+    global console, IS_CMD
+    # Инициализация Rich Console
+    console = LazyConsole()
+    # Определение типа терминала
+    IS_CMD = os.environ.get('TERM') == 'xterm' or 'cmd' in os.environ.get('COMSPEC', '').lower()
+
+setup_console()
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -33,27 +54,32 @@ def safe_print(*args, **kwargs):
 def reset_console():
     if platform.system() == "Windows":
         os.system("color")
-    else:
+    elif sys.stdout.isatty():
+        # В перенаправленный вывод (--json, --batch, --history) управляющую последовательность не пишем
         print("\033[0m", end="", flush=True)
 
-def validate_api_key(api_key):
+def validate_api_key(api_key, config=None):
+    from rich.panel import Panel
+    from rich.progress import Progress
+    import requests
+    import http_client
     headers = {
         "Authorization": f"Bearer {api_key}",
     }
     try:
         with Progress() as progress:
             task = progress.add_task("[cyan]Проверка API ключа...", total=100)
-            response = requests.get("https://openrouter.ai/api/v1/auth/key", headers=headers)
+            response = http_client.get(config or {}, "/auth/key", headers=headers)
             progress.update(task, completed=100)
         return response.status_code == 200
     except requests.exceptions.RequestException as e:
         console.print(Panel(f"[bold red]Ошибка при валидации API ключа:[/bold red] {e}", title="Ошибка", border_style="red"))
         return False
 
-def get_api_key():
+def get_api_key(config=None):
     while True:
         api_key = console.input("[bold cyan]Введите ваш API ключ OpenRouter:[/bold cyan] ")
-        if validate_api_key(api_key):
+        if validate_api_key(api_key, config):
             return api_key
         console.print("[bold yellow]Неверный API ключ. Пожалуйста, попробуйте снова.[/bold yellow]")
 
@@ -70,47 +96,57 @@ def update_env_file(api_key):
                 env_file.write(f"OPENROUTER_API_KEY={api_key}")
             os.chmod(env_path, 0o600)  # Обновляем права доступа только для владельца
 
+def load_config_file(config_file):
+    import yaml
+    mtime = os.path.getmtime(config_file)
+    cached = _config_cache.get(config_file)
+    if cached is None or cached[0] != mtime:
+        with open(config_file, 'r') as file:
+            cached = (mtime, yaml.safe_load(file))
+        _config_cache[config_file] = cached
+    return dict(cached[1])
+
 def read_config():
+    from rich.panel import Panel
     config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
-    with open(config_file, 'r') as file:
-        config = yaml.safe_load(file)
+    config = load_config_file(config_file)
     
     env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+    if (config.get('api') or 'openrouter') != 'openrouter':
+        # Ключи других провайдеров берутся из окружения или config.yaml (см. ai_model.py)
+        if os.path.exists(env_path):
+            load_dotenv(env_path)
+        config['openrouter_api_key'] = os.getenv('OPENROUTER_API_KEY')
+        return config
+
     if not os.path.exists(env_path):
         console.print(Panel("[bold yellow]Файл .env не найден. Пожалуйста, введите API ключ OpenRouter.[/bold yellow]", title="Внимание", border_style="yellow"))
-        api_key = get_api_key()
+        api_key = get_api_key(config)
         update_env_file(api_key)
     else:
-        import dotenv
-        dotenv.load_dotenv(env_path)
+        load_dotenv(env_path)
     
     config['openrouter_api_key'] = os.getenv('OPENROUTER_API_KEY')
     
     if not config['openrouter_api_key']:
         console.print(Panel("[bold yellow]API ключ OpenRouter не найден. Пожалуйста, введите его.[/bold yellow]", title="Внимание", border_style="yellow"))
-        api_key = get_api_key()
+        api_key = get_api_key(config)
         update_env_file(api_key)
         config['openrouter_api_key'] = api_key
     
     return config
 
-def get_system_prompt(shell, is_script=False):
-    prompt_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt.txt")
-    with open(prompt_file, "r", encoding="utf-8") as file:
-        system_prompt = file.read()
-    
-    system_prompt = system_prompt.replace("{shell}", shell)
-    system_prompt = system_prompt.replace("{os}", get_os_friendly_name())
-    
-    if is_script:
-        system_prompt += "\n\nПри создании скрипта следуйте этим дополнительным рекомендациям:"
-        system_prompt += "\n* Создайте надежный скрипт, который обрабатывает потенциальные ошибки и предоставляет информативные сообщения об ошибках"
-        system_prompt += f"\n* Для {get_os_friendly_name()} используйте соответствующие механизмы обработки ошибок"
-        system_prompt += "\n* При работе с USB-устройствами или системными событиями используйте несколько методов для обеспечения надежных результатов"
-        system_prompt += "\n* Включите комментарии, объясняющие назначение каждого основного раздела скрипта"
-        system_prompt += "\n* Всегда включайте способ четкого отображения результатов пользователю"
-    
-    return system_prompt
+def load_dotenv(env_path):
+    import dotenv
+    import timings
+    with timings.span("dotenv"):
+        dotenv.load_dotenv(env_path)
+
+def get_system_prompt(shell, is_script=False, max_prompt_tokens=None, os_name=None):
+    import prompts
+    import timings
+    with timings.span("prompt_render"):
+        return prompts.render(shell, os_name or get_os_friendly_name(), is_script, max_prompt_tokens)
 
 def ensure_prompt_is_question(prompt):
     if not prompt.strip():
@@ -120,12 +156,23 @@ def ensure_prompt_is_question(prompt):
     return prompt
 
 def print_usage(config):
+    from rich.panel import Panel
+    from rich.table import Table
+    from response_cache import get_response_cache
     console.print(Panel("[bold cyan]Разработчик @rokoss21, версия 1.0[/bold cyan]", border_style="cyan"))
     console.print()
-    console.print("[bold]Использование:[/bold] iop [-a] [-k] <ваш вопрос или команда>")
+    console.print("[bold]Использование:[/bold] iop [-a] [-k] [-r] [--no-cache] <ваш вопрос или команда>")
     console.print("[bold]Аргументы:[/bold]")
     console.print("  [cyan]-a, --ask:[/cyan] Запрашивать подтверждение перед выполнением команды")
     console.print("  [cyan]-k, --key:[/cyan] Изменить API ключ OpenRouter")
+    console.print("  [cyan]-r, --refine:[/cyan] Уточнить последнюю команду в этом терминале (с учётом предыдущих запросов)")
+    console.print("  [cyan]--no-cache:[/cyan] Не использовать локальный кэш ответов")
+    console.print("  [cyan]--batch FILE|-:[/cyan] Перевести запросы из файла или stdin в команды (JSONL), без выполнения")
+    console.print("  [cyan]--pipe, --json:[/cyan] Ответить на вопрос по данным из stdin (some_cmd | iop \"вопрос\"), вывод текстом или JSON")
+    console.print("  [cyan]--hosts HOSTS|@FILE:[/cyan] Выполнить команду по ssh параллельно на нескольких хостах")
+    console.print("  [cyan]--history [SEARCH]:[/cyan] Поиск по истории запросов и команд (с --json — вывод JSONL)")
+    console.print("  [cyan]--history-export:[/cyan] Передать успешные команды из истории в кэш и офлайн-индекс")
+    console.print("  [cyan]--timings:[/cyan] Показать время выполнения этапов (загрузка конфигурации, сеть, проверки, выполнение)")
     console.print()
 
     table = Table(title="Текущая конфигурация")
@@ -134,8 +181,13 @@ def print_usage(config):
     for key, value in config.items():
         if key != 'openrouter_api_key':
             table.add_row(key.capitalize(), str(value))
+    cache = get_response_cache(config)
+    if cache is not None:
+        stats = cache.stats()
+        table.add_row("Cache stats", f"попаданий: {stats['hits']}, промахов: {stats['misses']}, записей: {stats['entries']}")
     console.print(table)
 
+@functools.lru_cache(maxsize=None)
 def get_os_friendly_name():
     os_name = platform.system()
     if os_name == "Linux":
@@ -148,127 +200,278 @@ def get_os_friendly_name():
     else:
         return os_name
 
-def chat_completion(config, query, shell, is_script=False):
+def get_target_os_name(config):
+    # С --hosts команда выполняется на удалённых хостах: промпт и ключи кэшей строятся для их ОС
+    if config.get('hosts'):
+        import multihost
+        return config.get('hosts_os') or multihost.DEFAULT_OS
+    return get_os_friendly_name()
+
+def chat_completion(config, query, shell, history=None):
+    # history — предыдущие сообщения сессии (session.py); ответ с историей зависит от контекста и не кэшируется
+    from rich.panel import Panel
+    from response_cache import get_response_cache, make_cache_key
+    import timings
     if not query:
         console.print(Panel("[bold red]Не указан запрос пользователя.[/bold red]", title="Ошибка", border_style="red"))
         sys.exit(-1)
+
+    os_name = get_target_os_name(config)
+    if not history:
+        import offline_index
+        with timings.span("offline_lookup"):
+            offline = offline_index.lookup(config, shell, os_name, query)
+        if offline is not None:
+            command, matched_query, confidence = offline
+            console.print(f"[bold yellow]Команда из локального индекса для запроса[/bold yellow] «{matched_query}» (уверенность {confidence:.2f})")
+            last_request_metrics.clear()
+            last_request_metrics["offline_hit"] = confidence
+            return command
     
-    system_prompt = get_system_prompt(shell, is_script)
-    
-    headers = {
-        "Authorization": f"Bearer {config['openrouter_api_key']}",
-        "X-Title": config['your_app_name'],
-    }
-    
-    data = {
-        "model": config['model'],
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query}
-        ],
-        "temperature": config['temperature'],
-        "max_tokens": config['max_tokens']
-    }
+    system_prompt = get_system_prompt(shell, max_prompt_tokens=config.get('max_prompt_tokens'), os_name=os_name)
+
+    cache = get_response_cache(config) if not history else None
+    if cache is not None:
+        cache_key = make_cache_key(query, config['model'], config['temperature'], system_prompt)
+        with timings.span("cache_lookup"):
+            cached = cache.get(cache_key)
+        if cached is not None:
+            last_request_metrics.clear()
+            last_request_metrics["cache_hit"] = True
+            return cached
+
+    if not history:
+        import semantic_cache
+        with timings.span("semantic_lookup"):
+            similar = semantic_cache.lookup(config, shell, os_name, query)
+        if similar is not None:
+            command, similar_query, similarity = similar
+            console.print(f"[bold yellow]Команда взята из кэша для похожего запроса[/bold yellow] «{similar_query}» (сходство {similarity:.2f})")
+            last_request_metrics.clear()
+            last_request_metrics["semantic_hit"] = similarity
+            return command
     
+    messages = build_messages(system_prompt, query, config, history)
+
+    if config.get('candidates', 1) > 1:
+        content = candidate_chat_completion(config, messages, shell)
+    elif config.get('hedge', False):
+        content = hedged_chat_completion(config, messages)
+    elif config.get('stream', False):
+        content = stream_chat_completion(config, messages)
+    else:
+        content = request_chat_completion(config, messages)
+
+    # Отклонённые проверками ответы не кэшируем, чтобы не возвращать их повторно
+    # Ошибка записи в кэш не должна терять уже полученную команду
+    import sqlite3
     try:
+        if cache is not None and is_valid_command(content):
+            cache.put(cache_key, content)
+        if not history and is_valid_command(content):
+            semantic_cache.remember(config, shell, os_name, query, content)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning("Не удалось сохранить ответ в кэш: %s", e)
+    return content
+
+def build_messages(system_prompt, query, config=None, history=None):
+    import prompts
+    return [
+        prompts.system_message(system_prompt, config or {}),
+        *(history or []),
+        {"role": "user", "content": query}
+    ]
+
+def get_model_client(config):
+    # Провайдер выбирается параметром api в config.yaml (openrouter, groq, openai, azure, ollama, anthropic)
+    from ai_model import AIModel
+    return AIModel.get_model_client(config)
+
+def fetch_completion(config, messages):
+    # Без вывода и sys.exit: ошибки провайдера получает вызывающий код (например, пакетный режим)
+    return get_model_client(config).chat(messages, config['model'], config['temperature'], config['max_tokens'])
+
+def report_request_error(e):
+    import requests
+    from rich.panel import Panel
+    if isinstance(e, requests.exceptions.Timeout):
+        console.print(Panel("[bold red]Превышено время ожидания ответа от API[/bold red]", title="Ошибка", border_style="red"))
+    elif isinstance(e, requests.exceptions.HTTPError) and e.response is not None and e.response.status_code == 429:
+        console.print(Panel("[bold red]Превышен лимит запросов к API (429).[/bold red] Повторите позже или уменьшите rate_limit в config.yaml",
+                            title="Ошибка", border_style="red"))
+    else:
+        console.print(Panel(f"[bold red]Ошибка при выполнении запроса:[/bold red] {e}", title="Ошибка", border_style="red"))
+    sys.exit(-1)
+
+def request_chat_completion(config, messages):
+    from rich.progress import Progress
+    try:
+        start = time.monotonic()
         with Progress() as progress:
             task = progress.add_task("[cyan]Отправка запроса...", total=100)
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
+            content = fetch_completion(config, messages)
             progress.update(task, completed=100)
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content']
-    except requests.exceptions.Timeout:
-        console.print(Panel("[bold red]Превышено время ожидания ответа от API[/bold red]", title="Ошибка", border_style="red"))
-        sys.exit(-1)
-    except requests.exceptions.RequestException as e:
-        console.print(Panel(f"[bold red]Ошибка при выполнении запроса:[/bold red] {e}", title="Ошибка", border_style="red"))
-        sys.exit(-1)
+        record_request_metrics(start, None)
+        return content
+    except Exception as e:
+        report_request_error(e)
+
+def record_request_metrics(start, first_token_at):
+    import timings
+    end = time.monotonic()
+    last_request_metrics.clear()
+    last_request_metrics["ttft"] = (first_token_at or end) - start
+    last_request_metrics["total"] = end - start
+    # Отметки time.monotonic переводим в шкалу time.perf_counter, в которой ведутся интервалы
+    offset = time.perf_counter() - end
+    timings.record("first_token", start + offset, start + offset + last_request_metrics["ttft"])
+    timings.record("response", start + offset, end + offset)
+    logging.debug("ttft=%.3fs total=%.3fs", last_request_metrics["ttft"], last_request_metrics["total"])
+
+def command_panel(response):
+    from rich.panel import Panel
+    return Panel(f"[bold cyan]Команда:[/bold cyan] {response}", title="Предложенная команда", border_style="cyan")
+
+def stream_chat_completion(config, messages):
+    from contextlib import closing
+    from rich.live import Live
+    content = ""
+    first_token_at = None
+    issue_pending = True
+    try:
+        start = time.monotonic()
+        stream = get_model_client(config).stream_chat(messages, config['model'], config['temperature'], config['max_tokens'])
+        # transient: после завершения панель исчезает, итог показывает prompt_user_for_action
+        with closing(stream), Live(command_panel(""), console=console.get(), transient=True, refresh_per_second=12) as live:
+            for delta in stream:
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                content += delta
+                live.update(command_panel(content))
+                # Отклоняем плохой ответ по первым токенам, не дожидаясь окончания генерации
+                if issue_pending:
+                    check_for_issue(content)
+                    issue_pending = any(prefix.startswith(content.lower()) for prefix in ISSUE_PREFIXES)
+                check_for_markdown(content)
+        record_request_metrics(start, first_token_at)
+        return content
+    except Exception as e:
+        report_request_error(e)
+
+def hedged_chat_completion(config, messages):
+    import hedge
+    from rich.live import Live
+    try:
+        start = time.monotonic()
+        with Live(command_panel(""), console=console.get(), transient=True, refresh_per_second=12) as live:
+            content, stats = hedge.hedged_completion(config, messages, on_delta=lambda text: live.update(command_panel(text)))
+        record_request_metrics(start, start + stats["ttft"] if stats["ttft"] is not None else None)
+        last_request_metrics["hedged"] = stats["hedged"]
+        last_request_metrics["winner"] = stats["winner"]
+        return content
+    except Exception as e:
+        report_request_error(e)
+
+def candidate_chat_completion(config, messages, shell):
+    import candidates
+    from rich.progress import Progress
+    try:
+        start = time.monotonic()
+        with Progress() as progress:
+            task = progress.add_task(f"[cyan]Запрос {config['candidates']} вариантов команды...", total=100)
+            best, ranked = candidates.best_candidate(config, messages, shell)
+            progress.update(task, completed=100)
+        record_request_metrics(start, None)
+        last_request_metrics["candidates"] = len(ranked)
+        for candidate in ranked[1:]:
+            logging.debug("Вариант %d отклонён: %s", candidate.index, "; ".join(candidate.reasons))
+        return best.command
+    except Exception as e:
+        report_request_error(e)
+
+def is_issue_response(response):
+    return response.lower().startswith(ISSUE_PREFIXES)
+
+def has_markdown(response):
+    # Consider code fences as a sign that the model returned formatted text
+    return response.count("```") >= 2
+
+def is_valid_command(response):
+    return not is_issue_response(response) and not has_markdown(response)
 
 def check_for_issue(response):
-    prefixes = ("извините", "я извиняюсь", "вопрос не ясен", "я")
-    if response.lower().startswith(prefixes):
+    from rich.panel import Panel
+    if is_issue_response(response):
         console.print(Panel(f"[bold yellow]Возникла проблема:[/bold yellow] {response}", title="Предупреждение", border_style="yellow"))
         sys.exit(-1)
 
-def check_for_markdown(response):
-    # Consider code fences as a sign that the model returned formatted text
-    if response.count("```") >= 2:
+def check_for_markdown(response):
+    from rich.panel import Panel
+    from rich.syntax import Syntax
+    if has_markdown(response):
         console.print(Panel("[bold yellow]Предложенная команда содержит разметку, поэтому я не выполнил ответ напрямую:[/bold yellow]", title="Предупреждение", border_style="yellow"))
         syntax = Syntax(response, "markdown", theme="monokai", line_numbers=True)
         console.print(syntax)
         sys.exit(-1)
 
 def prompt_user_for_action(config, ask_flag, response):
-    console.print(Panel(f"[bold cyan]Команда:[/bold cyan] {response}", title="Предложенная команда", border_style="cyan"))
+    import candidates
+    console.print(command_panel(response))
+    dangerous = candidates.is_dangerous(response)
+    if dangerous:
+        console.print("[bold red]Команда похожа на опасную (удаление или перезапись системных данных, перезагрузка)[/bold red]")
     
     modify_snippet = " [и]зменить" if config['modify'] else ""
     copy_to_clipboard_snippet = " [к]опировать в буфер обмена"
     create_script_snippet = " [с]крипт"
 
-    if config['safety'] or ask_flag:
+    # Опасная команда, команда из офлайн-индекса или кэша похожих запросов и запуск на нескольких хостах
+    # всегда требуют подтверждения
+    if (config['safety'] or ask_flag or dangerous or "offline_hit" in last_request_metrics
+            or "semantic_hit" in last_request_metrics or config.get('hosts')):
         prompt_text = f"[bold]Выполнить команду?[/bold] [green][Д]а[/green] [red][н]ет[/red]{modify_snippet}{copy_to_clipboard_snippet}{create_script_snippet} ==> "
         return console.input(prompt_text)
     
     return "Д"
 
 def create_script(config, query, shell):
-    script_query = f"Создайте скрипт для {query}. Скрипт должен обрабатывать ошибки, предоставлять четкий вывод и работать надежно."
-    script_content = chat_completion(config, script_query, shell, is_script=True)
-    script_name = console.input("[bold cyan]Введите имя скрипта (без расширения):[/bold cyan] ")
-    
-    if platform.system() == "Windows":
-        script_extension = ".ps1"
-        run_command = f"powershell -ExecutionPolicy Bypass -File {script_name}{script_extension}"
-    else:
-        script_extension = ".sh"
-        run_command = f"bash {script_name}{script_extension}"
-    
-    script_path = os.path.join(os.getcwd(), f"{script_name}{script_extension}")
-    
-    with open(script_path, "w") as script_file:
-        script_file.write(script_content)
-    
-    if platform.system() != "Windows":
-        os.chmod(script_path, 0o755)  # Делаем скрипт исполняемым на Unix-подобных системах
-    
-    console.print(Panel(f"[bold green]Скрипт создан:[/bold green] {script_path}", title="Успех", border_style="green"))
-    console.print(f"[bold cyan]Для запуска скрипта используйте:[/bold cyan] {run_command}")
-    return script_path, run_command
+    # Скрипт пишется в файл по мере генерации, с продолжением после обрыва (см. script_gen.py)
+    import script_gen
+    return script_gen.create_script(config, query, shell, console)
 
 def eval_user_intent_and_execute(config, user_input, command, shell, ask_flag, query):
+    import history
     if user_input.upper() not in ["", "Д", "К", "И", "С"]:
         console.print("[bold yellow]Действие не выполнено.[/bold yellow]")
+        history.record(config, query, command, user_input, shell=shell, metrics=last_request_metrics,
+                       os_name=get_target_os_name(config))
         return
     
-    if user_input.upper() in ["Д", ""]:
-        try:
-            with Progress() as progress:
-                task = progress.add_task("[cyan]Выполнение команды...", total=100)
-                if platform.system() == "Windows":
-                    result = subprocess.run(["powershell", "-Command", command], shell=True, check=True, capture_output=True, text=True)
-                else:
-                    result = subprocess.run(["bash", "-c", command], shell=False, check=True, capture_output=True, text=True)
-                progress.update(task, completed=100)
-            console.print(Panel(result.stdout, title="Результат выполнения", border_style="green"))
-            if result.stderr:
-                console.print(Panel(result.stderr, title="Ошибки или предупреждения", border_style="yellow"))
-        except subprocess.CalledProcessError as e:
-            console.print(Panel(f"[bold red]Ошибка выполнения команды:[/bold red] {e}", title="Ошибка", border_style="red"))
-            if e.output:
-                console.print(Panel(e.output, title="Вывод", border_style="yellow"))
-            if e.stderr:
-                console.print(Panel(e.stderr, title="Вывод ошибки", border_style="red"))
+    exit_code = None
+    if user_input.upper() in ["Д", ""] and config.get('hosts'):
+        import multihost
+        import timings
+        with timings.span("execute", hosts=len(config['hosts'])) as attributes:
+            attributes["failed"] = multihost.count_failed(multihost.execute(command, console, config))
+        exit_code = 1 if attributes["failed"] else 0
+    elif user_input.upper() in ["Д", ""]:
+        import executor
+        import timings
+        with timings.span("execute") as attributes:
+            attributes["returncode"] = executor.execute(command, console, config).returncode
+        exit_code = attributes["returncode"]
+        if exit_code == 0:
+            learn_command(config, shell, query, command)
+    # Запись уходит в фоновый поток (history.py) и не задерживает следующий шаг
+    history.record(config, query, command, user_input, exit_code, shell=shell, metrics=last_request_metrics,
+                   os_name=get_target_os_name(config))
     
     if config['modify'] and user_input.upper() == "И":
         modded_query = console.input("[bold cyan]Измените запрос:[/bold cyan] ")
-        modded_response = chat_completion(config, modded_query, shell)
+        modded_response = refine_completion(config, modded_query, shell)
         check_for_issue(modded_response)
         check_for_markdown(modded_response)
+        remember_turn(config, modded_query, modded_response)
         user_intent = prompt_user_for_action(config, ask_flag, modded_response)
         console.print()
         eval_user_intent_and_execute(config, user_intent, modded_response, shell, ask_flag, modded_query)
@@ -284,14 +487,60 @@ def eval_user_intent_and_execute(config, user_input, command, shell, ask_flag, q
             console.print("[bold red]Не удалось скопировать в буфер обмена. Убедитесь, что у вас установлены необходимые зависимости.[/bold red]")
     
     if user_input.upper() == "С":
-        script_path, run_command = create_script(config, query, shell)
-        console.print(f"[bold cyan]Для запуска скрипта используйте:[/bold cyan] {run_command}")
+        create_script(config, query, shell)
+
+def refine_completion(config, query, shell):
+    # Уточнение отправляется вместе с предыдущими запросами и командами этой сессии терминала
+    import session
+    current = session.get_session(config)
+    if current is None or current.last() is None:
+        return chat_completion(config, query, shell)
+    return chat_completion(config, session.refine_query(query), shell, history=current.messages())
+
+def remember_turn(config, query, command):
+    import session
+    current = session.get_session(config)
+    if current is not None:
+        try:
+            current.add(query, command)
+        except OSError as e:
+            logging.debug("Не удалось сохранить сессию: %s", e)
+
+def learn_command(config, shell, query, command):
+    # Команда, выполненная без ошибок, пополняет офлайн-индекс (offline_index.py)
+    import offline_index
+    try:
+        offline_index.remember(config, shell, get_target_os_name(config), query, command)
+    except OSError as e:
+        logging.debug("Не удалось пополнить офлайн-индекс: %s", e)
+
+def show_history(config, search, json_output=False):
+    import history
+    entries = history.search(config, search)
+    if json_output:
+        import json
+        for entry in entries:
+            print(json.dumps(entry, ensure_ascii=False))
+    elif entries:
+        history.print_entries(console, entries)
+    else:
+        console.print("[bold yellow]В истории ничего не найдено.[/bold yellow]")
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="CLI tool for interacting with OpenRouter API.")
     parser.add_argument("-a", "--ask", help="Запрашивать подтверждение перед выполнением команды", action="store_true")
-    parser.add_argument("-k", "--key", help="Изменить API ключ OpenRouter", action="store_true")
-    parser.add_argument("-v", "--version", help="Показать версию программы", action="store_true")
+    parser.add_argument("-k", "--key", help="Изменить API ключ OpenRouter", action="store_true")
+    parser.add_argument("-v", "--version", help="Показать версию программы", action="store_true")
+    parser.add_argument("-r", "--refine", help="Уточнить последнюю команду этого терминала", action="store_true")
+    parser.add_argument("--no-cache", help="Не использовать локальный кэш ответов", action="store_true")
+    parser.add_argument("--batch", metavar="FILE", help="Перевести запросы из файла (или - для stdin) в команды без выполнения, результат в JSONL")
+    parser.add_argument("--batch-unordered", help="Выводить результаты пакетного режима по мере готовности", action="store_true")
+    parser.add_argument("--pipe", help="Неинтерактивный режим: ответить на вопрос по данным из stdin (включается сам, если stdin не терминал)", action="store_true")
+    parser.add_argument("--json", help="Вывод неинтерактивного режима в JSON", action="store_true")
+    parser.add_argument("--hosts", metavar="HOSTS", help="Выполнить команду по ssh на хостах: список через запятую или @файл")
+    parser.add_argument("--history", metavar="SEARCH", nargs="?", const="", help="Найти в истории запросов и команд (без SEARCH — последние записи)")
+    parser.add_argument("--history-export", help="Передать успешные команды из истории в кэш и офлайн-индекс", action="store_true")
+    parser.add_argument("--timings", help="Показать время выполнения этапов", action="store_true")
     parser.add_argument("query", nargs="*", help="Ваш вопрос или команда")
     
     return parser.parse_args()
@@ -299,20 +548,74 @@ def parse_arguments():
 def main():
     reset_console()  # Сброс настроек консоли в начале выполнения
 
-    config = read_config()
+    # Аргументы разбираются до загрузки конфигурации: --version, --help и ошибки аргументов
+    # не импортируют rich/requests/yaml и не обращаются к сети
+    args = parse_arguments()
+    if args.version:
+        print(f"IOP CLI version {VERSION}")
+        sys.exit(0)
+
+    import timings
+    timings.reset()  # процесс демона мог унаследовать интервалы от прогрева
+    config = {}
+    try:
+        with timings.span("read_config"):
+            config = read_config()
+        run(config, args)
+    finally:
+        timings.report(console, config, show_table=args.timings)
+
+def run(config, args):
+    from rich.panel import Panel
+    import timings
     shell = "bash" if platform.system() != "Windows" else "powershell"
 
-    args = parse_arguments()
-    ask_flag = args.ask
-    change_key_flag = args.key
-    if args.version:
-        console.print(f"IOP CLI version {VERSION}")
-        sys.exit(0)
-    user_prompt = " ".join(args.query)
+    ask_flag = args.ask
+    change_key_flag = args.key
+    if args.no_cache:
+        config['cache'] = False
+    if args.hosts:
+        import multihost
+        try:
+            config['hosts'] = multihost.parse_hosts(args.hosts)
+        except OSError as e:
+            console.print(Panel(f"[bold red]Не удалось прочитать список хостов:[/bold red] {e}", title="Ошибка", border_style="red"))
+            sys.exit(-1)
+        shell = "bash"  # команда выполняется на удалённых Unix-хостах
+
+    if args.history is not None:
+        show_history(config, " ".join([args.history, *args.query]), args.json)
+        sys.exit(0)
+    if args.history_export:
+        import history
+        count = history.export(config, shell, get_target_os_name(config))
+        console.print(f"[bold green]Из истории передано команд:[/bold green] {count}")
+        sys.exit(0)
+
+    if args.batch:
+        import batch
+        try:
+            summary = batch.run_batch(config, args.batch, shell, ordered=not args.batch_unordered)
+        except (OSError, UnicodeDecodeError) as e:
+            console.print(Panel(f"[bold red]Не удалось прочитать файл запросов:[/bold red] {e}", title="Ошибка", border_style="red"))
+            sys.exit(-1)
+        sys.exit(1 if summary["failed"] else 0)
+    user_prompt = " ".join(args.query)
+
+    # some_cmd | iop "вопрос": stdin — контекст вопроса, без rich и интерактивных подтверждений
+    # Без --pipe режим включается, только если в stdin есть данные (cron, CI и </dev/null — обычный путь)
+    use_pipe = args.pipe
+    if not use_pipe and user_prompt and not change_key_flag and not sys.stdin.isatty():
+        import pipe
+        use_pipe = pipe.stdin_has_input()
+    if use_pipe:
+        import pipe
+        code = pipe.run_pipe(config, user_prompt, json_output=args.json)
+        sys.exit(code)
 
     if change_key_flag:
         console.print(Panel("[bold cyan]Изменение API ключа OpenRouter[/bold cyan]", border_style="cyan"))
-        new_api_key = get_api_key()
+        new_api_key = get_api_key(config)
         update_env_file(new_api_key)
         console.print("[bold green]API ключ успешно обновлен.[/bold green]")
         sys.exit(0)
@@ -327,9 +630,14 @@ def main():
         console.print(Panel(f"[bold red]{str(e)}[/bold red]", title="Ошибка", border_style="red"))
         sys.exit(-1)
 
-    result = chat_completion(config, user_prompt, shell)
-    check_for_issue(result)
-    check_for_markdown(result)
+    if args.refine:
+        result = refine_completion(config, user_prompt, shell)
+    else:
+        result = chat_completion(config, user_prompt, shell)
+    with timings.span("validation"):
+        check_for_issue(result)
+        check_for_markdown(result)
+    remember_turn(config, user_prompt, result)
 
     users_intent = prompt_user_for_action(config, ask_flag, result)
     console.print()
@@ -341,4 +649,9 @@ def main():
         console.print("\n" * 2)  # Добавляем две пустые строки в конце для CMD
 
 if __name__ == "__main__":
-    main()
+    import iopd
+    exit_code = iopd.run_via_daemon(sys.argv)  # None, если демон не запущен
+    if exit_code is None:
+        main()
+    else:
+        sys.exit(exit_code)
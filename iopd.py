@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+# Фоновый демон IOP: держит прогретые модули, конфигурацию, системные промпты и кэш в памяти.
+# Клиент (iop.py) передаёт через Unix-сокет argv, cwd, окружение и свои stdin/stdout/stderr;
+# демон выполняет запрос в дочернем процессе (fork), который пишет прямо в терминал клиента.
+
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+from paths import user_cache_dir
+
+HEADER = struct.Struct("!I")
+STATUS = struct.Struct("!i")
+
+
+def socket_path():
+    if os.environ.get("IOPD_SOCKET"):
+        return os.environ["IOPD_SOCKET"]
+    base = os.environ.get("XDG_RUNTIME_DIR") or user_cache_dir()
+    return os.path.join(base, "iopd.sock")
+
+
+def recv_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Соединение с iopd закрыто")
+        data += chunk
+    return data
+
+
+def run_via_daemon(argv):
+    # Возвращает код завершения, либо None, если демон недоступен и нужно выполниться в процессе
+    if os.environ.get("IOP_NO_DAEMON") or not hasattr(socket, "send_fds"):
+        return None
+    try:
+        path = socket_path()
+    except OSError:
+        return None  # каталог кэша недоступен: демона там быть не может, выполняемся в процессе
+    if not os.path.exists(path):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+        request = json.dumps({"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}).encode("utf-8")
+        socket.send_fds(conn, [HEADER.pack(len(request))], [0, 1, 2])
+        conn.sendall(request)
+        child_pid = STATUS.unpack(recv_exact(conn, STATUS.size))[0]
+    except OSError:
+        conn.close()
+        return None
+    with conn:
+        while True:
+            try:
+                return STATUS.unpack(recv_exact(conn, STATUS.size))[0]
+            except KeyboardInterrupt:
+                # Ctrl-C приходит клиенту, пересылаем его процессу, выполняющему запрос
+                os.kill(child_pid, signal.SIGINT)
+            except ConnectionError:
+                return 1
+
+
+def warm_up():
+    import iop
+    import http_client
+    from response_cache import get_response_cache
+
+    shell = "bash" if iop.platform.system() != "Windows" else "powershell"
+    iop.get_system_prompt(shell)
+    iop.get_system_prompt(shell, is_script=True)
+    env_path = os.path.join(os.path.dirname(os.path.abspath(iop.__file__)), ".env")
+    if os.path.exists(env_path):
+        # Без .env read_config запросил бы ключ интерактивно; это сделает клиент при первом вызове
+        config = iop.read_config()
+        http_client.get_session(config)
+        get_response_cache(config)
+    return iop
+
+
+def handle_client(conn, iop):
+    # Выполняется в дочернем процессе: подменяем stdio, каталог и окружение на клиентские
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    msg, fds, _, _ = socket.recv_fds(conn, HEADER.size, 3)
+    if len(msg) < HEADER.size:
+        msg += recv_exact(conn, HEADER.size - len(msg))
+    request = json.loads(recv_exact(conn, HEADER.unpack(msg)[0]).decode("utf-8"))
+    for target, fd in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    if sys.stdout.isatty():
+        sys.stdout.reconfigure(line_buffering=True)
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    sys.argv = request["argv"]
+    conn.sendall(STATUS.pack(os.getpid()))
+
+    iop.setup_console()
+    exit_code = 0
+    try:
+        iop.main()
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            exit_code = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except KeyboardInterrupt:
+        exit_code = 130
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    conn.sendall(STATUS.pack(exit_code))
+    # Дочерний процесс завершается через os._exit без atexit: историю дописываем, когда клиент уже отпущен
+    history = sys.modules.get("history")
+    if history is not None:
+        history.flush()
+
+
+def peer_is_same_user(conn):
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True  # на macOS доступ ограничивают права 0600 на сокет
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1] == os.getuid()
+
+
+def serve(path):
+    if not hasattr(os, "fork") or not hasattr(socket, "recv_fds"):
+        print("iopd не поддерживается на этой платформе", file=sys.stderr)
+        return 1
+    iop = warm_up()
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            print(f"iopd уже запущен: {path}", file=sys.stderr)
+            return 1
+        except OSError:
+            os.unlink(path)  # сокет остался от завершившегося демона
+        finally:
+            probe.close()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(old_umask)
+    listener.listen(16)
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # дочерние процессы убираются автоматически
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        while True:
+            conn, _ = listener.accept()
+            if not peer_is_same_user(conn):
+                conn.close()
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            if os.fork() == 0:
+                listener.close()
+                try:
+                    handle_client(conn, iop)
+                finally:
+                    os._exit(0)
+            conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if os.path.exists(path):
+            os.unlink(path)
+    return 0
+
+
+def detach():
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фоновый демон IOP для ускорения запуска iop.")
+    parser.add_argument("--socket", help="Путь к Unix-сокету демона", default=None)
+    parser.add_argument("--detach", help="Запустить в фоне", action="store_true")
+    args = parser.parse_args()
+
+    path = args.socket or socket_path()
+    if args.detach:
+        detach()
+    sys.exit(serve(path))
+
+
+if __name__ == "__main__":
+    main()
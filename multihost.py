@@ -0,0 +1,135 @@
+# Выполнение команды на нескольких хостах: для каждого хоста запускается отдельный процесс ssh,
+# одновременно работают не больше multihost_concurrency процессов. Вывод каждого хоста идёт
+# построчно с префиксом имени хоста, у каждого хоста свой таймаут; в конце — таблица с кодами
+# завершения и временем. Команда ssh задаётся параметром ssh_command, поэтому её можно заменить
+# заглушкой (см. tests/fake_ssh.py).
+
+import shlex
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+DEFAULT_SSH_COMMAND = "ssh -o BatchMode=yes -o ConnectTimeout=10"
+DEFAULT_CONCURRENCY = 8
+DEFAULT_OS = "Linux"  # ОС удалённых хостов для промпта и ключей кэшей, если не задан hosts_os
+SSH_ERROR = 255  # код ssh при ошибке соединения
+HOST_STYLES = ("cyan", "magenta", "green", "blue", "bright_cyan", "bright_magenta")
+
+
+def parse_hosts(spec):
+    # "web1,web2 db1" или "@hosts.txt" (по хосту в строке, # — комментарий); повторы отбрасываются
+    if spec.startswith("@"):
+        with open(spec[1:], "r", encoding="utf-8") as file:
+            spec = "\n".join(line.split("#", 1)[0] for line in file)
+    hosts = []
+    for host in spec.replace(",", " ").split():
+        if host not in hosts:
+            hosts.append(host)
+    return hosts
+
+
+def ssh_argv(config, host, command):
+    # host[:port] превращается в -p port host; BatchMode не даёт ssh ждать пароль в параллельных процессах
+    argv = shlex.split(config.get("ssh_command") or DEFAULT_SSH_COMMAND)
+    name, _, port = host.rpartition(":")
+    if name and port.isdigit() and ":" not in name:
+        argv += ["-p", port]
+        host = name
+    return argv + [host, command]
+
+
+def run_host(config, host, command, on_line):
+    import executor
+
+    try:
+        return executor.run_streaming(
+            ssh_argv(config, host, command),
+            on_line=on_line,
+            timeout=config.get("multihost_timeout") or config.get("exec_timeout") or None,
+            output_cap=config.get("exec_output_cap") or None,
+            stdin=subprocess.DEVNULL,  # параллельные ssh не должны делить терминал
+        )
+    except OSError as e:
+        result = executor.ExecutionResult()
+        result.returncode = SSH_ERROR
+        result.tail.append(("stderr", str(e)))
+        on_line("stderr", str(e))
+        return result
+
+
+def succeeded(result):
+    return result is not None and result.returncode == 0 and not result.timed_out
+
+
+def count_failed(results):
+    return sum(1 for _, result in results if not succeeded(result))
+
+
+def run_hosts(config, hosts, command, on_line):
+    # Возвращает [(хост, ExecutionResult или None для незапущенных)] в порядке hosts
+    concurrency = max(1, min(config.get("multihost_concurrency", DEFAULT_CONCURRENCY), len(hosts)))
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    futures = [pool.submit(run_host, config, host, command, lambda stream, text, host=host: on_line(host, stream, text))
+               for host in hosts]
+    try:
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.1)
+    except KeyboardInterrupt:
+        # Ctrl-C получает вся группа процессов, запущенные ssh завершатся сами; ждущие хосты не запускаем
+        for future in futures:
+            future.cancel()
+    finally:
+        pool.shutdown(wait=True)
+    return [(host, None if future.cancelled() else future.result()) for host, future in zip(hosts, futures)]
+
+
+def execute(command, console, config):
+    from rich.text import Text
+
+    hosts = config["hosts"]
+    width = max(len(host) for host in hosts)
+    styles = {host: HOST_STYLES[index % len(HOST_STYLES)] for index, host in enumerate(hosts)}
+    lock = threading.Lock()
+
+    def print_line(host, stream, text):
+        line = Text(f"{host:<{width}} | ", style=styles[host])
+        line.append(text, style="yellow" if stream == "stderr" else "")
+        with lock:
+            console.print(line, soft_wrap=True)
+
+    console.print(f"[bold cyan]Выполнение на хостах ({len(hosts)}):[/bold cyan] {', '.join(hosts)}")
+    results = run_hosts(config, hosts, command, print_line)
+    print_summary(console, results)
+    return results
+
+
+def status_text(result):
+    if result is None:
+        return "[yellow]не запущено[/yellow]"
+    if result.timed_out:
+        return "[red]таймаут[/red]"
+    if result.interrupted:
+        return "[yellow]прервано[/yellow]"
+    if result.returncode == SSH_ERROR:
+        return "[red]ошибка ssh[/red]"
+    return "[green]успех[/green]" if result.returncode == 0 else "[red]ошибка[/red]"
+
+
+def print_summary(console, results):
+    from rich.table import Table
+
+    failed = count_failed(results)
+    table = Table(title="Результаты на хостах", caption=f"успешно: {len(results) - failed}, с ошибкой: {failed}")
+    table.add_column("Хост", style="cyan")
+    table.add_column("Код", justify="right")
+    table.add_column("Время, с", justify="right")
+    table.add_column("Статус")
+    table.add_column("Вывод")
+    for host, result in results:
+        if result is None:
+            table.add_row(host, "-", "-", status_text(result), "")
+            continue
+        note = f"полностью в {result.spill_path}" if result.spill_path else ""
+        table.add_row(host, str(result.returncode), f"{result.duration:.2f}", status_text(result), note)
+    console.print(table)
@@ -0,0 +1,317 @@
+# Офлайн-индекс команд: курируемые шаблоны «запрос → команда» (offline_commands.json) для
+# текущих shell и ОС вместе с командами, которые пользователь выполнил без ошибок, собираются
+# в инвертированный индекс BM25. Индекс хранится в каталоге кэша одним бинарным файлом (marshal)
+# и пересобирается, когда меняется исходный JSON или список принятых команд. Уверенное совпадение
+# отвечает без сети и без модели, но всегда ждёт явного подтверждения в prompt_user_for_action.
+# Совпадение засчитывается, только если действие в запросе (удалить, остановить, показать…)
+# и аргументы (числа, пути, имена файлов) те же, что и в шаблоне: «покажи все файлы» не должно
+# найти «удали все файлы», а «самые большие файлы в /home» — команду для текущего каталога.
+
+import hashlib
+import json
+import logging
+import marshal
+import math
+import os
+from array import array
+
+from paths import user_cache_dir
+
+SOURCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "offline_commands.json")
+FORMAT_VERSION = 1
+DEFAULT_THRESHOLD = 0.75
+DEFAULT_MAX_LEARNED = 500
+K1 = 1.2
+B = 0.75
+MIN_STEM = 3
+
+RU_ENDINGS = sorted(
+    "ами ями ого его ому ему ов ев ей ий ый ой ая яя ое ее ые ие ых их ую юю ом ем ах ях ам ям "
+    "а я о е ы и у ю ь й".split(),
+    key=len, reverse=True,
+)
+
+# Глаголы действий: английские слова сравниваются после stem(), русские — по началу слова.
+# Просмотр (показать, найти, посчитать) совпадает и с запросом без глагола: «свободное место
+# на диске?» спрашивает то же, что «покажи свободное место на диске».
+ACTIONS = {
+    "show": ("show print display view list ls cat", "покаж показ вывед вывест вывод отобраз распечат"),
+    "find": ("find search locate grep", "найд найт ищ поиск отыщ"),
+    "count": ("count", "посчит подсчит сосчит"),
+    "delete": ("delete remove remov rm rmdir erase wipe clean clear purge uninstall unlink",
+               "удали удаля удаление сотри стери стере очисти почисти снеси"),
+    "kill": ("kill killall pkill terminate", "убей убить убива прибей заверши"),
+    "stop": ("stop halt shutdown", "останови выключи"),
+    "start": ("start launch", "запусти запуск стартуй"),
+    "restart": ("restart reboot reload", "перезапус перезагр"),
+    "enable": ("enable", "включи"),
+    "disable": ("disable", "отключи"),
+    "create": ("create make mkdir touch", "создай создат"),
+    "copy": ("copy cp", "скопир копируй"),
+    "move": ("move mv rename", "перемести перенеси переименуй"),
+    "compress": ("compress archive zip tar gzip pack", "сожми сжать заархивир архивир запакуй"),
+    "extract": ("extract unzip unpack untar", "распакуй распаковат извлеки извлечь разархивир"),
+    "install": ("install", "установи устанавл"),
+    "update": ("update upgrade", "обнови"),
+    "download": ("download fetch", "скачай скачат"),
+    "change": ("change edit modify chmod chown", "измени поменяй отредактир"),
+}
+VIEW_ACTIONS = frozenset(("show", "find", "count"))
+EN_ACTIONS = {word: action for action, (en, _) in ACTIONS.items() for word in en.split()}
+RU_ACTIONS = [(prefix, action) for action, (_, ru) in ACTIONS.items() for prefix in ru.split()]
+
+
+def stem(word):
+    # Грубое отсечение окончаний: «файлов», «файлы» и «файл» дают один терм
+    if word.isascii():
+        if word.endswith(("ies", "ied")) and len(word) > 4:
+            return word[:-3] + "y"
+        if word.endswith(("sses", "xes", "ches", "shes")):
+            return word[:-2]
+        if word.endswith("ing") and len(word) - 3 >= 4:
+            return word[:-3]
+        if word.endswith("s") and not word.endswith("ss") and len(word) > MIN_STEM:
+            return word[:-1]
+        return word
+    for ending in RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def terms(text):
+    from semantic_cache import tokenize
+    return [stem(word) for word in tokenize(text)]
+
+
+def actions(text):
+    # Действия, которые просит запрос, без действий просмотра
+    from semantic_cache import TOKEN_RE
+    found = set()
+    for word in TOKEN_RE.findall(text.lower()):
+        if word.isascii():
+            action = EN_ACTIONS.get(word) or EN_ACTIONS.get(stem(word))
+        else:
+            action = next((action for prefix, action in RU_ACTIONS if word.startswith(prefix)), None)
+        if action is not None:
+            found.add(action)
+    return frozenset(found - VIEW_ACTIONS)
+
+
+def os_scopes(os_name):
+    # "Linux/Ubuntu 22.04 LTS" → ["linux/ubuntu", "linux", "unix"]; от частного к общему
+    family, _, release = os_name.partition("/")
+    family = family.lower()
+    if family == "linux":
+        distro = release.split()[0].lower() if release.split() else ""
+        return ([f"linux/{distro}"] if distro else []) + ["linux", "unix"]
+    if family == "darwin":
+        return ["darwin", "unix"]
+    return [family]
+
+
+def scope_name(shell, os_name):
+    return hashlib.sha256(f"{shell}\0{os_name}".encode("utf-8")).hexdigest()[:16]
+
+
+def index_paths(shell, os_name):
+    # Возвращает (путь скомпилированного индекса, путь списка принятых команд)
+    directory = os.path.join(user_cache_dir(), "offline")
+    os.makedirs(directory, exist_ok=True)
+    base_path = os.path.join(directory, scope_name(shell, os_name))
+    return base_path + ".bin", base_path + ".learned.jsonl"
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def read_learned(path):
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            lines = file.readlines()
+    except OSError:
+        return []
+    items = []
+    for line in lines:
+        try:
+            item = json.loads(line)
+            items.append((item["query"], item["command"]))
+        except (ValueError, KeyError, TypeError):
+            continue  # оборванная запись
+    return items
+
+
+def source_entries(shell, os_name, learned, source_path):
+    # Принятые пользователем команды (новые первыми) важнее шаблонов, частные области ОС — общих
+    yield from reversed(learned)
+    try:
+        with open(source_path, "r", encoding="utf-8") as file:
+            templates = json.load(file).get(shell, {})
+    except (OSError, ValueError):
+        return
+    for scope in os_scopes(os_name):
+        for item in templates.get(scope, []):
+            for query in item["queries"]:
+                yield query, item["command"]
+
+
+def build(entries):
+    # Документ — один вариант запроса; одинаковый набор термов оставляет только первый вариант
+    commands, command_ids, queries, seen = [], {}, [], set()
+    doc_commands, doc_lengths, doc_terms = array("I"), array("H"), []
+    postings = {}
+    for query, command in entries:
+        words = terms(query)
+        unique = frozenset(words)
+        if not words or unique in seen:
+            continue
+        seen.add(unique)
+        if command not in command_ids:
+            command_ids[command] = len(commands)
+            commands.append(command)
+        doc = len(queries)
+        queries.append(query)
+        doc_commands.append(command_ids[command])
+        doc_lengths.append(min(len(words), 0xFFFF))
+        doc_terms.append(unique)
+        for word in unique:
+            postings.setdefault(word, array("I")).extend((doc, words.count(word)))
+
+    count = len(queries)
+    idf = {word: math.log((count - len(docs) // 2 + 0.5) / (len(docs) // 2 + 0.5) + 1) for word, docs in postings.items()}
+    doc_weights = array("d", (sum(idf[word] for word in unique) for unique in doc_terms))
+    return {
+        "commands": commands,
+        "queries": queries,
+        "doc_commands": doc_commands.tobytes(),
+        "doc_lengths": doc_lengths.tobytes(),
+        "doc_weights": doc_weights.tobytes(),
+        "avgdl": sum(doc_lengths) / count if count else 0.0,
+        "postings": {word: docs.tobytes() for word, docs in postings.items()},
+    }
+
+
+class OfflineIndex:
+    def __init__(self, data):
+        self.commands = data["commands"]
+        self.queries = data["queries"]
+        self.doc_commands = array("I", data["doc_commands"])
+        self.doc_lengths = array("H", data["doc_lengths"])
+        self.doc_weights = array("d", data["doc_weights"])
+        self.avgdl = data["avgdl"]
+        self.postings = data["postings"]
+
+    def search(self, query):
+        # Лучший по BM25 документ с теми же действием и аргументами и уверенность: взвешенная по idf доля
+        # общих термов запроса и шаблона
+        words = terms(query)
+        count = len(self.queries)
+        if not words or not count:
+            return None
+        scores, matched, query_weight = {}, {}, 0.0
+        for word in set(words):
+            packed = self.postings.get(word)
+            docs = array("I", packed) if packed else ()
+            frequency = len(docs) // 2
+            idf = math.log((count - frequency + 0.5) / (frequency + 0.5) + 1)
+            query_weight += idf
+            for i in range(0, len(docs), 2):
+                doc, tf = docs[i], docs[i + 1]
+                norm = K1 * (1 - B + B * self.doc_lengths[doc] / self.avgdl)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+                matched[doc] = matched.get(doc, 0.0) + idf
+        from semantic_cache import signature
+        wanted = signature(query)
+        doc = next((d for d in sorted(scores, key=lambda d: (-scores[d], d)) if signature(self.queries[d]) == wanted), None)
+        if doc is None:
+            return None
+        confidence = matched[doc] / (query_weight + self.doc_weights[doc] - matched[doc])
+        return confidence, doc
+
+    def entry(self, doc):
+        return self.queries[doc], self.commands[self.doc_commands[doc]]
+
+
+def enabled(config):
+    return config.get("offline_index", True) and config.get("cache", True)
+
+
+def get_index(config, shell, os_name):
+    if not enabled(config):
+        return None
+    try:
+        index_path, learned_path = index_paths(shell, os_name)
+    except OSError as e:
+        logging.warning("Офлайн-индекс недоступен: %s", e)
+        return None
+    max_learned = config.get("offline_index_max_learned", DEFAULT_MAX_LEARNED)
+    stamp = (FORMAT_VERSION, SOURCE_FILE, file_stamp(SOURCE_FILE), file_stamp(learned_path), max_learned)
+    try:
+        with open(index_path, "rb") as file:
+            data = marshal.load(file)
+        if data.get("stamp") == stamp:
+            return OfflineIndex(data)
+    except (OSError, ValueError, EOFError, TypeError, AttributeError):
+        pass  # индекса нет, он устарел или повреждён — собираем заново
+
+    learned = read_learned(learned_path)[-max_learned:] if max_learned > 0 else []
+    data = build(source_entries(shell, os_name, learned, SOURCE_FILE))
+    data["stamp"] = stamp
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            marshal.dump(data, file)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        pass  # каталог кэша недоступен для записи: индекс работает из памяти
+    return OfflineIndex(data)
+
+
+def lookup(config, shell, os_name, query):
+    # Возвращает (команда, шаблон запроса, уверенность) или None
+    index = get_index(config, shell, os_name)
+    if index is None:
+        return None
+    found = index.search(query)
+    if found is None or found[0] < config.get("offline_index_threshold", DEFAULT_THRESHOLD):
+        return None
+    matched_query, command = index.entry(found[1])
+    return command, matched_query, found[0]
+
+
+def remember(config, shell, os_name, query, command):
+    # Команда, выполненная без ошибок, становится шаблоном для этого запроса
+    remember_many(config, shell, os_name, [(query, command)])
+
+
+def remember_many(config, shell, os_name, pairs):
+    # Пары, которые индекс и так отвечает той же командой, не дописываются
+    index = get_index(config, shell, os_name)
+    if index is None:
+        return 0
+    threshold = config.get("offline_index_threshold", DEFAULT_THRESHOLD)
+    lines = []
+    for query, command in pairs:
+        found = index.search(query)
+        if found is not None and found[0] >= threshold and index.entry(found[1])[1] == command:
+            continue
+        lines.append(json.dumps({"query": query, "command": command}, ensure_ascii=False) + "\n")
+    if not lines:
+        return 0
+    _, learned_path = index_paths(shell, os_name)
+    max_learned = config.get("offline_index_max_learned", DEFAULT_MAX_LEARNED)
+    with open(learned_path, "a", encoding="utf-8") as file:
+        file.writelines(lines)
+    learned = read_learned(learned_path)
+    if len(learned) > 2 * max(max_learned, 1):
+        tmp_path = f"{learned_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for item_query, item_command in learned[-max_learned:]:
+                file.write(json.dumps({"query": item_query, "command": item_command}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, learned_path)
+    return len(lines)
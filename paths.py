@@ -0,0 +1,15 @@
+import os
+import platform
+
+
+def user_cache_dir():
+    # Каталог кэша пользователя: %LOCALAPPDATA%\iop, ~/Library/Caches/iop или $XDG_CACHE_HOME/iop
+    if platform.system() == "Windows":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif platform.system() == "Darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    path = os.path.join(base, "iop")
+    os.makedirs(path, exist_ok=True)
+    return path
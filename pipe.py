@@ -0,0 +1,223 @@
+# Неинтерактивный режим: some_cmd | iop "вопрос". Стандартный ввод читается потоком и служит
+# контекстом вопроса; вывод — простой текст или JSON без rich, результат передаётся кодом возврата.
+# Вход делится на фрагменты по бюджету токенов. Один фрагмент отправляется одним запросом, больше —
+# map-reduce: фрагменты обрабатываются параллельно по мере чтения, заметки затем сводятся в ответ.
+# Память ограничена: в работе не больше 2 × pipe_concurrency фрагментов, а после pipe_max_chunks
+# фрагментов от остатка входа хранится только скользящий хвост.
+
+import json
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_LINE_BYTES = 16 * 1024
+DEFAULT_CHUNK_TOKENS = 8000
+DEFAULT_MAX_CHUNKS = 32
+DEFAULT_CONCURRENCY = 4
+STDIN_WAIT = 0.5
+
+EXIT_OK = 0
+EXIT_REQUEST_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_INPUT = 3
+EXIT_INTERRUPTED = 130
+
+
+class InputStats:
+    def __init__(self):
+        self.bytes = 0
+        self.lines = 0
+        self.skipped_lines = 0
+        self.chunks = 0
+
+
+def read_chunks(stream, count_tokens, chunk_tokens, max_chunks, stats):
+    # Генератор текстов фрагментов. Первые max_chunks - 1 фрагментов идут подряд, затем
+    # строки проходят через хвост размером в один фрагмент, вытесняемые строки пропускаются
+    lines, tokens = [], 0
+    tail = None
+    for raw in iter(lambda: stream.readline(MAX_LINE_BYTES), b""):
+        stats.bytes += len(raw)
+        stats.lines += 1
+        line = raw.decode("utf-8", errors="replace")
+        size = count_tokens(line)
+        if tail is None and lines and tokens + size > chunk_tokens:
+            stats.chunks += 1
+            yield "".join(lines)
+            lines, tokens = [], 0
+            if stats.chunks >= max_chunks - 1:
+                tail = deque()
+        if tail is None:
+            lines.append(line)
+            tokens += size
+            continue
+        tail.append((line, size))
+        tokens += size
+        while tokens > chunk_tokens and len(tail) > 1:
+            tokens -= tail.popleft()[1]
+            stats.skipped_lines += 1
+    if tail:
+        lines = [line for line, _ in tail]
+        if stats.skipped_lines:
+            lines.insert(0, f"[... пропущено строк: {stats.skipped_lines} ...]\n")
+    if lines:
+        stats.chunks += 1
+        yield "".join(lines)
+
+
+def ask(config, stage, query, context):
+    import iop
+    import prompts
+
+    messages = [
+        prompts.system_message(prompts.pipe_prompt(stage, iop.get_os_friendly_name()), config),
+        {"role": "user", "content": f"Вопрос: {query}\n\nВходные данные:\n{context}"},
+    ]
+    return iop.fetch_completion(config, messages)
+
+
+def map_chunks(config, query, chunks, concurrency):
+    # Фрагменты отправляются по мере чтения; семафор не даёт читать вход быстрее, чем идут ответы
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            for chunk in chunks:
+                slots.acquire()
+                future = pool.submit(ask, config, "map", query, chunk)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def trim_note(note, count_tokens, budget):
+    size = count_tokens(note)
+    if size <= budget:
+        return note
+    return note[:len(note) * budget // size] + " ..."
+
+
+def reduce_notes(config, query, notes, count_tokens, chunk_tokens, concurrency):
+    # Заметки, не помещающиеся в один запрос, сводятся группами, пока не останется одна группа.
+    # Каждая заметка урезается до четверти фрагмента, так что за раунд групп становится вчетверо меньше
+    while True:
+        groups, group, tokens = [], [], 0
+        for index, note in enumerate(notes, 1):
+            text = f"Фрагмент {index}: {trim_note(note.strip(), count_tokens, chunk_tokens // 4)}\n"
+            size = count_tokens(text)
+            if group and tokens + size > chunk_tokens:
+                groups.append("".join(group))
+                group, tokens = [], 0
+            group.append(text)
+            tokens += size
+        groups.append("".join(group))
+        if len(groups) == 1:
+            return ask(config, "reduce", query, groups[0])
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            notes = list(pool.map(lambda group: ask(config, "map", query, group), groups))
+
+
+def analyze(config, query, stream, stats):
+    import prompts
+    import timings
+
+    count_tokens = prompts.get_tokenizer(config.get("tokenizer", "auto"))
+    chunk_tokens = config.get("pipe_chunk_tokens", DEFAULT_CHUNK_TOKENS)
+    concurrency = max(1, config.get("pipe_concurrency", DEFAULT_CONCURRENCY))
+    config = dict(config, pool_maxsize=max(config.get("pool_maxsize", 10), concurrency))
+
+    chunks = read_chunks(stream, count_tokens, chunk_tokens, max(2, config.get("pipe_max_chunks", DEFAULT_MAX_CHUNKS)), stats)
+    first = next(chunks, None)
+    if first is None:
+        return None
+    second = next(chunks, None)
+    if second is None:
+        with timings.span("pipe_answer"):
+            return ask(config, "answer", query, first)
+
+    def all_chunks():
+        yield first
+        yield second
+        yield from chunks
+
+    with timings.span("pipe_map") as attributes:
+        notes = map_chunks(config, query, all_chunks(), concurrency)
+        attributes["chunks"] = len(notes)
+    with timings.span("pipe_reduce"):
+        return reduce_notes(config, query, notes, count_tokens, chunk_tokens, concurrency)
+
+
+def stdin_has_input(stream=None, wait=STDIN_WAIT):
+    # Режим включается сам, только если stdin — канал или файл с данными. У cron, CI, ssh без
+    # терминала и </dev/null stdin тоже не терминал, но данных нет — такой запуск идёт обычным путём
+    import os
+    import stat
+    stream = stream or sys.stdin
+    try:
+        fd = stream.fileno()
+        mode = os.fstat(fd).st_mode
+        if stat.S_ISREG(mode):
+            return os.fstat(fd).st_size > os.lseek(fd, 0, os.SEEK_CUR)
+        if not stat.S_ISFIFO(mode):
+            return False
+        try:
+            import fcntl
+            import select
+            import termios
+        except ImportError:
+            return True  # Windows: select не работает с каналами, доверяем типу stdin
+        from array import array
+        if not select.select([fd], [], [], wait)[0]:
+            return False  # пишущая сторона молчит
+        available = array("i", [0])
+        fcntl.ioctl(fd, termios.FIONREAD, available)
+        return available[0] > 0  # готов к чтению, но пуст — канал уже закрыт без данных
+    except (OSError, ValueError):
+        return False
+
+
+def run_pipe(config, query, stream=None, json_output=False, out=None):
+    # Возвращает код завершения; ответ — в out (stdout), сообщения об ошибках — в stderr.
+    # Запросы идут с пакетным приоритетом: общая квота API (rate_limit.py) сначала достаётся интерактивным вызовам
+    import rate_limit
+    out = out or sys.stdout
+    stream = stream or sys.stdin.buffer
+    stats = InputStats()
+    result = {"query": query, "answer": None, "ok": False, "error": None}
+    start = time.monotonic()
+    if not query.strip():
+        result["error"] = "не указан вопрос"
+        code = EXIT_USAGE
+    else:
+        try:
+            with rate_limit.priority(rate_limit.BATCH):
+                answer = analyze(config, query, stream, stats)
+            if answer is None:
+                result["error"] = "стандартный ввод пуст"
+                code = EXIT_NO_INPUT
+            else:
+                result.update(answer=answer.strip(), ok=True)
+                code = EXIT_OK
+        except KeyboardInterrupt:
+            result["error"] = "прервано"
+            code = EXIT_INTERRUPTED
+        except Exception as e:
+            result["error"] = f"ошибка запроса: {e}"
+            code = EXIT_REQUEST_FAILED
+
+    result.update(input_bytes=stats.bytes, input_lines=stats.lines, chunks=stats.chunks,
+                  skipped_lines=stats.skipped_lines, latency=round(time.monotonic() - start, 3))
+    if json_output:
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    elif result["ok"]:
+        out.write(result["answer"] + "\n")
+    if result["error"] and not json_output:
+        sys.stderr.write(f"iop: {result['error']}\n")
+    out.flush()
+    return code
@@ -0,0 +1,161 @@
+# Подсистема системных промптов: шаблон prompt.txt разбирается на разделы один раз,
+# результат рендеринга для (shell, os, is_script, бюджет) запоминается на время жизни процесса.
+# При превышении max_prompt_tokens отбрасываются разделы с наименьшим приоритетом.
+
+import functools
+import math
+import os
+import re
+
+PROMPT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt.txt")
+
+REQUIRED = 1000
+
+# Приоритеты разделов prompt.txt по ключевым словам заголовка; обязательные разделы не отбрасываются
+SECTION_PRIORITIES = (
+    ("основные правила", REQUIRED),
+    ("безопасност", 50),
+    ("оптимизац", 30),
+    ("интеграц", 10),
+)
+DEFAULT_PRIORITY = 40
+SCRIPT_SECTION_PRIORITY = {True: 60, False: 20}
+
+SCRIPT_RULES = (
+    "\n\nПри создании скрипта следуйте этим дополнительным рекомендациям:"
+    "\n* Создайте надежный скрипт, который обрабатывает потенциальные ошибки и предоставляет информативные сообщения об ошибках"
+    "\n* Для {os} используйте соответствующие механизмы обработки ошибок"
+    "\n* При работе с USB-устройствами или системными событиями используйте несколько методов для обеспечения надежных результатов"
+    "\n* Включите комментарии, объясняющие назначение каждого основного раздела скрипта"
+    "\n* Всегда включайте способ четкого отображения результатов пользователю"
+)
+
+# Системные промпты неинтерактивного режима (pipe.py): анализ данных из stdin, а не перевод в команды
+PIPE_PROMPTS = {
+    "answer": (
+        "Вы - IOP, помощник для анализа текстовых данных на {os}. Пользователь передал через стандартный ввод "
+        "вывод команды или содержимое файла. Ответьте на вопрос пользователя по этим данным кратко и по существу, "
+        "простым текстом без разметки markdown. Не придумывайте сведений, которых нет во входных данных."
+    ),
+    "map": (
+        "Вы - IOP, помощник для анализа текстовых данных на {os}. Вам передан один фрагмент большого входного потока. "
+        "Выпишите из фрагмента только сведения, нужные для ответа на вопрос пользователя: ошибки, числа, имена, "
+        "характерные строки с их количеством. Пишите кратко, простым текстом. Если нужных сведений нет, ответьте НЕТ."
+    ),
+    "reduce": (
+        "Вы - IOP, помощник для анализа текстовых данных на {os}. Ниже — заметки, извлечённые по порядку из "
+        "фрагментов большого входного потока (НЕТ означает, что во фрагменте ничего не нашлось). Объедините их, "
+        "сложите повторяющиеся сведения и ответьте на вопрос пользователя кратко, простым текстом без разметки markdown."
+    ),
+}
+
+# Модели OpenRouter, которым нужна явная разметка cache_control (у OpenAI кэширование префикса автоматическое)
+CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    # Грубая оценка без внешних зависимостей: слово — около 4 символов на токен, знак препинания — токен
+    return sum(max(1, math.ceil(len(token) / 4)) for token in WORD_RE.findall(text))
+
+
+def tiktoken_counter():
+    import tiktoken
+    encoding = tiktoken.get_encoding("o200k_base")
+    return lambda text: len(encoding.encode(text))
+
+
+_tokenizers = {"estimate": lambda: estimate_tokens, "tiktoken": tiktoken_counter}
+
+
+def register_tokenizer(name, factory):
+    # factory() возвращает функцию text -> число токенов
+    _tokenizers[name] = factory
+    get_tokenizer.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(name="auto"):
+    if name == "auto":
+        try:
+            return tiktoken_counter()
+        except ImportError:
+            return estimate_tokens
+    return _tokenizers[name]()
+
+
+def section_priority(title, is_script):
+    title = title.lower()
+    if "скрипт" in title:
+        return SCRIPT_SECTION_PRIORITY[is_script]
+    for keyword, priority in SECTION_PRIORITIES:
+        if keyword in title:
+            return priority
+    return DEFAULT_PRIORITY
+
+
+def split_sections(template):
+    # Возвращает [(заголовок, текст)]; текст разделов склеивается обратно без потерь.
+    # Вступление до первого "## " и завершающий абзац шаблона ("Вопрос:") выделяются отдельно.
+    sections = [["", ""]]
+    for line in template.splitlines(keepends=True):
+        if line.startswith("## "):
+            sections.append([line[3:].strip(), ""])
+        sections[-1][1] += line
+    title, body = sections[-1]
+    head, sep, tail = body.rstrip("\n").rpartition("\n\n")
+    if sep and tail and not re.match(r"\s*(\d+\.|[-*])\s", tail):
+        sections[-1][1] = head + sep
+        sections.append([None, body[len(head) + len(sep):]])
+    return [tuple(section) for section in sections if section[1]]
+
+
+@functools.lru_cache(maxsize=None)
+def load_sections(path, mtime):
+    with open(path, "r", encoding="utf-8") as file:
+        return split_sections(file.read())
+
+
+def render(shell, os_name, is_script=False, max_prompt_tokens=None, tokenizer="auto", path=PROMPT_FILE):
+    # mtime входит в ключ кэша, чтобы правка prompt.txt подхватывалась без перезапуска демона
+    return render_cached(shell, os_name, is_script, max_prompt_tokens, tokenizer, path, os.path.getmtime(path))
+
+
+@functools.lru_cache(maxsize=64)
+def render_cached(shell, os_name, is_script, max_prompt_tokens, tokenizer, path, mtime):
+    parts = []
+    for title, text in load_sections(path, mtime):
+        priority = REQUIRED if title in ("", None) else section_priority(title, is_script)
+        parts.append([priority, text.replace("{shell}", shell).replace("{os}", os_name)])
+    if is_script:
+        parts.append([REQUIRED, SCRIPT_RULES.replace("{os}", os_name)])
+
+    if max_prompt_tokens:
+        count = get_tokenizer(tokenizer)
+        total = sum(count(text) for _, text in parts)
+        # Сначала отбрасываются наименее приоритетные, при равенстве — более поздние разделы
+        for index in sorted(range(len(parts)), key=lambda i: (parts[i][0], -i)):
+            if total <= max_prompt_tokens or parts[index][0] >= REQUIRED:
+                break
+            total -= count(parts[index][1])
+            parts[index][1] = ""
+    return "".join(text for _, text in parts)
+
+
+def pipe_prompt(stage, os_name):
+    return PIPE_PROMPTS[stage].replace("{os}", os_name)
+
+
+def supports_prompt_caching(config):
+    api = config.get("api") or "openrouter"
+    if api == "anthropic":
+        return True
+    return api == "openrouter" and config.get("model", "").startswith(CACHE_CONTROL_MODEL_PREFIXES)
+
+
+def system_message(system_prompt, config):
+    # Системный промпт — статический префикс запроса; помечаем его для кэширования на стороне провайдера
+    if config.get("prompt_cache", True) and supports_prompt_caching(config):
+        return {"role": "system", "content": [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]}
+    return {"role": "system", "content": system_prompt}
@@ -0,0 +1,179 @@
+# Общий для всех процессов iop ограничитель частоты запросов к API (token bucket).
+# Состояние — токены, текущая скорость, пауза до момента времени — хранится в маленьком файле
+# в каталоге кэша и меняется под файловой блокировкой, поэтому параллельные вызовы iop
+# с одним ключом делят одну квоту. Скорость адаптируется: ответ 429 вдвое снижает её и
+# останавливает очередь на Retry-After, успешные ответы понемногу возвращают её к rate_limit,
+# а X-RateLimit-Remaining: 0 останавливает очередь до X-RateLimit-Reset.
+# Интерактивные запросы обслуживаются раньше пакетных (--batch, --pipe): пока ждёт
+# интерактивный запрос, пакетные токены не берут.
+
+import contextlib
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+
+from paths import user_cache_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows: состояние общее только для потоков одного процесса
+    fcntl = None
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+DEFAULT_BURST = 2
+DEFAULT_MAX_WAIT = 60
+MIN_RATE_FACTOR = 0.05  # нижняя граница адаптивной скорости — доля rate_limit
+INCREASE_FACTOR = 0.05  # прибавка скорости после успешного ответа — доля rate_limit
+POLL_INTERVAL = 0.25
+INTERACTIVE_HOLD = 0.5
+STATE = struct.Struct("<5d")  # токены, время обновления, скорость, пауза до, интерактивный запрос ждёт до
+
+_priority = INTERACTIVE
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def priority(value):
+    # Приоритет запросов процесса; пакетный режим и --pipe работают с BATCH
+    global _priority
+    previous, _priority = _priority, value
+    try:
+        yield
+    finally:
+        _priority = previous
+
+
+def get_priority():
+    return _priority
+
+
+def reset_time(value, now):
+    # X-RateLimit-Reset: метка времени в миллисекундах (OpenRouter), в секундах или число секунд до сброса
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if number > 1e12:
+        return number / 1000
+    if number > 1e9:
+        return number
+    return now + max(0.0, number)
+
+
+def header_number(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class SharedRateLimiter:
+    def __init__(self, path, rate, burst=DEFAULT_BURST, max_wait=DEFAULT_MAX_WAIT):
+        self.path = path
+        self.rate = rate
+        self.min_rate = rate * MIN_RATE_FACTOR
+        self.burst = max(1, burst)
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.fd = None
+        self.pid = None
+
+    @contextlib.contextmanager
+    def state(self):
+        # Чтение и запись состояния под блокировкой потоков процесса и файловой блокировкой
+        with self.lock:
+            if self.fd is None or self.pid != os.getpid():
+                self.fd, self.pid = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600), os.getpid()
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                data = os.read(self.fd, STATE.size)
+                if len(data) == STATE.size:
+                    tokens, updated, rate, blocked_until, interactive_until = STATE.unpack(data)
+                    rate = min(max(rate, self.min_rate), self.rate)
+                else:
+                    tokens, updated, rate, blocked_until, interactive_until = float(self.burst), now, self.rate, 0.0, 0.0
+                state = {
+                    "now": now,
+                    "tokens": min(float(self.burst), tokens + max(0.0, now - updated) * rate),
+                    "rate": rate,
+                    "blocked_until": blocked_until,
+                    "interactive_until": interactive_until,
+                }
+                yield state
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.write(self.fd, STATE.pack(state["tokens"], now, state["rate"], state["blocked_until"], state["interactive_until"]))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def acquire(self, request_priority=None):
+        # Ждёт токен и возвращает время ожидания в очереди, секунд
+        request_priority = request_priority or _priority
+        start = time.monotonic()
+        while True:
+            with self.state() as state:
+                now = state["now"]
+                delay = max(0.0, state["blocked_until"] - now)
+                if request_priority != INTERACTIVE and state["interactive_until"] > now:
+                    delay = max(delay, POLL_INTERVAL)
+                if not delay:
+                    if state["tokens"] >= 1:
+                        state["tokens"] -= 1
+                        return time.monotonic() - start
+                    delay = (1 - state["tokens"]) / state["rate"]
+                if request_priority == INTERACTIVE:
+                    state["interactive_until"] = max(state["interactive_until"], now + min(delay, POLL_INTERVAL) + INTERACTIVE_HOLD)
+            waited = time.monotonic() - start
+            if waited >= self.max_wait:
+                return waited  # дальше решают повторы http_client
+            time.sleep(min(delay, POLL_INTERVAL, self.max_wait - waited))
+
+    def update(self, status, headers):
+        # Подстраивает скорость по ответу API
+        from http_client import parse_retry_after
+
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        remaining = header_number(headers, "X-RateLimit-Remaining")
+        with self.state() as state:
+            now = state["now"]
+            if status == 429:
+                state["rate"] = max(self.min_rate, state["rate"] / 2)
+                state["tokens"] = 0.0
+                pause = retry_after if retry_after is not None else 1 / state["rate"]
+                state["blocked_until"] = max(state["blocked_until"], now + pause)
+            elif status < 400:
+                state["rate"] = min(self.rate, state["rate"] + self.rate * INCREASE_FACTOR)
+            if remaining is not None and remaining < 1:
+                reset = reset_time(headers.get("X-RateLimit-Reset"), now)
+                if reset is not None:
+                    state["blocked_until"] = max(state["blocked_until"], reset)
+                    state["tokens"] = 0.0
+
+
+def get_limiter(config):
+    # Один ограничитель на провайдера, адрес API и ключ; rate_limit: 0 отключает ограничение
+    rate = config.get("rate_limit", 0)
+    if not rate:
+        return None
+    identity = "\0".join([config.get("api") or "openrouter", config.get("api_base") or "", config.get("openrouter_api_key") or ""])
+    try:
+        directory = os.path.join(user_cache_dir(), "ratelimit")
+        path = os.path.join(directory, hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16] + ".state")
+        key = (path, rate, config.get("rate_limit_burst", DEFAULT_BURST), config.get("rate_limit_max_wait", DEFAULT_MAX_WAIT))
+        with _limiters_lock:
+            if key not in _limiters:
+                os.makedirs(directory, exist_ok=True)
+                _limiters[key] = SharedRateLimiter(*key)
+            return _limiters[key]
+    except OSError as e:
+        logging.warning("Общий ограничитель частоты запросов недоступен: %s", e)
+        return None
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from paths import user_cache_dir
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def normalize_query(query):
+    return " ".join(query.split()).lower()
+
+
+def make_cache_key(query, model, temperature, system_prompt):
+    prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    material = json.dumps([normalize_query(query), model, temperature, prompt_hash], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pid = os.getpid()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[1] > self.ttl:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            self._bump("misses")
+            self.conn.commit()
+            return None
+        self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._bump("hits")
+        self.conn.commit()
+        return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, response, now, now),
+        )
+        # Вытеснение по LRU: оставляем max_entries самых недавно использованных записей
+        self.conn.execute(
+            "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self.conn.commit()
+
+    def stats(self):
+        stats = dict(self.conn.execute("SELECT name, value FROM stats").fetchall())
+        entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": stats.get("hits", 0), "misses": stats.get("misses", 0), "entries": entries}
+
+    def close(self):
+        self.conn.close()
+
+    def _bump(self, name):
+        self.conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+
+_cache = None
+
+
+def get_response_cache(config):
+    # Один экземпляр на процесс; после fork соединение SQLite открывается заново
+    global _cache
+    if not config.get("cache", True):
+        return None
+    if _cache is None or _cache.pid != os.getpid():
+        try:
+            _cache = ResponseCache(
+                os.path.join(user_cache_dir(), "responses.sqlite3"),
+                ttl=config.get("cache_ttl", DEFAULT_TTL),
+                max_entries=config.get("cache_max_entries", DEFAULT_MAX_ENTRIES),
+            )
+        except (OSError, sqlite3.Error) as e:
+            logging.warning("Кэш ответов недоступен: %s", e)
+            return None
+    return _cache
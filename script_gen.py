@@ -0,0 +1,149 @@
+# Генерация скриптов: текст модели пишется в файл <имя>.partial по мере поступления.
+# Если ответ оборвался по лимиту токенов (finish_reason == "length") или bash -n сообщает
+# о неожиданном конце файла, запрашивается продолжение. После сбоя сети файл .partial
+# остаётся на диске, и следующий запуск с тем же именем продолжает его, а не начинает заново.
+# Пустой ответ — ошибка: пустой .partial удаляется, а <имя>.sh не создаётся.
+
+import os
+import platform
+
+DEFAULT_MAX_CONTINUATIONS = 5
+OVERLAP_WINDOW = 200
+MIN_OVERLAP = 16
+TAIL_LINES = 8
+
+CONTINUE_PROMPT = (
+    "Ответ оборвался. Продолжите скрипт ровно с того места, где он закончился: "
+    "не повторяйте уже написанное, не добавляйте пояснений и разметки."
+)
+
+
+def script_paths(name):
+    # Возвращает (путь скрипта, команда запуска)
+    if platform.system() == "Windows":
+        path = os.path.join(os.getcwd(), f"{name}.ps1")
+        return path, f"powershell -ExecutionPolicy Bypass -File {name}.ps1"
+    path = os.path.join(os.getcwd(), f"{name}.sh")
+    return path, f"bash {name}.sh"
+
+
+def syntax_error(content, shell):
+    if shell != "bash":
+        return None
+    import candidates
+    return candidates.bash_syntax_error(content)
+
+
+def looks_truncated(error):
+    return error is not None and "unexpected end of file" in error
+
+
+def trim_overlap(content, head):
+    # Модели часто повторяют конец уже полученного текста в начале продолжения
+    for size in range(min(len(content), len(head), OVERLAP_WINDOW), MIN_OVERLAP - 1, -1):
+        if content.endswith(head[:size]):
+            return head[size:]
+    return head
+
+
+def stream_round(config, messages, file, content, on_text, continuation):
+    # Один запрос: текст дописывается в file; возвращает (новый текст, finish_reason)
+    import iop
+    from contextlib import closing
+
+    stream = iop.get_model_client(config).stream_chat(messages, config["model"], config["temperature"], config["max_tokens"])
+    text = ""
+    pending = "" if continuation else None  # начало продолжения копится до проверки перекрытия
+    with closing(stream):
+        while True:
+            try:
+                delta = next(stream)
+            except StopIteration as stop:
+                finish_reason = stop.value
+                break
+            if pending is not None:
+                pending += delta
+                if len(pending) < OVERLAP_WINDOW:
+                    continue
+                delta, pending = trim_overlap(content, pending), None
+            file.write(delta)
+            file.flush()
+            text += delta
+            on_text(content + text)
+    if pending:
+        delta = trim_overlap(content, pending)
+        file.write(delta)
+        file.flush()
+        text += delta
+        on_text(content + text)
+    return text, finish_reason
+
+
+def generate(config, query, shell, partial_path, on_text=lambda text: None):
+    # Возвращает (содержимое, ошибка синтаксиса или None); исключения сети оставляют partial_path на диске
+    import iop
+
+    system_prompt = iop.get_system_prompt(shell, is_script=True, max_prompt_tokens=config.get("max_prompt_tokens"))
+    messages = iop.build_messages(system_prompt, query, config)
+    content = ""
+    if os.path.exists(partial_path):
+        with open(partial_path, "r", encoding="utf-8") as file:
+            content = file.read()
+
+    with open(partial_path, "a", encoding="utf-8") as file:
+        for _ in range(config.get("script_max_continuations", DEFAULT_MAX_CONTINUATIONS) + 1):
+            request = messages
+            if content:
+                request = messages + [{"role": "assistant", "content": content}, {"role": "user", "content": CONTINUE_PROMPT}]
+            text, finish_reason = stream_round(config, request, file, content, on_text, continuation=bool(content))
+            content += text
+            error = syntax_error(content, shell)
+            if not text or (finish_reason != "length" and not (finish_reason is None and looks_truncated(error))):
+                return content, error
+    return content, syntax_error(content, shell)
+
+
+def tail_panel(path, text):
+    from rich.panel import Panel
+    lines = text.splitlines()
+    shown = "\n".join(lines[-TAIL_LINES:])
+    return Panel(shown, title=f"{os.path.basename(path)}: строк {len(lines)}", border_style="cyan")
+
+
+def create_script(config, query, shell, console):
+    from rich.live import Live
+    from rich.markup import escape
+    from rich.panel import Panel
+
+    script_name = console.input("[bold cyan]Введите имя скрипта (без расширения):[/bold cyan] ")
+    script_path, run_command = script_paths(script_name)
+    partial_path = script_path + ".partial"
+    if os.path.exists(partial_path):
+        console.print(f"[bold yellow]Найден незавершённый скрипт:[/bold yellow] {partial_path}")
+        if console.input("[bold cyan]Продолжить его? [Д/н]:[/bold cyan] ").strip().upper() not in ("", "Д", "Y"):
+            os.remove(partial_path)
+
+    script_query = f"Создайте скрипт для {query}. Скрипт должен обрабатывать ошибки, предоставлять четкий вывод и работать надежно."
+    try:
+        with Live(tail_panel(script_path, ""), console=console.get(), transient=True, refresh_per_second=8) as live:
+            content, error = generate(config, script_query, shell, partial_path,
+                                      on_text=lambda text: live.update(tail_panel(script_path, escape(text))))
+    except Exception as e:
+        console.print(Panel(f"[bold red]Генерация прервана:[/bold red] {e}\nПолученная часть сохранена в {partial_path}; "
+                            "повторите команду с тем же именем скрипта, чтобы продолжить.", title="Ошибка", border_style="red"))
+        return None, None
+
+    if not content.strip():
+        os.remove(partial_path)  # продолжать нечего
+        console.print(Panel("[bold red]Модель вернула пустой скрипт.[/bold red] Файл не создан.", title="Ошибка", border_style="red"))
+        return None, None
+
+    os.replace(partial_path, script_path)
+    if platform.system() != "Windows":
+        os.chmod(script_path, 0o755)  # Делаем скрипт исполняемым на Unix-подобных системах
+
+    if error:
+        console.print(Panel(f"[bold yellow]bash -n сообщает об ошибке:[/bold yellow] {escape(error)}", title="Предупреждение", border_style="yellow"))
+    console.print(Panel(f"[bold green]Скрипт создан:[/bold green] {script_path}", title="Успех", border_style="green"))
+    console.print(f"[bold cyan]Для запуска скрипта используйте:[/bold cyan] {run_command}")
+    return script_path, run_command
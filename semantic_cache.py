@@ -0,0 +1,210 @@
+# Второй уровень кэша: поиск похожих (а не только совпадающих) запросов.
+# Запрос превращается в вектор хешированных n-грамм, векторы хранятся в файле float32,
+# который отображается в память (np.memmap) и просматривается блоками, поэтому индекс
+# подгружается по мере обращения. Индексы раздельные для каждой пары shell/ОС/модель.
+# Похожий запрос засчитывается, только если у него те же действие (удалить, остановить…) и те же
+# аргументы (PID, порт, путь, имя файла), а запись моложе semantic_cache_ttl.
+# NumPy — необязательная зависимость: без него этот уровень кэша отключён.
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import zlib
+
+from paths import user_cache_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows: запись не защищена от параллельных процессов
+    fcntl = None
+
+DIM = 512
+SEARCH_BLOCK = 65536
+DUPLICATE_SIMILARITY = 0.99
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_MAX_MB = 16
+DEFAULT_TTL = 24 * 60 * 60
+ACTION_WEIGHT = 4.0
+ARGUMENT_WEIGHT = 3.0
+
+STOPWORDS = frozenset(
+    "a an the is are be to of in on for and or me my i you please can could would how what which "
+    "show list all do does it this that with by from much many "
+    "и в во на по с со к для из как что какой какие мне мой мои все это покажи выведи пожалуйста".split()
+)
+TOKEN_RE = re.compile(r"\w+")
+ARGUMENT_RE = re.compile(r"[\w.~-]*/[\w.~/-]*|\w+(?:\.\w+)+|\w*\d\w*")
+
+
+def tokenize(query):
+    words = TOKEN_RE.findall(query.lower())
+    return [w for w in words if w not in STOPWORDS] or words
+
+
+def arguments(query):
+    # Аргументы запроса — числа, пути и имена файлов: «kill 1234» и «kill 4321», как и
+    # «du -sh /home» и «du -sh /var», — разные команды
+    return frozenset(ARGUMENT_RE.findall(query.lower()))
+
+
+def signature(query):
+    # Действие и аргументы должны совпасть, как бы ни было велико сходство остального текста
+    from offline_index import actions
+    return actions(query), arguments(query)
+
+
+def vectorize(query):
+    # Хешированные признаки: слова (вес 2), символьные триграммы слов, действия и
+    # аргументы (с большим весом, см. signature); знак задаёт второй хеш
+    import numpy as np
+
+    vector = np.zeros(DIM, dtype=np.float32)
+    query_actions, query_arguments = signature(query)
+    features = [("\0" + action, ACTION_WEIGHT) for action in query_actions]
+    features.extend(("\0#" + argument, ARGUMENT_WEIGHT) for argument in query_arguments)
+    for word in tokenize(query):
+        features.append((word, 2.0))
+        padded = f"<{word}>"
+        features.extend((padded[i:i + 3], 1.0) for i in range(len(padded) - 2))
+    for feature, weight in features:
+        digest = zlib.crc32(feature.encode("utf-8"))
+        vector[digest % DIM] += weight if digest & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def scope_name(shell, os_name, model):
+    return hashlib.sha256(f"{shell}\0{os_name}\0{model}".encode("utf-8")).hexdigest()[:16]
+
+
+class SemanticIndex:
+    # Файлы индекса: .vec — строки float32[DIM], .jsonl — запрос, команда и время записи,
+    # .idx — смещения строк .jsonl
+    def __init__(self, base_path, max_mb=DEFAULT_MAX_MB, ttl=DEFAULT_TTL):
+        import numpy as np
+
+        self.np = np
+        self.vec_path = base_path + ".vec"
+        self.meta_path = base_path + ".jsonl"
+        self.idx_path = base_path + ".idx"
+        self.max_rows = max(1, int(max_mb * 1024 * 1024) // (DIM * 4))
+        self.ttl = ttl
+
+    def rows(self):
+        try:
+            return os.path.getsize(self.vec_path) // (DIM * 4)
+        except OSError:
+            return 0
+
+    def vectors(self):
+        rows = self.rows()
+        if not rows:
+            return None
+        return self.np.memmap(self.vec_path, dtype=self.np.float32, mode="r", shape=(rows, DIM))
+
+    def search(self, query):
+        # Возвращает (сходство, номер строки) лучшего совпадения или None; при равенстве — более новая строка
+        vectors = self.vectors()
+        if vectors is None:
+            return None
+        probe = vectorize(query)
+        best = (-1.0, -1)
+        for start in range(0, len(vectors), SEARCH_BLOCK):
+            scores = vectors[start:start + SEARCH_BLOCK] @ probe
+            row = len(scores) - 1 - int(scores[::-1].argmax())
+            if scores[row] >= best[0]:
+                best = (float(scores[row]), start + row)
+        return best
+
+    def entry(self, row):
+        offsets = self.np.memmap(self.idx_path, dtype=self.np.uint64, mode="r")
+        with open(self.meta_path, "rb") as file:
+            file.seek(int(offsets[row]))
+            return json.loads(file.readline())
+
+    def expired(self, item):
+        return time.time() - item.get("ts", 0) > self.ttl
+
+    @contextlib.contextmanager
+    def locked(self):
+        # Три файла индекса меняются согласованно: параллельные процессы iop пишут по очереди
+        with open(self.vec_path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def add(self, query, command):
+        # Повтор свежей записи не дописывается; устаревшая или с другой командой заменяется новой строкой
+        with self.locked():
+            found = self.search(query)
+            if found is not None and found[0] >= DUPLICATE_SIMILARITY:
+                item = self.entry(found[1])
+                if item["command"] == command and not self.expired(item):
+                    return
+            if self.rows() >= self.max_rows:
+                self.compact(self.max_rows // 2)
+            with open(self.meta_path, "ab") as meta:
+                offset = meta.tell()
+                item = {"query": query, "command": command, "ts": time.time()}
+                meta.write(json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n")
+            with open(self.idx_path, "ab") as idx:
+                idx.truncate(self.rows() * 8)  # отбрасываем хвост, оставшийся от прерванной записи
+                idx.write(self.np.array([offset], dtype=self.np.uint64).tobytes())
+            with open(self.vec_path, "ab") as vec:
+                vec.write(vectorize(query).tobytes())
+
+    def compact(self, keep):
+        # Укладываемся в бюджет памяти: остаются keep самых новых записей; вызывается под locked()
+        rows = self.rows()
+        entries = [self.entry(row) for row in range(max(0, rows - keep), rows)]
+        vectors = self.np.array(self.vectors()[rows - len(entries):])
+        for path in (self.vec_path, self.meta_path, self.idx_path):
+            os.remove(path)
+        with open(self.meta_path, "wb") as meta, open(self.idx_path, "wb") as idx:
+            for item in entries:
+                idx.write(self.np.array([meta.tell()], dtype=self.np.uint64).tobytes())
+                meta.write(json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n")
+        with open(self.vec_path, "wb") as vec:
+            vec.write(vectors.tobytes())
+
+
+def get_index(config, shell, os_name):
+    if not config.get("semantic_cache", True) or not config.get("cache", True):
+        return None
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return None
+    try:
+        directory = os.path.join(user_cache_dir(), "semantic")
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        logging.warning("Кэш похожих запросов недоступен: %s", e)
+        return None
+    base_path = os.path.join(directory, scope_name(shell, os_name, config.get("model", "")))
+    return SemanticIndex(base_path, config.get("semantic_cache_max_mb", DEFAULT_MAX_MB),
+                         config.get("semantic_cache_ttl", DEFAULT_TTL))
+
+
+def lookup(config, shell, os_name, query):
+    # Возвращает (команда, похожий запрос, сходство) или None
+    index = get_index(config, shell, os_name)
+    if index is None:
+        return None
+    found = index.search(query)
+    if found is None or found[0] < config.get("semantic_cache_threshold", DEFAULT_THRESHOLD):
+        return None
+    item = index.entry(found[1])
+    if index.expired(item) or signature(item["query"]) != signature(query):
+        return None
+    return item["command"], item["query"], found[0]
+
+
+def remember(config, shell, os_name, query, command):
+    index = get_index(config, shell, os_name)
+    if index is not None:
+        index.add(query, command)
@@ -0,0 +1,109 @@
+# Контекст сессии терминала: последние пары «запрос → команда» хранятся на диске, чтобы
+# уточнение ([и]зменить, --refine) отправлялось вместе с предыдущим обменом и сходилось за один запрос.
+# История ограничена числом ходов и бюджетом токенов: старые ходы сворачиваются в краткую сводку.
+# Системный промпт остаётся первым сообщением без изменений, поэтому кэш префикса у провайдера сохраняется.
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from paths import user_cache_dir
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_TURNS = 6
+DEFAULT_MAX_TOKENS = 1500
+SUMMARY_MAX_CHARS = 600
+SUMMARY_ITEM_CHARS = 120
+
+# Переменные окружения, различающие окна терминала и панели мультиплексоров
+TERMINAL_ENV = ("IOP_SESSION", "TMUX_PANE", "STY", "TERM_SESSION_ID", "WT_SESSION", "WINDOWID")
+
+REFINE_TEMPLATE = "Измените предыдущую команду: {query}"
+
+
+def session_id():
+    parts = [f"{name}={os.environ[name]}" for name in TERMINAL_ENV if os.environ.get(name)]
+    for fd in (0, 1, 2):
+        try:
+            parts.append(os.ttyname(fd))
+            break
+        except (OSError, AttributeError):
+            continue
+    return "\0".join(parts) or "default"
+
+
+def refine_query(query):
+    return REFINE_TEMPLATE.format(query=query)
+
+
+class Session:
+    def __init__(self, path, ttl=DEFAULT_TTL, max_turns=DEFAULT_MAX_TURNS, max_tokens=DEFAULT_MAX_TOKENS):
+        self.path = path
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.turns = []  # [запрос, команда]
+        self.summary = ""
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            # Устаревшая сессия (терминал давно закрыт, имя tty переиспользовано) начинается заново
+            if time.time() - data.get("updated", 0) <= ttl:
+                self.turns = data.get("turns", [])
+                self.summary = data.get("summary", "")
+        except (OSError, ValueError):
+            pass
+
+    def last(self):
+        return self.turns[-1] if self.turns else None
+
+    def add(self, query, command):
+        import prompts
+
+        count = prompts.get_tokenizer("auto")
+        self.turns.append([query, command])
+        while len(self.turns) > 1 and (len(self.turns) > self.max_turns or
+                                       sum(count(q) + count(c) for q, c in self.turns) > self.max_tokens):
+            old_query, old_command = self.turns.pop(0)
+            item = f"{old_query} → {old_command}".replace("\n", " ")[:SUMMARY_ITEM_CHARS]
+            self.summary = (self.summary + "; " + item if self.summary else item)[-SUMMARY_MAX_CHARS:]
+        self.save()
+
+    def messages(self):
+        # Сообщения user/assistant чередуются; сводка старых ходов идёт в первое сообщение пользователя
+        messages = []
+        for index, (query, command) in enumerate(self.turns):
+            if index == 0 and self.summary:
+                query = f"Ранее в этой сессии: {self.summary}\n\n{query}"
+            messages.append({"role": "user", "content": query})
+            messages.append({"role": "assistant", "content": command})
+        return messages
+
+    def clear(self):
+        self.turns, self.summary = [], ""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"updated": time.time(), "turns": self.turns, "summary": self.summary}, file,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+def get_session(config):
+    if not config.get("session", True):
+        return None
+    try:
+        directory = os.path.join(user_cache_dir(), "sessions")
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        logging.warning("Контекст сессии недоступен: %s", e)
+        return None
+    name = hashlib.sha256(session_id().encode("utf-8")).hexdigest()[:16]
+    return Session(os.path.join(directory, name + ".json"), config.get("session_ttl", DEFAULT_TTL),
+                   config.get("session_max_turns", DEFAULT_MAX_TURNS), config.get("session_max_tokens", DEFAULT_MAX_TOKENS))
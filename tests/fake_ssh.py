@@ -0,0 +1,14 @@
+# Заглушка ssh для тестов: fake_ssh.py [-o опция]... [-p порт] хост команда.
+# Команда выполняется локально в bash, имя хоста доступно в $FAKE_HOST; хосты down* недоступны.
+import os
+import sys
+
+args = sys.argv[1:]
+while args and args[0].startswith("-"):
+    if args.pop(0) in ("-o", "-p"):
+        args.pop(0)
+host, command = args[0], " ".join(args[1:])
+if host.startswith("down"):
+    print(f"ssh: connect to host {host} port 22: Connection refused", file=sys.stderr)
+    sys.exit(255)
+os.execvpe("bash", ["bash", "-c", command], dict(os.environ, FAKE_HOST=host))
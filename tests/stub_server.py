@@ -0,0 +1,75 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null")
+        self.server.requests.append({"path": self.path, "port": self.client_address[1], "body": body})
+        with self.server.lock:
+            scripted = self.server.responses.pop(0) if self.server.responses else None
+        status, headers, payload = scripted or self.server.default(self.path, body)
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def completion_payload(content):
+    return {"choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+
+
+def echo_completion(path, body):
+    # По умолчанию возвращает последний запрос пользователя как команду: "echo <запрос>"
+    if path.endswith("/auth/key"):
+        return 200, {}, {"data": {"label": "stub"}}
+    return 200, {}, completion_payload("echo " + body["messages"][-1]["content"])
+
+
+class StubServer:
+    # Локальная заглушка OpenRouter API для тестов; responses — очередь (status, headers, payload)
+    def __init__(self, default=echo_completion):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.requests = []
+        self.httpd.responses = []
+        self.httpd.lock = threading.Lock()
+        self.httpd.default = default
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/api/v1" % self.httpd.server_address[1]
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def responses(self):
+        return self.httpd.responses
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
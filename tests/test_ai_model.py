@@ -0,0 +1,68 @@
+import asyncio
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import ai_model
+from tests.stub_server import StubServer
+
+
+class EchoModel(ai_model.AIModel):
+    def chat(self, messages, model, temperature, max_tokens):
+        return messages[-1]['content']
+
+    def moderate(self, message):
+        pass
+
+
+class TestAIModel(unittest.TestCase):
+    def test_import_does_not_load_provider_sdks(self):
+        code = "import sys, ai_model; print(sorted(m for m in ('openai', 'groq', 'ollama', 'anthropic') if m in sys.modules))"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(ai_model.__file__)))
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_client_reused_per_provider_endpoint_key_and_model(self):
+        config = {'api': 'openai', 'openai_api_key': 'k', 'model': 'm', 'temperature': 0.7}
+        with mock.patch.object(ai_model, '_clients', {}) as clients, \
+                mock.patch.object(ai_model.AIModel, 'create_model_client', side_effect=lambda config: object()):
+            first = ai_model.AIModel.get_model_client(config)
+            for temperature in range(10):
+                self.assertIs(first, ai_model.AIModel.get_model_client(dict(config, temperature=temperature)))
+            self.assertIsNot(first, ai_model.AIModel.get_model_client(dict(config, model='other')))
+            self.assertIsNot(first, ai_model.AIModel.get_model_client(dict(config, openai_api_key='k2')))
+            self.assertEqual(len(clients), 3)
+
+    def test_openrouter_client_uses_current_config(self):
+        config = {'api': 'openrouter', 'openrouter_api_key': 'k', 'retries': 0}
+        client = ai_model.AIModel.get_model_client(config)
+        self.assertIsInstance(client, ai_model.OpenRouterModel)
+        self.assertEqual(ai_model.AIModel.get_model_client(dict(config, retries=5)).config['retries'], 5)
+
+    def test_empty_api_defaults_to_openrouter(self):
+        for api in (None, ''):
+            config = {'api': api, 'openrouter_api_key': 'k'}
+            self.assertIsInstance(ai_model.AIModel.get_model_client(config), ai_model.OpenRouterModel)
+            self.assertIsInstance(ai_model.AIModel.create_model_client(config), ai_model.OpenRouterModel)
+
+    def test_unknown_provider(self):
+        with self.assertRaises(ValueError):
+            ai_model.AIModel.create_model_client({'api': 'unknown'})
+
+    def test_default_achat_and_stream_chat(self):
+        model = EchoModel()
+        messages = [{'role': 'user', 'content': 'ls'}]
+        self.assertEqual(asyncio.run(model.achat(messages, 'm', 0, 10)), 'ls')
+        self.assertEqual(list(model.stream_chat(messages, 'm', 0, 10)), ['ls'])
+
+    def test_openrouter_chat_against_stub(self):
+        with StubServer() as server:
+            client = ai_model.OpenRouterModel({'api_base': server.url, 'openrouter_api_key': 'k'})
+            answer = client.chat([{'role': 'user', 'content': 'ls'}], 'm', 0, 10)
+        self.assertEqual(answer, 'echo ls')
+        self.assertEqual(server.requests[0]['body']['model'], 'm')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import batch
+import http_client
+import iop
+import rate_limit
+import response_cache
+import timings
+from tests.stub_server import StubServer
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name}).start()
+        mock.patch.object(response_cache, '_cache', None).start()
+        mock.patch.object(batch, 'print_summary').start()
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+        self.source = os.path.join(self.tmp.name, 'queries.jsonl')
+        with open(self.source, 'w', encoding='utf-8') as f:
+            f.write('list files\n\n{"query": "show disk usage"}\nshow ports\n')
+
+    def make_config(self, server):
+        return {'api': 'openrouter', 'api_base': server.url, 'openrouter_api_key': 'k', 'your_app_name': 'IOP', 'model': 'm',
+                'temperature': 0.7, 'max_tokens': 100, 'batch_concurrency': 3, 'retries': 0}
+
+    def test_results_in_input_order(self):
+        out = io.StringIO()
+        with StubServer() as server:
+            summary = batch.run_batch(self.make_config(server), self.source, 'bash', out=out)
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['index'] for r in results], [0, 1, 2])
+        self.assertEqual(results[1]['command'], 'echo show disk usage?')
+        self.assertEqual(summary['failed'], 0)
+
+    def test_failures_reported_and_cache_reused(self):
+        with StubServer() as server:
+            config = self.make_config(server)
+            config['batch_concurrency'] = 1
+            server.responses.append((400, {}, {'error': {'message': 'bad request'}}))
+            first = batch.run_batch(config, self.source, 'bash', out=io.StringIO())
+            out = io.StringIO()
+            second = batch.run_batch(config, self.source, 'bash', out=out)
+        self.assertEqual(first['failed'], 1)
+        self.assertEqual(second['failed'], 0)
+        self.assertEqual(second['cached'], 2)
+        self.assertEqual(len(server.requests), 4)
+
+    def test_invalid_json_line_is_item_error(self):
+        with open(self.source, 'a', encoding='utf-8') as f:
+            f.write('{"query": "broken\nlist users\n{"query": 5}\n')
+        out = io.StringIO()
+        with StubServer() as server:
+            summary = batch.run_batch(self.make_config(server), self.source, 'bash', out=out)
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['ok'] for r in results], [True, True, True, False, True, False])
+        self.assertIn('JSON', results[3]['error'])
+        self.assertEqual(results[4]['command'], 'echo list users?')
+        self.assertIn('строкой', results[5]['error'])
+        self.assertEqual(summary['failed'], 2)
+
+    def test_missing_file_reported_without_traceback(self):
+        missing = os.path.join(os.path.dirname(self.source), 'missing.jsonl')
+        with mock.patch.object(sys, 'argv', ['iop', '--batch', missing]):
+            args = iop.parse_arguments()
+        with mock.patch.object(iop, 'console') as console:
+            with self.assertRaises(SystemExit) as raised:
+                iop.run({'model': 'm', 'temperature': 0.7, 'max_tokens': 100}, args)
+        self.assertEqual(raised.exception.code, -1)
+        self.assertIn('missing.jsonl', console.print.call_args[0][0].renderable)
+
+    def test_requests_wait_in_shared_limiter_with_batch_priority(self):
+        timings.reset()
+        with StubServer() as server:
+            batch.run_batch(dict(self.make_config(server), rate_limit=50), self.source, 'bash', out=io.StringIO())
+        waits = [item for item in timings.summary() if item['name'] == 'queue_wait']
+        self.assertEqual(len(waits), 3)
+        self.assertEqual({item['attributes']['priority'] for item in waits}, {rate_limit.BATCH})
+        self.assertEqual(rate_limit.get_priority(), rate_limit.INTERACTIVE)
+
+
+if __name__ == '__main__':
+    unittest.main()
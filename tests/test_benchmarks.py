@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+
+import http_client
+from ai_model import OpenRouterModel
+from benchmarks import run
+from benchmarks.mock_openrouter import MockOpenRouter, MockOptions
+
+MESSAGES = [{"role": "user", "content": "ls"}]
+
+
+class TestMockOpenRouter(unittest.TestCase):
+    def setUp(self):
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+
+    def test_streams_response_word_by_word(self):
+        with MockOpenRouter(MockOptions(response="du -sh * | sort -h")) as server:
+            model = OpenRouterModel(run.bench_config(server.url))
+            deltas = list(model.stream_chat(MESSAGES, "m", 0.7, 100))
+            self.assertEqual(model.chat(MESSAGES, "m", 0.7, 100), "du -sh * | sort -h")
+        self.assertEqual("".join(deltas), "du -sh * | sort -h")
+        self.assertEqual(len(deltas), 6)
+
+    def test_injected_errors_are_retried(self):
+        with MockOpenRouter(MockOptions(error_rate=0.5, error_status=429, seed=1)) as server:
+            model = OpenRouterModel(run.bench_config(server.url, retries=10))
+            with mock.patch.object(http_client.time, "sleep"):
+                results = [model.chat(MESSAGES, "m", 0.7, 100) for _ in range(5)]
+        self.assertEqual(results, ["ls -la"] * 5)
+        self.assertGreater(server.error_count, 0)
+        self.assertEqual(server.request_count, 5 + server.error_count)
+
+
+class TestCompare(unittest.TestCase):
+    def test_flags_regressions_in_both_directions(self):
+        baseline = {"meta": {"commit": "a"}, "results": {"latency": {"p50_ms": 100, "mean_ms": 100}, "throughput": {"throughput_rps": 50}}}
+        current = {"meta": {"commit": "b"}, "results": {"latency": {"p50_ms": 105, "mean_ms": 300}, "throughput": {"throughput_rps": 40}}}
+        rows = {name: regressed for name, _, _, _, regressed in run.compare(baseline, current, 0.1)}
+        self.assertEqual(rows, {"latency.p50_ms": False, "throughput.throughput_rps": True})
+
+
+if __name__ == "__main__":
+    unittest.main()
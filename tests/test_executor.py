@@ -0,0 +1,38 @@
+import os
+import unittest
+
+import executor
+
+
+@unittest.skipIf(os.name == 'nt', 'uses bash')
+class TestRunStreaming(unittest.TestCase):
+    def run_bash(self, command, **kwargs):
+        lines = []
+        result = executor.run_streaming(['bash', '-c', command], on_line=lambda stream, text: lines.append((stream, text)), **kwargs)
+        self.addCleanup(lambda: result.spill_path and os.remove(result.spill_path))
+        return result, lines
+
+    def test_streams_stdout_and_stderr(self):
+        result, lines = self.run_bash('echo out; echo err >&2; exit 3')
+        self.assertEqual(result.returncode, 3)
+        self.assertIn(('stdout', 'out'), lines)
+        self.assertIn(('stderr', 'err'), lines)
+        self.assertIsNone(result.spill_path)
+
+    def test_output_cap_spills_to_file(self):
+        result, lines = self.run_bash('seq 1 2000', output_cap=100)
+        self.assertEqual(result.returncode, 0)
+        self.assertLess(len(lines), 50)
+        with open(result.spill_path) as f:
+            self.assertEqual(f.read().split(), [str(i) for i in range(1, 2001)])
+        self.assertEqual(result.tail[-1], ('stdout', '2000'))
+
+    def test_timeout_kills_process(self):
+        result, _ = self.run_bash('echo start; exec sleep 5', timeout=0.3)
+        self.assertTrue(result.timed_out)
+        self.assertLess(result.duration, 3)
+        self.assertNotEqual(result.returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import ai_model
+import hedge
+import http_client
+import paths
+import prompts
+
+
+class ScriptedModel(ai_model.AIModel):
+    def __init__(self, chunks, first_delay=0.0):
+        self.chunks = chunks
+        self.first_delay = first_delay
+
+    def chat(self, messages, model, temperature, max_tokens):
+        return ''.join(self.chunks)
+
+    def stream_chat(self, messages, model, temperature, max_tokens):
+        self.messages = messages
+        time.sleep(self.first_delay)
+        yield from self.chunks
+
+    def moderate(self, message):
+        pass
+
+
+CONFIG = {'api': 'openrouter', 'model': 'primary', 'hedge_model': 'backup', 'temperature': 0,
+          'max_tokens': 10, 'hedge_delay_ms': 50, 'hedge_adaptive': False}
+MESSAGES = [{'role': 'user', 'content': 'ls?'}]
+
+
+class TestHedgedCompletion(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name}).start()
+
+    def use_models(self, primary, backup):
+        models = {'primary': primary, 'backup': backup}
+        mock.patch.object(ai_model.AIModel, 'get_model_client', side_effect=lambda config: models[config['model']]).start()
+
+    def test_primary_answers_before_threshold(self):
+        self.use_models(ScriptedModel(['ls', ' -la']), ScriptedModel(['dir']))
+        content, stats = hedge.hedged_completion(CONFIG, MESSAGES)
+        self.assertEqual(content, 'ls -la')
+        self.assertEqual(stats['winner'], 'primary')
+        self.assertFalse(stats['hedged'])
+
+    def test_backup_wins_when_primary_stalls(self):
+        self.use_models(ScriptedModel(['slow'], first_delay=1.0), ScriptedModel(['ls']))
+        content, stats = hedge.hedged_completion(CONFIG, MESSAGES)
+        self.assertEqual(content, 'ls')
+        self.assertEqual(stats['winner'], 'backup')
+        self.assertTrue(stats['hedged'])
+
+    def test_invalid_primary_triggers_backup_immediately(self):
+        self.use_models(ScriptedModel(['```', 'bash\nls```']), ScriptedModel(['ls'], first_delay=0.01))
+        config = dict(CONFIG, hedge_delay_ms=10000)
+        content, stats = hedge.hedged_completion(config, MESSAGES)
+        self.assertEqual(content, 'ls')
+        self.assertEqual(stats['winner'], 'backup')
+
+    def test_backup_messages_built_for_backup_provider(self):
+        primary, backup = ScriptedModel(['slow'], first_delay=1.0), ScriptedModel(['ls'])
+        config = dict(CONFIG, model='anthropic/claude', hedge_api='ollama')
+        messages = [prompts.system_message('prompt', config), *MESSAGES]
+        models = {'anthropic/claude': primary, 'backup': backup}
+        with mock.patch.object(ai_model.AIModel, 'get_model_client', side_effect=lambda config: models[config['model']]):
+            content, _ = hedge.hedged_completion(config, messages)
+        self.assertEqual(content, 'ls')
+        self.assertEqual(primary.messages[0]['content'][0]['cache_control'], {'type': 'ephemeral'})
+        self.assertEqual(backup.messages, [{'role': 'system', 'content': 'prompt'}, *MESSAGES])
+
+    def test_stalled_primary_recorded_as_censored_sample(self):
+        self.use_models(ScriptedModel(['slow'], first_delay=1.0), ScriptedModel(['ls']))
+        hedge.hedged_completion(CONFIG, MESSAGES)
+        history = hedge.LatencyHistory(os.path.join(paths.user_cache_dir(), 'hedge_latency.json'))
+        (primary,) = history.samples['openrouter:primary']
+        self.assertGreaterEqual(primary, 50)
+        self.assertEqual(len(history.samples['openrouter:backup']), 1)
+
+    def test_cancel_closes_stalled_stream(self):
+        # Сервер отдаёт заголовки потока и молчит; после победы резерва соединение основного должно закрыться
+        server = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        closed = threading.Event()
+
+        def serve():
+            connection, _ = server.accept()
+            with connection, connection.makefile('rb') as request:
+                headers = dict(line.decode().lower().split(':', 1) for line in iter(request.readline, b'\r\n') if b':' in line)
+                request.read(int(headers['content-length']))
+                connection.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n')
+                connection.settimeout(10)
+                try:
+                    connection.recv(1)
+                finally:
+                    closed.set()
+
+        threading.Thread(target=serve, daemon=True).start()
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+        config = dict(CONFIG, api_base='http://127.0.0.1:%d' % server.getsockname()[1], retries=0)
+        self.use_models(ai_model.OpenRouterModel(config), ScriptedModel(['ls'], first_delay=0.2))
+        attempts = []
+
+        class RecordedAttempt(hedge.Attempt):
+            def __init__(self, *args):
+                super().__init__(*args)
+                attempts.append(self)
+
+        mock.patch.object(hedge, 'Attempt', RecordedAttempt).start()
+        started = time.monotonic()
+        content, stats = hedge.hedged_completion(config, MESSAGES)
+        self.assertEqual(stats['winner'], 'backup')
+        self.assertLess(time.monotonic() - started, 3)
+        attempts[0].thread.join(2)
+        self.assertFalse(attempts[0].thread.is_alive())  # поток не ждёт данных от сервера
+        self.assertTrue(closed.wait(5))
+
+    def test_history_save_merges_concurrent_writers(self):
+        path = os.path.join(self.tmp.name, 'latency.json')
+        first, second = hedge.LatencyHistory(path), hedge.LatencyHistory(path)
+        first.add('openrouter:primary', 10)
+        second.add('openrouter:primary', 20)
+        first.save()
+        second.save()
+        self.assertEqual(hedge.LatencyHistory(path).samples, {'openrouter:primary': [10, 20]})
+
+    def test_adaptive_delay_uses_observed_percentile(self):
+        history = hedge.LatencyHistory(os.path.join(self.tmp.name, 'latency.json'))
+        for ms in range(1, 101):
+            history.add('openrouter:primary', ms)
+        config = dict(CONFIG, hedge_adaptive=True, hedge_percentile=0.9, hedge_min_delay_ms=10)
+        self.assertAlmostEqual(hedge.hedge_delay(config, history), 0.091)
+        self.assertEqual(hedge.hedge_delay(CONFIG, hedge.LatencyHistory(os.path.join(self.tmp.name, 'none.json'))), 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
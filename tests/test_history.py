@@ -0,0 +1,129 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import history
+import iop
+import offline_index
+import response_cache
+
+CONFIG = {'model': 'm', 'temperature': 0.7, 'modify': True, 'semantic_cache': False}
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        writer_patcher = mock.patch.object(history, '_writer', None)
+        writer_patcher.start()
+        self.addCleanup(writer_patcher.stop)
+        self.addCleanup(history.flush)
+        cache_patcher = mock.patch.object(response_cache, '_cache', None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    def test_search_finds_newest_matches_first(self):
+        history.record(CONFIG, 'Перезапусти nginx?', 'sudo systemctl restart nginx', 'Д', 0, shell='bash')
+        history.record(CONFIG, 'Логи nginx за час?', 'journalctl -u nginx --since "1 hour ago"', 'н', shell='bash',
+                       metrics={'offline_hit': 0.9})
+        history.record(CONFIG, 'Свободное место?', 'df -h', 'К', shell='bash', metrics={'total': 0.25})
+        entries = history.search(CONFIG, 'nginx')
+        self.assertEqual([entry['command'] for entry in entries],
+                         ['journalctl -u nginx --since "1 hour ago"', 'sudo systemctl restart nginx'])
+        self.assertEqual((entries[0]['action'], entries[0]['source'], entries[0]['exit_code']), ('reject', 'offline', None))
+        self.assertEqual((entries[1]['action'], entries[1]['exit_code'], entries[1]['model']), ('accept', 0, 'm'))
+        self.assertGreater(entries[1]['tokens'], 0)
+        latest = history.search(CONFIG, '', limit=1)
+        self.assertEqual((latest[0]['action'], latest[0]['latency']), ('copy', 0.25))
+        self.assertEqual(history.search(CONFIG, 'nginx перезап')[0]['command'], 'sudo systemctl restart nginx')
+
+    def test_like_fallback_without_fts(self):
+        history.record(CONFIG, 'Файлы 100%?', 'find . -size +100M', 'Д', 0)
+        history.flush()
+        store = history.HistoryStore(history.history_path())
+        self.addCleanup(store.close)
+        store.fts = False
+        self.assertEqual(len(store.search('find 100')), 1)
+        self.assertEqual(store.search('find_'), [])
+
+    def test_record_does_not_wait_for_disk(self):
+        original = history.HistoryStore.insert
+
+        def slow_insert(store, entries):
+            time.sleep(0.3)
+            original(store, entries)
+
+        with mock.patch.object(history.HistoryStore, 'insert', slow_insert):
+            started = time.monotonic()
+            history.record(CONFIG, 'ls?', 'ls', 'Д', 0)
+            self.assertLess(time.monotonic() - started, 0.1)
+            history.flush()
+        self.assertEqual(len(history.search(CONFIG, 'ls')), 1)
+
+    def test_rejected_command_recorded_from_prompt(self):
+        with mock.patch.object(iop, 'console') as console:
+            iop.eval_user_intent_and_execute(CONFIG, 'н', 'rm -rf build', 'bash', False, 'Удали сборку?')
+        console.print.assert_called_once()
+        (entry,) = history.search(CONFIG, 'build')
+        self.assertEqual((entry['action'], entry['shell'], entry['os']), ('reject', 'bash', iop.get_os_friendly_name()))
+
+    def test_show_history_json(self):
+        history.record(CONFIG, 'Свободное место?', 'df -h', 'Д', 0)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            iop.show_history(CONFIG, 'df', json_output=True)
+        self.assertEqual(json.loads(out.getvalue())['command'], 'df -h')
+
+    def test_history_json_stdout_is_parseable(self):
+        history.record(CONFIG, 'Свободное место?', 'df -h', 'Д', 0)
+        out = io.StringIO()
+        with mock.patch('sys.argv', ['iop', '--history', 'df', '--json']), \
+                mock.patch.object(iop, 'read_config', return_value=dict(CONFIG)), \
+                redirect_stdout(out):
+            with self.assertRaises(SystemExit) as exit_info:
+                iop.main()
+        self.assertEqual(exit_info.exception.code, 0)
+        self.assertEqual([json.loads(line)['command'] for line in out.getvalue().splitlines()], ['df -h'])
+
+    def test_export_feeds_offline_index(self):
+        os_name = 'Linux/Ubuntu 22.04 LTS'
+        history.record(CONFIG, 'Сожми логи приложения?', 'gzip -9 /var/log/app/*.log', 'Д', 0, shell='bash')
+        history.record(CONFIG, 'Сожми логи приложения?', 'gzip -9 /var/log/app/*.log', 'Д', 0, shell='bash')
+        history.record(CONFIG, 'Удали логи приложения?', 'rm /var/log/app/*.log', 'Д', 1, shell='bash')
+        self.assertEqual(history.export(CONFIG, 'bash', os_name), 1)
+        self.assertEqual(offline_index.lookup(CONFIG, 'bash', os_name, 'сожми логи приложения?')[0], 'gzip -9 /var/log/app/*.log')
+        self.assertIsNone(offline_index.lookup(CONFIG, 'bash', os_name, 'удали логи приложения?'))
+
+    def test_export_filters_shell_and_os_before_grouping(self):
+        ubuntu, fedora = 'Linux/Ubuntu 22.04 LTS', 'Linux/Fedora Linux 39'
+        history.record(CONFIG, 'Обнови пакеты?', 'sudo apt upgrade -y', 'Д', 0, shell='bash', os_name=ubuntu)
+        history.record(CONFIG, 'Обнови пакеты?', 'sudo dnf upgrade -y', 'Д', 0, shell='bash', os_name=fedora)
+        history.record(CONFIG, 'Обнови пакеты?', 'winget upgrade --all', 'Д', 0, shell='powershell', os_name='Windows')
+        self.assertEqual(history.export(CONFIG, 'bash', ubuntu), 1)
+        self.assertEqual(offline_index.lookup(CONFIG, 'bash', ubuntu, 'обнови пакеты?')[0], 'sudo apt upgrade -y')
+
+    def test_old_database_gets_os_column(self):
+        import sqlite3
+        conn = sqlite3.connect(history.history_path())
+        conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY, ts REAL NOT NULL, query TEXT NOT NULL, "
+                     "command TEXT NOT NULL, model TEXT, source TEXT, latency REAL, tokens INTEGER, action TEXT, "
+                     "exit_code INTEGER, shell TEXT)")
+        conn.execute("INSERT INTO history (ts, query, command, source, action, exit_code, shell) "
+                     "VALUES (0, 'Свободное место?', 'df -h', 'model', 'accept', 0, 'bash')")
+        conn.commit()
+        conn.close()
+        history.record(CONFIG, 'ls?', 'ls', 'Д', 0, shell='bash', os_name='Darwin/macOS')
+        self.assertEqual(history.search(CONFIG, 'ls')[0]['os'], 'Darwin/macOS')
+        self.assertEqual(history.export(CONFIG, 'bash', 'Linux/Ubuntu 22.04 LTS'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
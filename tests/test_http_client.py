@@ -0,0 +1,47 @@
+import unittest
+from unittest import mock
+
+import http_client
+from tests.stub_server import StubServer, completion_payload
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+
+    def test_connection_reused_between_requests(self):
+        with StubServer() as server:
+            config = {"api_base": server.url}
+            http_client.get(config, "/auth/key")
+            http_client.post(config, "/chat/completions", json={"messages": [{"role": "user", "content": "ls"}]})
+        self.assertEqual(len({r["port"] for r in server.requests}), 1)
+
+    def test_retries_on_429_honoring_retry_after(self):
+        with StubServer() as server:
+            server.responses.append((429, {"Retry-After": "0.01"}, {"error": {"message": "rate limited"}}))
+            server.responses.append((503, {}, {"error": {"message": "unavailable"}}))
+            config = {"api_base": server.url, "retry_backoff": 0.01}
+            with mock.patch.object(http_client.time, "sleep") as sleep:
+                response = http_client.post(config, "/chat/completions", json={"messages": [{"role": "user", "content": "ls"}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), completion_payload("echo ls"))
+        self.assertEqual(sleep.call_args_list[0], mock.call(0.01))
+        self.assertEqual(len(server.requests), 3)
+
+    def test_gives_up_after_retries(self):
+        with StubServer() as server:
+            server.responses.extend([(500, {}, {})] * 3)
+            config = {"api_base": server.url, "retries": 1}
+            with mock.patch.object(http_client.time, "sleep"):
+                response = http_client.get(config, "/auth/key")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_parse_retry_after_http_date(self):
+        self.assertEqual(http_client.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(http_client.parse_retry_after("soon"))
+
+
+if __name__ == "__main__":
+    unittest.main()
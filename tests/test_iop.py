@@ -1,9 +1,13 @@
+import json
 import os
 import sys
+import tempfile
 import unittest
 from unittest import mock
 
+import http_client
 import iop
+import response_cache
 
 class TestEnsurePromptIsQuestion(unittest.TestCase):
     def test_appends_question_mark(self):
@@ -24,6 +28,74 @@ class TestCheckFunctions(unittest.TestCase):
         with self.assertRaises(SystemExit):
             iop.check_for_issue('извините, не могу помочь')
 
+class FakeStreamResponse:
+    def __init__(self, lines):
+        self.lines = lines
+        self.consumed = 0
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        for line in self.lines:
+            self.consumed += 1
+            yield line
+
+    def close(self):
+        self.closed = True
+
+def sse_lines(*deltas):
+    lines = [b': OPENROUTER PROCESSING', b'']
+    for delta in deltas:
+        chunk = {"choices": [{"delta": {"content": delta}}]}
+        lines.append(('data: ' + json.dumps(chunk, ensure_ascii=False)).encode('utf-8'))
+    lines.append(b'data: [DONE]')
+    return lines
+
+STREAM_CONFIG = {'api': 'openrouter', 'openrouter_api_key': 'k', 'your_app_name': 'IOP', 'model': 'm',
+                 'temperature': 0.7, 'max_tokens': 100}
+MESSAGES = [{'role': 'system', 'content': 'prompt'}, {'role': 'user', 'content': 'ls?'}]
+
+class TestStreamChatCompletion(unittest.TestCase):
+    def test_collects_tokens_and_metrics(self):
+        fake = FakeStreamResponse(sse_lines('ls', ' -la', ' .'))
+        with mock.patch.object(http_client, 'post', return_value=fake):
+            result = iop.stream_chat_completion(STREAM_CONFIG, MESSAGES)
+        self.assertEqual(result, 'ls -la .')
+        self.assertTrue(fake.closed)
+        self.assertIn('ttft', iop.last_request_metrics)
+        self.assertIn('total', iop.last_request_metrics)
+
+    def test_markdown_rejected_before_end_of_stream(self):
+        fake = FakeStreamResponse(sse_lines('```', 'bash\nls', '```', '\nls -la', ' .'))
+        with mock.patch.object(http_client, 'post', return_value=fake):
+            with self.assertRaises(SystemExit):
+                iop.stream_chat_completion(STREAM_CONFIG, MESSAGES)
+        self.assertLess(fake.consumed, len(fake.lines))
+        self.assertTrue(fake.closed)
+
+class TestChatCompletionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name})
+        self.env.start()
+        mock.patch.object(response_cache, '_cache', None).start()
+        self.addCleanup(mock.patch.stopall)
+        self.config = {'api': 'openrouter', 'openrouter_api_key': 'k', 'your_app_name': 'IOP', 'model': 'm',
+                       'temperature': 0.7, 'max_tokens': 100, 'stream': True}
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_cache_hit_skips_network(self):
+        with mock.patch.object(http_client, 'post', return_value=FakeStreamResponse(sse_lines('df -h'))) as post:
+            self.assertEqual(iop.chat_completion(self.config, 'Покажи диск?', 'bash'), 'df -h')
+            self.assertEqual(iop.chat_completion(self.config, 'покажи  диск?', 'bash'), 'df -h')
+        self.assertEqual(post.call_count, 1)
+        self.assertTrue(iop.last_request_metrics['cache_hit'])
+
 class TestParseArguments(unittest.TestCase):
     def test_version_flag(self):
         testargs = ['iop', '--version']
@@ -45,6 +117,13 @@ class TestReadConfig(unittest.TestCase):
         config = iop.read_config()
         self.assertEqual(config['openrouter_api_key'], 'testkey')
 
+    def test_update_env_file_creates_env(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with mock.patch.object(iop, '__file__', os.path.join(tmp, 'iop.py')):
+                iop.update_env_file('newkey')
+            with open(os.path.join(tmp, '.env')) as f:
+                self.assertEqual(f.read(), 'OPENROUTER_API_KEY=newkey')
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import iop
+
+ROOT_DIR = os.path.dirname(os.path.abspath(iop.__file__))
+
+
+@unittest.skipUnless(hasattr(os, 'fork') and hasattr(__import__('socket'), 'send_fds'), 'iopd requires fork and fd passing')
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env_path = os.path.join(ROOT_DIR, '.env')
+        with open(self.env_path, 'w') as f:
+            f.write('OPENROUTER_API_KEY=testkey')
+        self.env = dict(os.environ, IOPD_SOCKET=os.path.join(self.tmp.name, 'iopd.sock'),
+                        XDG_CACHE_HOME=self.tmp.name)
+        self.daemon = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, 'iopd.py')], env=self.env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while not os.path.exists(self.env['IOPD_SOCKET']) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.daemon.terminate()
+        self.daemon.wait()
+        os.remove(self.env_path)
+        self.tmp.cleanup()
+
+    def test_client_runs_through_daemon(self):
+        code = "import iopd; print('exit', iopd.run_via_daemon(['iop', '--version']))"
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, env=self.env,
+                                capture_output=True, text=True, timeout=20)
+        self.assertIn('IOP CLI version', result.stdout)
+        self.assertIn('exit 0', result.stdout)
+
+    def test_falls_back_without_daemon(self):
+        env = dict(self.env, IOPD_SOCKET=os.path.join(self.tmp.name, 'missing.sock'))
+        code = "import iopd; print('exit', iopd.run_via_daemon(['iop', '--version']))"
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, env=env,
+                                capture_output=True, text=True, timeout=20)
+        self.assertIn('exit None', result.stdout)
+
+
+class TestDaemonClient(unittest.TestCase):
+    def test_unwritable_cache_dir_falls_back(self):
+        env = {key: value for key, value in os.environ.items() if key not in ('XDG_RUNTIME_DIR', 'IOPD_SOCKET', 'IOP_NO_DAEMON')}
+        env['XDG_CACHE_HOME'] = '/proc/iop-ro'
+        result = subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'iop.py'), '--version'], cwd=ROOT_DIR, env=env,
+                                capture_output=True, text=True, timeout=20)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('IOP CLI version', result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
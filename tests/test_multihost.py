@@ -0,0 +1,102 @@
+import io
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from rich.console import Console
+
+import http_client
+import iop
+import multihost
+import offline_index
+import response_cache
+from tests.stub_server import StubServer
+
+FAKE_SSH = f'{sys.executable} {os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ssh.py")}'
+
+
+class TestParseHosts(unittest.TestCase):
+    def test_list_and_file(self):
+        self.assertEqual(multihost.parse_hosts('web1,web2 web1'), ['web1', 'web2'])
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as file:
+            file.write('# серверы\nweb1\n\ndb1:2222  # другой порт\n')
+        self.addCleanup(os.remove, file.name)
+        self.assertEqual(multihost.parse_hosts('@' + file.name), ['web1', 'db1:2222'])
+
+    def test_port_becomes_ssh_option(self):
+        config = {'ssh_command': 'ssh -o BatchMode=yes'}
+        self.assertEqual(multihost.ssh_argv(config, 'root@db1:2222', 'uptime'),
+                         ['ssh', '-o', 'BatchMode=yes', '-p', '2222', 'root@db1', 'uptime'])
+        self.assertEqual(multihost.ssh_argv(config, 'fe80::1', 'uptime')[-2], 'fe80::1')
+
+
+class TestRemoteTarget(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name}).start()
+        mock.patch.object(response_cache, '_cache', None).start()
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+
+    def test_prompt_and_cache_keys_use_remote_os(self):
+        lookup = mock.patch.object(offline_index, 'lookup', return_value=None).start()
+        with mock.patch.object(iop, 'get_os_friendly_name', return_value='Darwin/macOS'), StubServer() as server:
+            config = {'api': 'openrouter', 'openrouter_api_key': 'k', 'api_base': server.url, 'model': 'm',
+                      'temperature': 0.7, 'max_tokens': 100, 'semantic_cache': False,
+                      'hosts': ['web1'], 'hosts_os': 'Linux/Debian GNU/Linux 12'}
+            iop.chat_completion(config, 'Сколько свободной памяти?', 'bash')
+            iop.chat_completion(dict(config, hosts_os=None), 'Сколько свободной памяти?', 'bash')
+        self.assertEqual([call.args[2] for call in lookup.call_args_list], ['Linux/Debian GNU/Linux 12', multihost.DEFAULT_OS])
+        system_prompt = server.requests[0]['body']['messages'][0]['content']
+        self.assertIn('Linux/Debian GNU/Linux 12', system_prompt)
+        self.assertNotIn('macOS', system_prompt)
+
+
+@unittest.skipIf(os.name == 'nt', 'uses bash')
+class TestMultihostExecution(unittest.TestCase):
+    def run_hosts(self, hosts, command, **config):
+        lines = []
+        config = dict({'ssh_command': FAKE_SSH}, **config)
+        results = multihost.run_hosts(config, hosts, command, lambda host, stream, text: lines.append((host, stream, text)))
+        return dict(results), lines
+
+    def test_runs_on_every_host_with_prefixed_output(self):
+        results, lines = self.run_hosts(['web1', 'web2', 'down1'], 'echo "hello from $FAKE_HOST"; echo warn >&2')
+        self.assertEqual([results[host].returncode for host in ('web1', 'web2', 'down1')], [0, 0, 255])
+        self.assertIn(('web1', 'stdout', 'hello from web1'), lines)
+        self.assertIn(('web2', 'stderr', 'warn'), lines)
+        self.assertIn('Connection refused', ''.join(text for host, _, text in lines if host == 'down1'))
+
+    def test_per_host_timeout(self):
+        results, _ = self.run_hosts(['fast', 'slow'], 'case $FAKE_HOST in slow) exec sleep 5;; esac; echo ok',
+                                    multihost_timeout=0.5)
+        self.assertTrue(results['slow'].timed_out)
+        self.assertFalse(results['fast'].timed_out)
+        self.assertEqual(results['fast'].returncode, 0)
+        self.assertEqual(multihost.count_failed(results.items()), 1)
+
+    def test_concurrency_is_bounded(self):
+        hosts = [f'h{i}' for i in range(4)]
+        started = time.monotonic()
+        self.run_hosts(hosts, 'sleep 0.4', multihost_concurrency=2)
+        elapsed = time.monotonic() - started
+        self.assertGreaterEqual(elapsed, 0.8)  # две волны по два хоста
+
+    def test_summary_table(self):
+        output = io.StringIO()
+        console = Console(file=output, width=120)
+        results = multihost.execute('exit 3', console, {'ssh_command': FAKE_SSH, 'hosts': ['web1', 'down1']})
+        text = output.getvalue()
+        self.assertEqual(multihost.count_failed(results), 2)
+        self.assertIn('Результаты на хостах', text)
+        self.assertIn('ошибка ssh', text)
+        self.assertIn('успешно: 0, с ошибкой: 2', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
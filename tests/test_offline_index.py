@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import http_client
+import iop
+import offline_index
+import response_cache
+from tests.stub_server import StubServer
+
+TEMPLATES = {
+    'bash': {
+        'unix': [{'queries': ['покажи свободное место на дисках'], 'command': 'df -h'}],
+        'linux': [{'queries': ['сколько свободной памяти'], 'command': 'free -h'}],
+        'linux/fedora': [{'queries': ['обнови все пакеты'], 'command': 'sudo dnf upgrade -y'}],
+        'linux/ubuntu': [{'queries': ['обнови все пакеты'], 'command': 'sudo apt upgrade -y'}],
+        'darwin': [{'queries': ['сколько свободной памяти'], 'command': 'vm_stat'}],
+    },
+}
+UBUNTU = 'Linux/Ubuntu 22.04 LTS'
+
+
+class TestOfflineIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.source = os.path.join(self.tmp.name, 'offline_commands.json')
+        self.write_source(TEMPLATES)
+        source_patcher = mock.patch.object(offline_index, 'SOURCE_FILE', self.source)
+        source_patcher.start()
+        self.addCleanup(source_patcher.stop)
+
+    def write_source(self, templates):
+        with open(self.source, 'w', encoding='utf-8') as file:
+            json.dump(templates, file, ensure_ascii=False)
+
+    def test_word_forms_share_terms(self):
+        self.assertEqual(offline_index.terms('файлы'), offline_index.terms('файлов'))
+        self.assertEqual(offline_index.terms('listening ports'), offline_index.terms('listen port'))
+
+    def test_os_specific_templates_take_precedence(self):
+        self.assertEqual(offline_index.lookup({}, 'bash', UBUNTU, 'Обнови все пакеты?')[0], 'sudo apt upgrade -y')
+        self.assertEqual(offline_index.lookup({}, 'bash', 'Linux/Fedora Linux 39', 'обнови пакеты?')[0], 'sudo dnf upgrade -y')
+        self.assertEqual(offline_index.lookup({}, 'bash', 'Darwin/macOS', 'сколько свободной памяти?')[0], 'vm_stat')
+        self.assertEqual(offline_index.lookup({}, 'bash', 'Darwin/macOS', 'свободное место на диске?')[0], 'df -h')
+        self.assertIsNone(offline_index.lookup({}, 'powershell', 'Windows', 'сколько свободной памяти?'))
+
+    def test_weak_match_is_left_to_model(self):
+        self.assertIsNone(offline_index.lookup({}, 'bash', UBUNTU, 'сколько места занимает каталог с логами nginx?'))
+        offline_index.remember({}, 'bash', UBUNTU, 'Найди 10 самых больших файлов?', 'find . -type f | head -n 10')
+        self.assertIsNone(offline_index.lookup({}, 'bash', UBUNTU, 'найди 10 самых больших файлов в /home?'))
+        self.assertIsNone(offline_index.lookup({}, 'bash', UBUNTU, 'найди 20 самых больших файлов?'))
+        self.assertEqual(offline_index.lookup({}, 'bash', UBUNTU, 'найди 10 самых больших файлов')[0], 'find . -type f | head -n 10')
+        self.assertIsNone(offline_index.lookup({'offline_index': False}, 'bash', UBUNTU, 'обнови все пакеты?'))
+
+    def test_compiled_index_is_reused_until_source_changes(self):
+        offline_index.lookup({}, 'bash', UBUNTU, 'обнови все пакеты?')
+        with mock.patch.object(offline_index, 'build', wraps=offline_index.build) as build:
+            started = time.perf_counter()
+            found = offline_index.lookup({}, 'bash', UBUNTU, 'обнови все пакеты?')
+            elapsed = time.perf_counter() - started
+            self.assertEqual(build.call_count, 0)
+            self.assertEqual(found[0], 'sudo apt upgrade -y')
+            self.assertLess(elapsed, 0.05)  # цель — единицы миллисекунд; запас на медленные CI
+
+            templates = json.loads(json.dumps(TEMPLATES))
+            templates['bash']['linux/ubuntu'][0]['command'] = 'sudo apt full-upgrade -y'
+            self.write_source(templates)
+            os.utime(self.source, ns=(time.time_ns(), time.time_ns() + 10**9))
+            self.assertEqual(offline_index.lookup({}, 'bash', UBUNTU, 'обнови все пакеты?')[0], 'sudo apt full-upgrade -y')
+            self.assertEqual(build.call_count, 1)
+
+    def test_learned_command_outranks_template(self):
+        offline_index.remember({}, 'bash', UBUNTU, 'Покажи свободное место на дисках?', 'df -h -x tmpfs')
+        offline_index.remember({}, 'bash', UBUNTU, 'Покажи свободное место на дисках?', 'df -h -x tmpfs')
+        command, matched_query, confidence = offline_index.lookup({}, 'bash', UBUNTU, 'свободное место на дисках?')
+        self.assertEqual(command, 'df -h -x tmpfs')
+        self.assertEqual(matched_query, 'Покажи свободное место на дисках?')
+        self.assertEqual(confidence, 1.0)
+        _, learned_path = offline_index.index_paths('bash', UBUNTU)
+        self.assertEqual(len(offline_index.read_learned(learned_path)), 1)
+
+    def test_opposite_action_is_not_matched(self):
+        offline_index.remember({}, 'bash', UBUNTU, 'Удали все файлы включая скрытые?', 'find . -mindepth 1 -delete')
+        offline_index.remember({}, 'bash', UBUNTU, 'Запусти nginx?', 'sudo systemctl start nginx')
+        offline_index.remember({}, 'bash', UBUNTU, 'Какие процессы занимают больше всего памяти?', 'ps aux --sort=-%mem')
+        self.assertIsNone(offline_index.lookup({}, 'bash', UBUNTU, 'Покажи все файлы включая скрытые?'))
+        self.assertIsNone(offline_index.lookup({}, 'bash', UBUNTU, 'Останови nginx?'))
+        self.assertIsNone(offline_index.lookup({}, 'bash', UBUNTU, 'Убей процесс, который занимает больше всего памяти?'))
+        self.assertEqual(offline_index.lookup({}, 'bash', UBUNTU, 'удали все файлы, включая скрытые')[0], 'find . -mindepth 1 -delete')
+
+    def test_unwritable_cache_dir_skips_index(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/proc/iop-ro'}):
+            with self.assertLogs(level='WARNING'):
+                self.assertIsNone(offline_index.lookup({}, 'bash', UBUNTU, 'обнови все пакеты?'))
+
+    def test_actions(self):
+        self.assertEqual(offline_index.actions('kill the process using the most memory?'), {'kill'})
+        self.assertEqual(offline_index.actions('Удали файлы, включая скрытые'), {'delete'})
+        self.assertEqual(offline_index.actions('покажи установленные пакеты на удалённом сервере'), frozenset())
+
+
+class TestOfflineChatCompletion(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache_patcher = mock.patch.object(response_cache, '_cache', None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+
+    def test_confident_match_skips_network(self):
+        with StubServer() as server:
+            config = {'api': 'openrouter', 'openrouter_api_key': 'k', 'api_base': server.url, 'model': 'm',
+                      'temperature': 0.7, 'max_tokens': 100, 'semantic_cache': False}
+            result = iop.chat_completion(config, 'Покажи текущий каталог?', 'bash')
+            self.assertIn('offline_hit', iop.last_request_metrics)
+            iop.chat_completion(dict(config, offline_index=False), 'Покажи текущий каталог?', 'bash')
+        self.assertEqual(result, 'pwd')
+        self.assertEqual(len(server.requests), 1)
+
+    def test_offline_hit_always_asks(self):
+        config = {'safety': False, 'modify': True}
+        iop.last_request_metrics.clear()
+        iop.last_request_metrics['offline_hit'] = 0.9
+        self.addCleanup(iop.last_request_metrics.clear)
+        with mock.patch.object(iop, 'console') as console:
+            console.input.return_value = 'н'
+            self.assertEqual(iop.prompt_user_for_action(config, False, 'pwd'), 'н')
+        console.input.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
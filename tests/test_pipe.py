@@ -0,0 +1,129 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import http_client
+import iop
+import pipe
+import prompts
+from tests.stub_server import StubServer
+
+
+def config_for(server, **overrides):
+    config = {"api": "openrouter", "openrouter_api_key": "k", "api_base": server.url, "model": "m",
+              "temperature": 0.7, "max_tokens": 100, "retries": 0, "tokenizer": "estimate"}
+    config.update(overrides)
+    return config
+
+
+def log_lines(count):
+    return "".join(f"2024-05-01 12:00:{i % 60:02d} ERROR disk /dev/sda{i % 3} is full\n" for i in range(count)).encode("utf-8")
+
+
+class TestReadChunks(unittest.TestCase):
+    def test_keeps_tail_after_max_chunks(self):
+        stats = pipe.InputStats()
+        chunks = list(pipe.read_chunks(io.BytesIO(b"".join(b"line %d\n" % i for i in range(100))),
+                                       lambda line: 1, 10, 3, stats))
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].startswith("line 0\n"))
+        self.assertIn("пропущено строк: 70", chunks[-1])
+        self.assertTrue(chunks[-1].endswith("line 99\n"))
+        self.assertEqual((stats.lines, stats.skipped_lines, stats.chunks), (100, 70, 3))
+
+
+class TestStdinHasInput(unittest.TestCase):
+    def test_pipe_with_data(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd, "rb") as reader, os.fdopen(write_fd, "wb") as writer:
+            writer.write(b"log\n")
+            writer.flush()
+            self.assertTrue(pipe.stdin_has_input(reader))
+
+    def test_closed_or_silent_pipe(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd, "rb") as reader:
+            with os.fdopen(write_fd, "wb"):
+                self.assertFalse(pipe.stdin_has_input(reader, wait=0.05))  # пишущая сторона молчит
+            self.assertFalse(pipe.stdin_has_input(reader))  # закрыта без данных
+
+    def test_files(self):
+        with open(os.devnull, "rb") as devnull:
+            self.assertFalse(pipe.stdin_has_input(devnull))
+        with tempfile.TemporaryFile() as file:
+            self.assertFalse(pipe.stdin_has_input(file))
+            file.write(b"data")
+            file.seek(0)
+            self.assertTrue(pipe.stdin_has_input(file))
+
+    def test_devnull_goes_normal_path(self):
+        # iop "вопрос" </dev/null из cron или CI не должен завершаться ошибкой пустого stdin
+        with open(os.devnull, "rb") as devnull, \
+                mock.patch("sys.stdin", io.TextIOWrapper(devnull)), \
+                mock.patch.object(pipe, "run_pipe") as run_pipe, \
+                mock.patch.object(iop, "chat_completion", return_value="ls") as chat_completion, \
+                mock.patch.object(iop, "prompt_user_for_action", return_value="н"), \
+                mock.patch.object(iop, "eval_user_intent_and_execute"), \
+                mock.patch.object(iop, "remember_turn"), \
+                mock.patch.object(iop, "console"):
+            iop.run({"safety": True, "modify": True}, self.args(["list", "files"]))
+        run_pipe.assert_not_called()
+        chat_completion.assert_called_once()
+
+    def args(self, query):
+        with mock.patch("sys.argv", ["iop", *query]):
+            return iop.parse_arguments()
+
+
+class TestRunPipe(unittest.TestCase):
+    def setUp(self):
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+
+    def run_pipe(self, config, data, json_output=False, query="Какие ошибки?"):
+        out = io.StringIO()
+        with mock.patch("sys.stderr", new_callable=io.StringIO):
+            code = pipe.run_pipe(config, query, io.BytesIO(data), json_output=json_output, out=out)
+        return code, out.getvalue()
+
+    def test_small_input_answered_in_one_request(self):
+        with StubServer() as server:
+            code, output = self.run_pipe(config_for(server), log_lines(5))
+        self.assertEqual(code, pipe.EXIT_OK)
+        (request,) = server.requests
+        self.assertEqual(request["body"]["messages"][0]["content"], prompts.pipe_prompt("answer", iop.get_os_friendly_name()))
+        self.assertIn("/dev/sda2 is full", request["body"]["messages"][1]["content"])
+        self.assertTrue(output.startswith("echo Вопрос: Какие ошибки?"))
+
+    def test_large_input_map_reduced(self):
+        with StubServer() as server:
+            code, output = self.run_pipe(config_for(server, pipe_chunk_tokens=200, pipe_concurrency=3), log_lines(60), json_output=True)
+        result = json.loads(output)
+        self.assertEqual(code, pipe.EXIT_OK)
+        self.assertTrue(result["ok"])
+        self.assertGreater(result["chunks"], 1)
+        self.assertEqual(result["input_lines"], 60)
+        system_prompts = [r["body"]["messages"][0]["content"] for r in server.requests]
+        self.assertEqual(system_prompts.count(system_prompts[-1]), 1)  # последний запрос — свёртка
+        self.assertGreaterEqual(len(server.requests), result["chunks"] + 1)
+
+    def test_empty_input(self):
+        with StubServer() as server:
+            code, output = self.run_pipe(config_for(server), b"", json_output=True)
+        self.assertEqual(code, pipe.EXIT_NO_INPUT)
+        self.assertFalse(json.loads(output)["ok"])
+        self.assertEqual(server.requests, [])
+
+    def test_request_failure_exit_code(self):
+        with StubServer() as server:
+            server.responses.append((500, {}, {"error": {"message": "boom"}}))
+            code, output = self.run_pipe(config_for(server), log_lines(3))
+        self.assertEqual(code, pipe.EXIT_REQUEST_FAILED)
+        self.assertEqual(output, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
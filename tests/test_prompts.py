@@ -0,0 +1,50 @@
+import unittest
+
+import prompts
+
+
+class TestPrompts(unittest.TestCase):
+    def setUp(self):
+        with open(prompts.PROMPT_FILE, encoding='utf-8') as f:
+            self.template = f.read()
+
+    def test_render_without_budget_matches_template(self):
+        expected = self.template.replace('{shell}', 'bash').replace('{os}', 'Linux/Test')
+        self.assertEqual(prompts.render('bash', 'Linux/Test'), expected)
+        script = prompts.render('bash', 'Linux/Test', is_script=True)
+        self.assertTrue(script.startswith(expected))
+        self.assertIn('Для Linux/Test используйте', script)
+
+    def test_render_is_memoized(self):
+        self.assertIs(prompts.render('zsh', 'Darwin/macOS'), prompts.render('zsh', 'Darwin/macOS'))
+
+    def test_budget_drops_lowest_priority_sections_first(self):
+        full = prompts.render('bash', 'Linux/Test', tokenizer='estimate')
+        budget = prompts.estimate_tokens(full) - 10
+        trimmed = prompts.render('bash', 'Linux/Test', max_prompt_tokens=budget, tokenizer='estimate')
+        self.assertLessEqual(prompts.estimate_tokens(trimmed), budget)
+        self.assertNotIn('Рекомендации по интеграции', trimmed)
+        self.assertIn('Рекомендации по безопасности', trimmed)
+
+    def test_budget_never_drops_required_sections(self):
+        trimmed = prompts.render('bash', 'Linux/Test', max_prompt_tokens=1, tokenizer='estimate')
+        self.assertIn('Основные правила', trimmed)
+        self.assertTrue(trimmed.rstrip().endswith('Вопрос:'))
+        self.assertNotIn('Рекомендации по безопасности', trimmed)
+
+    def test_register_tokenizer(self):
+        prompts.register_tokenizer('chars', lambda: len)
+        trimmed = prompts.render('bash', 'Linux/Test', max_prompt_tokens=100, tokenizer='chars')
+        self.assertNotIn('Рекомендации по оптимизации', trimmed)
+
+    def test_system_message_cache_control(self):
+        marked = prompts.system_message('prompt', {'api': 'openrouter', 'model': 'anthropic/claude-3.5-sonnet'})
+        self.assertEqual(marked['content'][0]['cache_control'], {'type': 'ephemeral'})
+        plain = prompts.system_message('prompt', {'api': 'openrouter', 'model': 'openai/gpt-4o'})
+        self.assertEqual(plain, {'role': 'system', 'content': 'prompt'})
+        disabled = prompts.system_message('prompt', {'api': 'anthropic', 'model': 'claude', 'prompt_cache': False})
+        self.assertEqual(disabled['content'], 'prompt')
+
+
+if __name__ == '__main__':
+    unittest.main()
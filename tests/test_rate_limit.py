@@ -0,0 +1,122 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import http_client
+import rate_limit
+import timings
+from tests.stub_server import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestSharedRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'limiter.state')
+
+    def make(self, rate=20, burst=1, max_wait=5):
+        return rate_limit.SharedRateLimiter(self.path, rate, burst, max_wait)
+
+    def test_state_shared_between_instances(self):
+        first, second = self.make(rate=10, burst=2), self.make(rate=10, burst=2)
+        self.assertLess(first.acquire(), 0.01)
+        self.assertLess(second.acquire(), 0.01)
+        self.assertGreater(second.acquire(), 0.05)  # оба токена всплеска уже взяты
+
+    def test_state_shared_between_processes(self):
+        code = ('import sys, rate_limit; limiter = rate_limit.SharedRateLimiter(sys.argv[1], 20, 1, 5)\n'
+                'for _ in range(3): limiter.acquire()')
+        started = time.monotonic()
+        processes = [subprocess.Popen([sys.executable, '-c', code, self.path], cwd=ROOT) for _ in range(2)]
+        for process in processes:
+            self.assertEqual(process.wait(timeout=30), 0)
+        # шесть токенов при скорости 20/с и всплеске 1 — не быстрее 5/20 с
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+    def test_429_halves_rate_and_pauses_queue(self):
+        limiter = self.make(rate=20)
+        limiter.update(429, {'Retry-After': '0.3'})
+        with limiter.state() as state:
+            self.assertEqual(state['rate'], 10)
+            self.assertGreater(state['blocked_until'], state['now'] + 0.2)
+        self.assertGreaterEqual(limiter.acquire(), 0.25)
+        for _ in range(20):
+            limiter.update(200, {})
+        with limiter.state() as state:
+            self.assertEqual(state['rate'], 20)
+
+    def test_exhausted_quota_pauses_until_reset(self):
+        limiter = self.make()
+        reset_ms = int((time.time() + 0.3) * 1000)
+        limiter.update(200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(reset_ms)})
+        self.assertGreaterEqual(limiter.acquire(), 0.2)
+
+    def test_interactive_served_before_batch(self):
+        limiter = self.make(rate=5, burst=1)
+        limiter.acquire()
+        order = []
+
+        def take(priority):
+            limiter.acquire(priority)
+            order.append(priority)
+
+        batch = threading.Thread(target=take, args=(rate_limit.BATCH,))
+        interactive = threading.Thread(target=take, args=(rate_limit.INTERACTIVE,))
+        batch.start()
+        time.sleep(0.05)
+        interactive.start()
+        batch.join(10)
+        interactive.join(10)
+        self.assertEqual(order, [rate_limit.INTERACTIVE, rate_limit.BATCH])
+
+    def test_priority_context(self):
+        with rate_limit.priority(rate_limit.BATCH):
+            self.assertEqual(rate_limit.get_priority(), rate_limit.BATCH)
+        self.assertEqual(rate_limit.get_priority(), rate_limit.INTERACTIVE)
+
+
+class TestHttpClientRateLimit(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        timings.reset()
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+
+    def test_429_waits_in_shared_queue_and_reports_wait(self):
+        with StubServer() as server:
+            server.responses.append((429, {'Retry-After': '0.3'}, {'error': {'message': 'rate limited'}}))
+            config = {'api_base': server.url, 'rate_limit': 50, 'rate_limit_burst': 1}
+            started = time.monotonic()
+            response = http_client.post(config, '/chat/completions', json={'messages': [{'role': 'user', 'content': 'ls'}]})
+            elapsed = time.monotonic() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(elapsed, 0.25)
+        waits = [item for item in timings.summary() if item['name'] == 'queue_wait']
+        self.assertEqual(len(waits), 2)
+        self.assertGreaterEqual(waits[1]['duration_ms'], 250)
+        self.assertEqual(waits[1]['attributes'], {'priority': rate_limit.INTERACTIVE})
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(rate_limit.get_limiter({}))
+
+    def test_unwritable_cache_dir_runs_without_limiter(self):
+        with StubServer() as server, mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/proc/iop-ro'}):
+            config = {'api_base': server.url, 'rate_limit': 50}
+            with self.assertLogs(level='WARNING'):
+                response = http_client.post(config, '/chat/completions', json={'messages': [{'role': 'user', 'content': 'ls'}]})
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
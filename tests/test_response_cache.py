@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import response_cache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = response_cache.ResponseCache(os.path.join(self.tmp.name, 'responses.sqlite3'), ttl=60, max_entries=2)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_key_normalizes_query(self):
+        first = response_cache.make_cache_key('Покажи  диск?', 'm', 0.7, 'prompt')
+        second = response_cache.make_cache_key(' покажи диск? ', 'm', 0.7, 'prompt')
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, response_cache.make_cache_key('покажи диск?', 'm', 0.7, 'other prompt'))
+
+    def test_hit_and_miss_stats(self):
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.put('k', 'df -h')
+        self.assertEqual(self.cache.get('k'), 'df -h')
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'entries': 1})
+
+    def test_ttl_expiry(self):
+        self.cache.put('k', 'df -h')
+        with mock.patch.object(response_cache.time, 'time', return_value=10 ** 10):
+            self.assertIsNone(self.cache.get('k'))
+
+    def test_lru_eviction(self):
+        with mock.patch.object(response_cache.time, 'time', side_effect=[1, 2, 3, 4]):
+            self.cache.put('a', '1')
+            self.cache.put('b', '2')
+            self.cache.get('a')
+            self.cache.put('c', '3')
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.assertIsNone(self.cache.conn.execute("SELECT 1 FROM responses WHERE key = 'b'").fetchone())
+
+
+if __name__ == '__main__':
+    unittest.main()
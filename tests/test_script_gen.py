@@ -0,0 +1,105 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+from rich.console import Console
+
+import http_client
+import iop
+import script_gen
+
+CONFIG = {'api': 'openrouter', 'openrouter_api_key': 'k', 'your_app_name': 'IOP', 'model': 'm',
+          'temperature': 0.7, 'max_tokens': 100}
+
+PART_ONE = '#!/bin/bash\nset -euo pipefail\nfor f in *.log; do\n'
+PART_TWO = '  gzip "$f"\ndone\necho "Готово"\n'
+
+
+class FakeStream:
+    def __init__(self, deltas, finish_reason='stop', fail_after=None):
+        self.deltas = deltas
+        self.finish_reason = finish_reason
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        for index, delta in enumerate(self.deltas):
+            if index == self.fail_after:
+                raise requests.exceptions.ConnectionError('connection reset')
+            yield ('data: ' + json.dumps({'choices': [{'delta': {'content': delta}}]})).encode('utf-8')
+        yield ('data: ' + json.dumps({'choices': [{'delta': {}, 'finish_reason': self.finish_reason}]})).encode('utf-8')
+        yield b'data: [DONE]'
+
+    def close(self):
+        pass
+
+
+class TestScriptGeneration(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.partial = os.path.join(self.tmp.name, 'backup.sh.partial')
+
+    def test_continues_after_length_limit_without_repeating(self):
+        responses = [FakeStream([PART_ONE[:20], PART_ONE[20:]], finish_reason='length'),
+                     # продолжение повторяет последнюю строку оборванного ответа
+                     FakeStream(['for f in *.log; do\n', PART_TWO])]
+        with mock.patch.object(http_client, 'post', side_effect=responses) as post:
+            content, error = script_gen.generate(CONFIG, 'сжать логи', 'bash', self.partial)
+        self.assertEqual(content, PART_ONE + PART_TWO)
+        self.assertIsNone(error)
+        with open(self.partial, encoding='utf-8') as file:
+            self.assertEqual(file.read(), content)
+        continuation = post.call_args_list[1].kwargs['json']['messages']
+        self.assertEqual(continuation[-2], {'role': 'assistant', 'content': PART_ONE})
+        self.assertEqual(continuation[-1]['content'], script_gen.CONTINUE_PROMPT)
+
+    def test_resumes_partial_file_after_network_failure(self):
+        with mock.patch.object(http_client, 'post', return_value=FakeStream([PART_ONE, PART_TWO], fail_after=1)):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                script_gen.generate(CONFIG, 'сжать логи', 'bash', self.partial)
+        with open(self.partial, encoding='utf-8') as file:
+            self.assertEqual(file.read(), PART_ONE)
+
+        with mock.patch.object(http_client, 'post', return_value=FakeStream([PART_TWO])) as post:
+            content, error = script_gen.generate(CONFIG, 'сжать логи', 'bash', self.partial)
+        self.assertEqual(content, PART_ONE + PART_TWO)
+        self.assertIsNone(error)
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(post.call_args.kwargs['json']['messages'][-2]['content'], PART_ONE)
+
+    def test_create_script_asks_name_first_and_renames_partial(self):
+        console = iop.LazyConsole()
+        console._console = Console(file=io.StringIO())
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.addCleanup(os.chdir, cwd)
+        with mock.patch.object(console._console, 'input', side_effect=['backup']) as ask, \
+                mock.patch.object(http_client, 'post', return_value=FakeStream([PART_ONE + PART_TWO])):
+            path, run_command = script_gen.create_script(CONFIG, 'сжать логи', 'bash', console)
+        self.assertEqual(ask.call_count, 1)
+        self.assertEqual(run_command, 'bash backup.sh')
+        self.assertFalse(os.path.exists(path + '.partial'))
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(file.read(), PART_ONE + PART_TWO)
+
+    def test_empty_script_is_failure(self):
+        console = iop.LazyConsole()
+        console._console = Console(file=io.StringIO())
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.addCleanup(os.chdir, cwd)
+        with mock.patch.object(console._console, 'input', side_effect=['backup']), \
+                mock.patch.object(http_client, 'post', return_value=FakeStream(['\n'])):
+            self.assertEqual(script_gen.create_script(CONFIG, 'сжать логи', 'bash', console), (None, None))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import semantic_cache
+
+PARAPHRASES = [
+    ('list listening ports?', 'show listening ports?'),
+    ('show disk usage by directory?', 'disk usage by directory?'),
+    ('how much memory is free?', 'free memory?'),
+    ('show running docker containers?', 'list running docker containers please?'),
+    ('покажи процессы пользователя root?', 'процессы пользователя root?'),
+]
+# Похожие по тексту запросы с другим действием или аргументом
+OPPOSITES = [
+    ('list files in /tmp?', 'delete files in /tmp?'),
+    ('start nginx?', 'stop nginx?'),
+    ('enable firewall?', 'disable firewall?'),
+    ('kill 1234?', 'kill 4321?'),
+    ('покажи логи nginx?', 'удали логи nginx?'),
+]
+CONFIG = {'model': 'm', 'semantic_cache_threshold': 0.8}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        env = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_similar_query_hits_and_unrelated_misses(self):
+        semantic_cache.remember(CONFIG, 'bash', 'Linux', 'list listening ports?', 'ss -tlnp')
+        command, query, similarity = semantic_cache.lookup(CONFIG, 'bash', 'Linux', 'show listening ports?')
+        self.assertEqual((command, query), ('ss -tlnp', 'list listening ports?'))
+        self.assertGreaterEqual(similarity, 0.8)
+        self.assertIsNone(semantic_cache.lookup(CONFIG, 'bash', 'Linux', 'restart nginx?'))
+
+    def test_different_action_or_argument_misses(self):
+        for stored, query in OPPOSITES:
+            semantic_cache.remember(CONFIG, 'bash', 'Linux', stored, 'cmd ' + stored)
+            self.assertIsNone(semantic_cache.lookup(dict(CONFIG, semantic_cache_threshold=0), 'bash', 'Linux', query), query)
+
+    def test_expired_entry_misses_and_is_refreshed(self):
+        config = dict(CONFIG, semantic_cache_ttl=60)
+        semantic_cache.remember(config, 'bash', 'Linux', 'list listening ports?', 'ss -tlnp')
+        with mock.patch('time.time', return_value=time.time() + 120):
+            self.assertIsNone(semantic_cache.lookup(config, 'bash', 'Linux', 'show listening ports?'))
+            semantic_cache.remember(config, 'bash', 'Linux', 'list listening ports?', 'ss -tlnp')
+            self.assertEqual(semantic_cache.lookup(config, 'bash', 'Linux', 'show listening ports?')[0], 'ss -tlnp')
+
+    def test_scoped_by_shell_os_and_model(self):
+        semantic_cache.remember(CONFIG, 'bash', 'Linux', 'list listening ports?', 'ss -tlnp')
+        self.assertIsNone(semantic_cache.lookup(CONFIG, 'powershell', 'Windows', 'list listening ports?'))
+        self.assertIsNone(semantic_cache.lookup(dict(CONFIG, model='other'), 'bash', 'Linux', 'list listening ports?'))
+
+    def test_disabled_with_no_cache(self):
+        semantic_cache.remember(CONFIG, 'bash', 'Linux', 'list listening ports?', 'ss -tlnp')
+        self.assertIsNone(semantic_cache.lookup(dict(CONFIG, cache=False), 'bash', 'Linux', 'list listening ports?'))
+
+    def test_memory_budget_compacts_oldest_entries(self):
+        index = semantic_cache.SemanticIndex(os.path.join(self.tmp.name, 'idx'), max_mb=10 * semantic_cache.DIM * 4 / 1024 / 1024)
+        for i in range(25):
+            index.add(f'query number {i} about topic{i}', f'echo {i}')
+        self.assertLessEqual(index.rows(), 10)
+        self.assertEqual(index.entry(index.rows() - 1)['command'], 'echo 24')
+
+    def test_concurrent_writers_keep_index_consistent(self):
+        base_path = os.path.join(self.tmp.name, 'shared')
+        code = ('import sys, semantic_cache\n'
+                'index = semantic_cache.SemanticIndex(sys.argv[1], max_mb=8 * semantic_cache.DIM * 4 / 1024 / 1024)\n'
+                'for i in range(40): index.add(f"query {sys.argv[2]} number {i} topic{i}", f"echo {i}")')
+        processes = [subprocess.Popen([sys.executable, '-c', code, base_path, str(n)], cwd=ROOT) for n in range(4)]
+        for process in processes:
+            self.assertEqual(process.wait(timeout=60), 0)
+        index = semantic_cache.SemanticIndex(base_path)
+        with open(index.meta_path, 'rb') as meta:
+            self.assertEqual(len(meta.readlines()), index.rows())
+        self.assertEqual(os.path.getsize(index.idx_path), index.rows() * 8)
+        for row in range(index.rows()):
+            self.assertTrue(index.entry(row)['command'].startswith('echo '))
+
+    def test_recall_and_latency_benchmark(self):
+        index = semantic_cache.SemanticIndex(os.path.join(self.tmp.name, 'bench'), max_mb=64)
+        rng = np.random.default_rng(0)
+        noise = rng.standard_normal((20000, semantic_cache.DIM)).astype(np.float32)
+        noise /= np.linalg.norm(noise, axis=1, keepdims=True)
+        with open(index.vec_path, 'wb') as f:
+            f.write(noise.tobytes())
+        with open(index.idx_path, 'wb') as f:
+            f.write(np.zeros(len(noise), dtype=np.uint64).tobytes())
+        with open(index.meta_path, 'wb') as f:
+            f.write(b'{"query": "noise", "command": "true"}\n')
+        for stored, _ in PARAPHRASES:
+            index.add(stored, 'cmd ' + stored)
+
+        hits = 0
+        start = time.perf_counter()
+        for stored, paraphrase in PARAPHRASES:
+            similarity, row = index.search(paraphrase)
+            hits += similarity >= CONFIG['semantic_cache_threshold'] and index.entry(row)['query'] == stored
+        per_lookup_ms = (time.perf_counter() - start) * 1000 / len(PARAPHRASES)
+        self.assertEqual(hits, len(PARAPHRASES))
+        self.assertLess(per_lookup_ms, float(os.environ.get('IOP_SEMANTIC_LOOKUP_BUDGET_MS', 50)))
+
+
+if __name__ == '__main__':
+    unittest.main()
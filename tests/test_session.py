@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import http_client
+import iop
+import response_cache
+import session
+from tests.stub_server import StubServer
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'session.json')
+
+    def test_old_turns_folded_into_summary(self):
+        current = session.Session(self.path, max_turns=2)
+        for i in range(4):
+            current.add(f'запрос {i}?', f'cmd {i}')
+        reloaded = session.Session(self.path, max_turns=2)
+        self.assertEqual(reloaded.turns, [['запрос 2?', 'cmd 2'], ['запрос 3?', 'cmd 3']])
+        self.assertEqual(reloaded.summary, 'запрос 0? → cmd 0; запрос 1? → cmd 1')
+        messages = reloaded.messages()
+        self.assertEqual([m['role'] for m in messages], ['user', 'assistant', 'user', 'assistant'])
+        self.assertTrue(messages[0]['content'].startswith('Ранее в этой сессии: запрос 0? → cmd 0'))
+
+    def test_token_budget_keeps_latest_turn(self):
+        current = session.Session(self.path, max_tokens=5)
+        current.add('очень длинный запрос про файлы?', 'find . -type f -size +100M')
+        current.add('а теперь каталоги?', 'du -sh */')
+        self.assertEqual(current.turns, [['а теперь каталоги?', 'du -sh */']])
+
+    def test_expired_session_starts_empty(self):
+        session.Session(self.path).add('ls?', 'ls')
+        with open(self.path, encoding='utf-8') as file:
+            data = json.load(file)
+        data['updated'] -= 7200
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        self.assertIsNone(session.Session(self.path, ttl=3600).last())
+
+    def test_unwritable_cache_dir_disables_session(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/proc/iop-ro'}):
+            with self.assertLogs(level='WARNING'):
+                self.assertIsNone(session.get_session({}))
+                iop.remember_turn({}, 'ls?', 'ls')
+
+
+class TestRefineCompletion(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmp.name, 'IOP_SESSION': 'test'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache_patcher = mock.patch.object(response_cache, '_cache', None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+
+    def test_refinement_sends_previous_exchange(self):
+        with StubServer() as server:
+            config = {'api': 'openrouter', 'openrouter_api_key': 'k', 'api_base': server.url, 'model': 'm',
+                      'temperature': 0.7, 'max_tokens': 100, 'semantic_cache': False}
+            iop.remember_turn(config, 'Найди большие файлы?', 'find . -size +100M')
+            result = iop.refine_completion(config, 'только .log', 'bash')
+            iop.refine_completion(config, 'только .log', 'bash')
+        messages = server.requests[0]['body']['messages']
+        self.assertEqual(messages[1:], [
+            {'role': 'user', 'content': 'Найди большие файлы?'},
+            {'role': 'assistant', 'content': 'find . -size +100M'},
+            {'role': 'user', 'content': 'Измените предыдущую команду: только .log'},
+        ])
+        self.assertEqual(result, 'echo Измените предыдущую команду: только .log')
+        self.assertEqual(len(server.requests), 2)  # ответы с историей не берутся из кэша
+
+
+if __name__ == '__main__':
+    unittest.main()
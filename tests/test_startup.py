@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+import iop
+
+ROOT_DIR = os.path.dirname(os.path.abspath(iop.__file__))
+IOP_SCRIPT = os.path.join(ROOT_DIR, 'iop.py')
+
+# Бюджеты холодного старта можно переопределить для медленных CI-машин
+IMPORT_BUDGET_MS = float(os.environ.get('IOP_IMPORT_BUDGET_MS', 100))
+STARTUP_BUDGET_MS = float(os.environ.get('IOP_STARTUP_BUDGET_MS', 150))
+HEAVY_MODULES = ('requests', 'yaml', 'rich', 'dotenv', 'distro', 'sqlite3')
+
+
+def run_iop(*args, python_flags=()):
+    env = dict(os.environ, IOP_NO_DAEMON='1')
+    return subprocess.run([sys.executable, *python_flags, IOP_SCRIPT, *args], cwd=ROOT_DIR, env=env,
+                          capture_output=True, text=True, timeout=30)
+
+
+def parse_importtime(stderr):
+    # Строки вида "import time:   self [us] | cumulative | imported package"
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.setdefault(name.strip(), (int(cumulative), len(name) - len(name.lstrip())))
+    return imports
+
+
+def best_wall_time_ms(argv, runs=5):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, env=dict(os.environ, IOP_NO_DAEMON='1'), capture_output=True, timeout=30)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class TestStartupBudget(unittest.TestCase):
+    def test_version_skips_heavy_imports(self):
+        result = run_iop('--version', python_flags=('-X', 'importtime'))
+        self.assertIn(f'IOP CLI version {iop.VERSION}', result.stdout)
+        imports = parse_importtime(result.stderr)
+        loaded = {name.split('.')[0] for name in imports}
+        self.assertFalse(loaded & set(HEAVY_MODULES), sorted(loaded & set(HEAVY_MODULES)))
+        # Время импортов уровня верхнего уровня, без стандартной инициализации интерпретатора (site)
+        top_level = [cumulative for name, (cumulative, depth) in imports.items() if depth == 1 and name not in ('site', 'encodings')]
+        self.assertLess(sum(top_level) / 1000, IMPORT_BUDGET_MS)
+
+    def test_argument_error_skips_config(self):
+        result = run_iop('--no-such-flag', python_flags=('-X', 'importtime'))
+        self.assertEqual(result.returncode, 2)
+        loaded = {name.split('.')[0] for name in parse_importtime(result.stderr)}
+        self.assertFalse(loaded & set(HEAVY_MODULES))
+
+    def test_cold_start_within_budget(self):
+        baseline = best_wall_time_ms([sys.executable, '-c', 'pass'])
+        startup = best_wall_time_ms([sys.executable, IOP_SCRIPT, '--version'])
+        self.assertLess(startup - baseline, STARTUP_BUDGET_MS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import unittest
+
+import http_client
+import timings
+from tests.stub_server import StubServer
+
+
+class TestTimings(unittest.TestCase):
+    def setUp(self):
+        timings.reset()
+        http_client.reset_session()
+        self.addCleanup(http_client.reset_session)
+
+    def test_span_records_duration_and_attributes(self):
+        with timings.span("execute") as attributes:
+            attributes["returncode"] = 0
+        (item,) = timings.summary()
+        self.assertEqual(item["name"], "execute")
+        self.assertGreaterEqual(item["duration_ms"], 0)
+        self.assertEqual(item["attributes"], {"returncode": 0})
+
+    def test_http_request_records_connect_and_ttfb(self):
+        with StubServer() as server:
+            config = {"api_base": server.url}
+            http_client.get(config, "/auth/key")
+            http_client.get(config, "/auth/key")
+        names = [item["name"] for item in timings.summary()]
+        # Второй запрос идёт по уже открытому соединению
+        self.assertEqual(names.count("connect"), 1)
+        self.assertEqual(names.count("ttfb"), 2)
+
+    def test_metrics_file_appends_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.jsonl")
+            with timings.span("read_config"):
+                pass
+            timings.report(None, {"metrics_file": path, "model": "m"})
+            timings.report(None, {"metrics_file": path, "model": "m"})
+            with open(path, encoding="utf-8") as file:
+                entries = [json.loads(line) for line in file]
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]["model"], "m")
+        self.assertEqual(entries[0]["spans"][0]["name"], "read_config")
+
+    def test_otlp_export(self):
+        with timings.span("validation"):
+            pass
+        with StubServer() as server:
+            timings.report(None, {"otlp_endpoint": server.url.replace("/api/v1", "")})
+        (request,) = server.requests
+        self.assertEqual(request["path"], "/v1/traces")
+        spans = request["body"]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        root, child = spans
+        self.assertEqual(child["name"], "validation")
+        self.assertEqual(child["parentSpanId"], root["spanId"])
+        self.assertLessEqual(int(root["startTimeUnixNano"]), int(child["startTimeUnixNano"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+# Слой замеров времени: интервалы (spans) этапов одного вызова iop.
+# Вывод — таблица rich (--timings), строка JSONL в metrics_file и экспорт в коллектор
+# OpenTelemetry по OTLP/HTTP JSON (otlp_endpoint).
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_spans = []
+_origin = (time.perf_counter(), time.time_ns())
+
+
+def reset():
+    global _origin
+    with _lock:
+        _spans.clear()
+        _origin = (time.perf_counter(), time.time_ns())
+
+
+def record(name, start, end, **attributes):
+    # start/end — значения time.perf_counter()
+    with _lock:
+        _spans.append({"name": name, "start": start, "end": end, "attributes": attributes})
+
+
+@contextmanager
+def span(name, **attributes):
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        record(name, start, time.perf_counter(), **attributes)
+
+
+def spans():
+    with _lock:
+        return list(_spans)
+
+
+def summary():
+    origin = _origin[0]
+    return [
+        {
+            "name": item["name"],
+            "start_ms": round((item["start"] - origin) * 1000, 3),
+            "duration_ms": round((item["end"] - item["start"]) * 1000, 3),
+            **({"attributes": item["attributes"]} if item["attributes"] else {}),
+        }
+        for item in sorted(spans(), key=lambda item: item["start"])
+    ]
+
+
+def print_table(console):
+    from rich.table import Table
+
+    table = Table(title="Время выполнения")
+    table.add_column("Этап", style="cyan")
+    table.add_column("Начало, мс", justify="right")
+    table.add_column("Длительность, мс", justify="right", style="magenta")
+    for item in summary():
+        table.add_row(item["name"], f"{item['start_ms']:.1f}", f"{item['duration_ms']:.1f}")
+    console.print(table)
+
+
+def append_jsonl(path, **fields):
+    entry = {"timestamp": time.time(), "pid": os.getpid(), **fields, "spans": summary()}
+    with open(os.path.expanduser(path), "a", encoding="utf-8") as file:
+        file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def otlp_payload(service_name="iop", **resource):
+    # Все интервалы — дочерние к корневому интервалу "iop", охватывающему весь вызов
+    perf_origin, wall_origin = _origin
+    trace_id = os.urandom(16).hex()
+    root_id = os.urandom(8).hex()
+
+    def unix_nano(value):
+        return str(wall_origin + int((value - perf_origin) * 1e9))
+
+    def attributes(values):
+        return [{"key": key, "value": {"stringValue": str(value)}} for key, value in values.items()]
+
+    items = spans()
+    end = max([item["end"] for item in items] + [time.perf_counter()])
+    otlp_spans = [{
+        "traceId": trace_id, "spanId": root_id, "name": "iop", "kind": 1,
+        "startTimeUnixNano": unix_nano(perf_origin), "endTimeUnixNano": unix_nano(end), "attributes": [],
+    }]
+    for item in items:
+        otlp_spans.append({
+            "traceId": trace_id, "spanId": os.urandom(8).hex(), "parentSpanId": root_id, "name": item["name"], "kind": 1,
+            "startTimeUnixNano": unix_nano(item["start"]), "endTimeUnixNano": unix_nano(item["end"]),
+            "attributes": attributes(item["attributes"]),
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": attributes({"service.name": service_name, **resource})},
+        "scopeSpans": [{"scope": {"name": "iop"}, "spans": otlp_spans}],
+    }]}
+
+
+def export_otlp(endpoint, timeout=2, **resource):
+    import requests
+
+    url = endpoint.rstrip("/")
+    if not url.endswith("/v1/traces"):
+        url += "/v1/traces"
+    requests.post(url, json=otlp_payload(**resource), timeout=timeout).raise_for_status()
+
+
+def report(console, config, show_table=False):
+    # Вызывается в конце main; сбои экспорта метрик не должны влиять на результат команды
+    if show_table:
+        print_table(console)
+    fields = {"model": config.get("model"), "api": config.get("api")}
+    if config.get("metrics_file"):
+        try:
+            append_jsonl(config["metrics_file"], **fields)
+        except OSError as e:
+            logging.debug("Не удалось записать метрики: %s", e)
+    if config.get("otlp_endpoint"):
+        try:
+            export_otlp(config["otlp_endpoint"], **{k: v for k, v in fields.items() if v})
+        except Exception as e:
+            logging.debug("Не удалось экспортировать метрики в OTLP: %s", e)